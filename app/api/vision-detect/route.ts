@@ -30,9 +30,11 @@ export async function POST(request: NextRequest) {
 
     if (!response.ok) {
       const error = await response.json();
+      // Overloaded (429/503): pass the back-off hint on to the client
+      const retryAfter = response.headers.get('Retry-After');
       return NextResponse.json(
-        { error: error.message || 'Detection failed' },
-        { status: response.status }
+        { error: error.message || error.error || 'Detection failed' },
+        { status: response.status, headers: retryAfter ? { 'Retry-After': retryAfter } : undefined }
       );
     }
 
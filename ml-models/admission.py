@@ -0,0 +1,135 @@
+"""
+AIMS Admission Control
+Bounds how many requests run inference at once and how many may wait for
+a slot; everything beyond that is rejected right away (with a Retry-After
+hint) instead of piling up on server threads
+"""
+
+import math
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Dict, Optional
+
+from inference_scheduler import DeadlineExceeded
+
+
+class Overloaded(Exception):
+    """Request rejected because the server is saturated"""
+
+    def __init__(self, message: str, status: int, retry_after: int, reason: str):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent=4, max_queue=16, queue_timeout_ms=5000, name='inference'):
+        """
+        Initialize the controller
+
+        Args:
+            max_concurrent: Requests allowed to run inference at the same time
+            max_queue: Requests allowed to wait for a slot; more get 429
+            queue_timeout_ms: Max time a request waits for a slot before it
+                gets 503
+            name: Name used in stats
+        """
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_queue = max(0, int(max_queue))
+        self.queue_timeout = max(0.0, queue_timeout_ms / 1000.0)
+        self.name = name
+
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+
+        # Moving average of the time a slot is held (for Retry-After)
+        self._service_seconds = 1.0
+
+        # Stats
+        self._admitted = 0
+        self._rejected = Counter()
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free (whole seconds, at least 1)"""
+        backlog = (self._waiting + 1) / self.max_concurrent
+        return max(1, math.ceil(backlog * self._service_seconds))
+
+    def acquire(self, deadline: Optional[float] = None) -> float:
+        """
+        Wait for an inference slot
+
+        Args:
+            deadline: time.monotonic() after which the caller doesn't want
+                the result anymore (None = no deadline)
+
+        Returns:
+            Token to pass to release()
+
+        Raises:
+            Overloaded: 429 if the wait queue is full, 503 if no slot freed up
+                within queue_timeout
+            DeadlineExceeded: If the deadline passed while waiting
+        """
+        with self._cond:
+            if self._active >= self.max_concurrent and self._waiting >= self.max_queue:
+                self._rejected['queue_full'] += 1
+                raise Overloaded('Server busy: inference queue is full', 429, self.retry_after(), 'queue_full')
+
+            wait_until = time.monotonic() + self.queue_timeout
+            if deadline is not None:
+                wait_until = min(wait_until, deadline)
+
+            self._waiting += 1
+            try:
+                while self._active >= self.max_concurrent:
+                    remaining = wait_until - time.monotonic()
+                    if remaining <= 0:
+                        if deadline is not None and time.monotonic() >= deadline:
+                            self._rejected['deadline'] += 1
+                            raise DeadlineExceeded('Request deadline passed while waiting for an inference slot')
+                        self._rejected['queue_timeout'] += 1
+                        raise Overloaded('Server busy: timed out waiting for an inference slot',
+                                         503, self.retry_after(), 'queue_timeout')
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+            self._active += 1
+            self._admitted += 1
+            return time.monotonic()
+
+    def release(self, token: float):
+        """Free the slot taken by acquire()"""
+        held = time.monotonic() - token
+        with self._cond:
+            self._active -= 1
+            self._service_seconds = 0.8 * self._service_seconds + 0.2 * held
+            self._cond.notify()
+
+    def release_when_done(self, token: float, future: Future):
+        """Free the slot once work that outlived its request (e.g. a running batch) finishes"""
+        future.add_done_callback(lambda _: self.release(token))
+
+    def stats(self) -> Dict:
+        """
+        Get admission counters
+
+        Returns:
+            Dict with limits, current load and rejections by reason
+        """
+        with self._cond:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'queue_timeout_ms': self.queue_timeout * 1000,
+                'active': self._active,
+                'waiting': self._waiting,
+                'admitted': self._admitted,
+                'rejected': dict(self._rejected),
+                'avg_service_ms': round(self._service_seconds * 1000, 1),
+                'retry_after_seconds': self.retry_after()
+            }
@@ -0,0 +1,117 @@
+"""
+AIMS Barcode Decoder
+Native barcode (EAN/UPC, with OpenCV >= 4.8 or opencv-contrib) and QR code
+decoding, per detected box or once per image, so decoded boxes need no OCR
+"""
+
+import threading
+from typing import Dict, List, Union
+
+import cv2
+import numpy as np
+
+from image_io import NormalizedImage, load_image
+
+# Detector window sizes (fractions of the image side) for full resolution
+# passes: codes there are a few hundredths of the image wide, while OpenCV's
+# defaults expect them to fill a good part of a 512px downsampled image
+FULL_RES_SCALES = [0.003, 0.006, 0.012, 0.025, 0.05]
+
+
+class BarcodeDecoder:
+    def __init__(self, scope='crop'):
+        """
+        Initialize OpenCV's barcode and QR code detectors
+
+        Args:
+            scope: 'crop' (decode each box) or 'image' (decode the whole
+                image once, codes go to the box containing them)
+        """
+        self.scope = scope
+        self._barcode_detector = None
+        self._full_res_detector = None
+        if hasattr(cv2, 'barcode'):
+            self._barcode_detector = cv2.barcode.BarcodeDetector()
+            if scope == 'image' and hasattr(self._barcode_detector, 'setDetectorScales'):
+                self._full_res_detector = cv2.barcode.BarcodeDetector()
+                self._full_res_detector.setDetectorScales(FULL_RES_SCALES)
+        else:
+            print("⚠️  OpenCV has no barcode module - decoding QR codes only")
+        self._qr_detector = cv2.QRCodeDetector()
+        self._lock = threading.Lock()  # The detectors aren't thread-safe
+
+    def decode(self, image: np.ndarray, full_res: bool = False) -> List[Dict]:
+        """
+        Decode the barcodes and QR codes in an image
+
+        Args:
+            image: BGR image
+            full_res: Look for small codes in a large image, without
+                downsampling it (slower)
+
+        Returns:
+            List of {'type', 'data', 'center'} (center in image coordinates)
+        """
+        codes = []
+        with self._lock:
+            detector = self._barcode_detector
+            if full_res and self._full_res_detector is not None:
+                detector = self._full_res_detector
+                detector.setDownsamplingThreshold(max(image.shape[:2]))
+            if detector is not None:
+                decode = getattr(detector, 'detectAndDecodeWithType', None) \
+                    or detector.detectAndDecode  # opencv-contrib < 4.8
+                ok, infos, types, points = decode(image)
+                if ok and infos is not None:
+                    codes += [(data, code_type, corners) for data, code_type, corners in zip(infos, types, points)]
+            ok, infos, points, _ = self._qr_detector.detectAndDecodeMulti(image)
+            if ok and infos is not None:
+                codes += [(data, 'QR', corners) for data, corners in zip(infos, points)]
+
+        return [{'type': code_type, 'data': data, 'center': np.asarray(corners).reshape(-1, 2).mean(axis=0).tolist()}
+                for data, code_type, corners in codes if data]
+
+    def find_codes(self, image: Union[np.ndarray, NormalizedImage], boxes: List[Dict],
+                   crops: List[np.ndarray], candidates: List[int]) -> Dict[int, Dict]:
+        """
+        Decode the codes of some boxes of one image
+
+        Args:
+            image: Image the boxes belong to
+            boxes: Boxes from detect_boxes() (in the coordinates of the image YOLO saw)
+            crops: Their crops
+            candidates: Indices of the boxes to decode
+
+        Returns:
+            Index -> decoded code ({'type', 'data'}) of the boxes that had one
+        """
+        found = {}
+        if self.scope == 'image':
+            # Small codes only survive at high resolution (the bars of a product
+            # barcode blur away in the downscaled working copy); large ones are
+            # cheaper to find in the working copy. Each code goes to the box containing its center
+            working = load_image(image)
+            codes = self.decode(working)
+            if isinstance(image, NormalizedImage) and image.scale != 1.0:
+                source = image.source()
+                ratio = working.shape[1] / source.shape[1]  # Working copy pixels per source pixel
+                for code in self.decode(source, full_res=True):
+                    code['center'] = [v * ratio for v in code['center']]
+                    codes.append(code)
+            elif self._full_res_detector is not None:
+                codes += self.decode(working, full_res=True)
+
+            for code in codes:
+                center_x, center_y = code.pop('center')
+                for idx in candidates:
+                    x1, y1, x2, y2 = boxes[idx]['bbox']
+                    if idx not in found and x1 <= center_x <= x2 and y1 <= center_y <= y2:
+                        found[idx] = code
+                        break
+        else:
+            for idx in candidates:
+                codes = self.decode(crops[idx]) if crops[idx].size else []
+                if codes:
+                    codes[0].pop('center')
+                    found[idx] = codes[0]
+        return found
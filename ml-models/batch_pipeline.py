@@ -0,0 +1,159 @@
+"""
+AIMS Batch Pipeline
+Staged, parallel processing of multi-image scans:
+decode (thread pool) -> YOLO (batched across images) -> OCR + matching (worker pool),
+with results yielded as soon as each image finishes
+"""
+
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+
+class BatchPipeline:
+    def __init__(self, decode_workers=4, ocr_workers=2, yolo_batch_size=8):
+        """
+        Initialize the pipeline (pools are shared by all batch requests)
+
+        Args:
+            decode_workers: Threads reading and decoding uploads
+            ocr_workers: Threads running OCR, matching and post-processing
+            yolo_batch_size: Max images per batched YOLO call
+        """
+        self.yolo_batch_size = max(1, yolo_batch_size)
+        self._decode_pool = ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix='batch-decode')
+        self._ocr_pool = ThreadPoolExecutor(max_workers=ocr_workers, thread_name_prefix='batch-ocr')
+
+    def run(self, detector, items: List[Any],
+            prepare: Callable[[Any], Tuple[Optional[np.ndarray], Optional[List[Dict]]]],
+            finish: Callable[[Any, Optional[np.ndarray], List[Dict]], Dict],
+            on_error: Callable[[Any, Exception], Dict],
+            cancel: Optional[threading.Event] = None,
+            done: Optional[Future] = None) -> Iterator[Dict]:
+        """
+        Process items and yield one result per item, in completion order
+
+        Args:
+            detector: ProductDetector (detect_boxes / read_products)
+            items: Inputs (e.g. uploaded files)
+            prepare: Decode an item -> (image, cached detections or None);
+                runs on the decode pool
+            finish: Build the result for an item from its detections
+                (matching, caching...); runs on the OCR pool
+            on_error: Build the error result for an item
+            cancel: Once set (e.g. the client went away), items not yet
+                decoded or read are skipped instead of processed
+            done: Resolved once every item was processed or skipped, i.e. no
+                pool work for this run is left; cancelled if the run never started
+
+        Yields:
+            Result dicts as each item finishes
+        """
+        if done is not None and not done.set_running_or_notify_cancel():
+            return
+        cancel = cancel or threading.Event()
+        results = queue.Queue()
+        remaining = [len(items)]
+        remaining_lock = threading.Lock()
+
+        def settle():
+            # One item finished or was skipped
+            with remaining_lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last and done is not None:
+                done.set_result(None)
+
+        def emit(result):
+            results.put(result)
+            settle()
+
+        def emit_error(item, error):
+            emit(on_error(item, error))
+
+        def ocr_and_finish(item, image, boxes):
+            if cancel.is_set():
+                settle()
+                return
+            try:
+                detections = detector.read_products(image, boxes)
+                emit(finish(item, image, detections))
+            except Exception as e:
+                emit_error(item, e)
+
+        def finish_cached(item, image, detections):
+            if cancel.is_set():
+                settle()
+                return
+            try:
+                emit(finish(item, image, detections))
+            except Exception as e:
+                emit_error(item, e)
+
+        def run_yolo(batch):
+            if cancel.is_set():
+                for _ in batch:
+                    settle()
+                return
+            images = [image for _, image in batch]
+            try:
+                boxes_per_image = detector.detect_boxes(images)
+            except Exception as e:
+                if len(batch) == 1:
+                    emit_error(batch[0][0], e)
+                    return
+                # Isolate the failing image instead of failing the whole batch
+                for entry in batch:
+                    run_yolo([entry])
+                return
+            for (item, image), boxes in zip(batch, boxes_per_image):
+                self._ocr_pool.submit(ocr_and_finish, item, image, boxes)
+
+        def feed():
+            # Decode in parallel; batch decoded images into YOLO calls as they arrive
+            decoded = queue.Queue()
+
+            def decode(item):
+                if cancel.is_set():
+                    decoded.put((item, None, None))
+                    return
+                try:
+                    decoded.put((item, prepare(item), None))
+                except Exception as e:
+                    decoded.put((item, None, e))
+
+            for item in items:
+                self._decode_pool.submit(decode, item)
+
+            pending = []
+            for _ in range(len(items)):
+                item, prepared, error = decoded.get()
+                if cancel.is_set():
+                    settle()
+                    continue
+                if error is not None:
+                    emit_error(item, error)
+                    continue
+                image, cached = prepared
+                if cached is not None:
+                    self._ocr_pool.submit(finish_cached, item, image, cached)
+                    continue
+                pending.append((item, image))
+                # Run YOLO when the batch is full or nothing else is decoded yet
+                if len(pending) >= self.yolo_batch_size or decoded.empty():
+                    run_yolo(pending)
+                    pending = []
+            if pending:
+                run_yolo(pending)
+
+        if not items:
+            if done is not None:
+                done.set_result(None)
+            return
+        threading.Thread(target=feed, name='batch-feed', daemon=True).start()
+
+        for _ in range(len(items)):
+            yield results.get()
@@ -3,52 +3,745 @@ Flask API for AIMS Product Detection
 Provides endpoints for image upload and product detection
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Request, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 import os
-import uuid
 from datetime import datetime
+import hashlib
+import hmac
 import json
+import math
+import mimetypes
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from inference_scheduler import InferenceScheduler, DeadlineExceeded
+from admission import AdmissionController, Overloaded
+from image_io import (decode_image, encode_image, read_limited, save_limited, FileTooLarge,
+                      NormalizedImage, DecodedImageCache)
+from upload_store import UploadStore
+from result_cache import ResultCache, weights_identity
+from inventory_index import InventoryStore, VersionConflict
+from batch_pipeline import BatchPipeline
+from job_queue import JobQueue
+from video_scanner import VideoScanner, iter_encoded_frames, iter_video_frames
+from model_status import ModelStatus
+from model_registry import ModelRegistry
+from model_loader import ModeLoader, build_model as build_model_version
+from metrics import (REGISTRY, REQUESTS, REQUEST_LATENCY, IN_FLIGHT, QUEUE_DEPTH, ADMISSION_REJECTED,
+                     time_stage)
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for Next.js frontend
+# Enable CORS for Next.js frontend (not for the model admin endpoints: browsers never call them)
+CORS(app, resources={r'^(?!/api/models/).*': {}})
 
 # Configuration
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp', 'bmp'}
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB per image (413 beyond it; the route's body cap applies first)
+MAX_VIDEO_SIZE = 500 * 1024 * 1024  # 500MB per video
+MAX_REQUEST_SIZE = 1024 * 1024 * 1024  # Whole request body (multi-image batches and jobs)
+MAX_FORM_SIZE = 16 * 1024 * 1024  # Form fields and JSON bodies (inline inventories, inventory uploads)
 
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Request body cap per route: checked against Content-Length before the body is
+# read, and enforced while reading bodies without one (other routes get MAX_FORM_SIZE)
+ROUTE_MAX_REQUEST_SIZE = {
+    '/api/detect': MAX_FILE_SIZE + MAX_FORM_SIZE,
+    '/api/detect-batch': MAX_REQUEST_SIZE,
+    '/api/detect-video': MAX_VIDEO_SIZE + MAX_FORM_SIZE,
+    '/api/jobs': MAX_REQUEST_SIZE,
+}
+SAVE_UPLOADS = True  # Persist original uploads to UPLOAD_FOLDER (in the background)
 
-# Choose mode: 'classification' (your trained model) or 'detection' (YOLOv8+OCR)
+# Upload storage budget (content-addressed, enforced by a background evictor)
+UPLOAD_MAX_MB = 2048
+UPLOAD_MAX_AGE_HOURS = 72
+UPLOAD_EVICT_INTERVAL_SECONDS = 300
+
+# Input normalization: images are decoded at (about) the model input resolution
+# (JPEGs directly at 1/2, 1/4 or 1/8 scale); OCR crops are cut from the high
+# resolution original instead, decoded at most at this size (None = full)
+OCR_MAX_SIDE = 4096
+
+# Annotated images are rendered on first request of their URL, from the stored
+# detections and the cached decoded image (falling back to the stored original)
+ANNOTATION_SPEC_TTL_SECONDS = 3600
+ANNOTATION_SPEC_DIR = 'cache/annotations'  # Specs shared by all worker processes (None = in memory only)
+ANNOTATION_MAX_SIDE = None  # Longer side of annotated images (None = the upload's full resolution)
+DECODED_IMAGE_CACHE_MB = 256
+
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_SIZE
+
+class RouteLimitedRequest(Request):
+    """Request whose body limit is its route's ROUTE_MAX_REQUEST_SIZE (werkzeug enforces it while reading)"""
+    @property
+    def max_content_length(self):
+        rule = self.url_rule.rule if self.url_rule else None
+        return ROUTE_MAX_REQUEST_SIZE.get(rule, MAX_FORM_SIZE)
+
+app.request_class = RouteLimitedRequest
+
+upload_store = UploadStore(UPLOAD_FOLDER, max_bytes=UPLOAD_MAX_MB * 1024 * 1024,
+                           max_age_seconds=UPLOAD_MAX_AGE_HOURS * 3600,
+                           evict_interval=UPLOAD_EVICT_INTERVAL_SECONDS)
+
+# Choose mode: 'classification' (your trained model), 'detection' (YOLOv8+OCR)
+# or 'hybrid' (YOLOv8 finds products, the trained classifier recognizes each crop)
 MODE = 'classification'  # Using your trained 81-class grocery classifier!
 
-# Global instances (lazy loading)
+CLASSIFIER_WEIGHTS = 'weights/grocery_classifier_best.pt'
+DETECTOR_WEIGHTS = 'yolov8n.pt'
+DETECTOR_CONFIDENCE = 0.25
+HYBRID_OCR_CONFIDENCE = 0.6  # Hybrid mode: OCR only crops classified below this confidence
+OCR_BATCH_SIZE = 16  # Max similar-sized crops per batched OCR call
+
+# OCR gating (detection and hybrid modes): detections failing these are
+# returned without text instead of being OCR'd
+OCR_MIN_BOX_AREA = 32 * 32       # Pixels, in the image YOLO saw
+OCR_MIN_CONFIDENCE = 0.3         # Detection confidence
+OCR_CLASSES = None               # Only OCR these detector classes (None = all)
+OCR_SKIP_CLASSES = {             # COCO classes that are never inventory
+    'person', 'bicycle', 'car', 'motorcycle', 'airplane', 'bus', 'train', 'truck', 'boat',
+    'traffic light', 'fire hydrant', 'stop sign', 'parking meter', 'bench',
+    'bird', 'cat', 'dog', 'horse', 'sheep', 'cow', 'elephant', 'bear', 'zebra', 'giraffe',
+    'chair', 'couch', 'bed', 'dining table', 'toilet'
+}
+OCR_MAX_CROPS_PER_IMAGE = 40     # Most confident first (None = no limit)
+DECODE_BARCODES = False          # Try OpenCV barcode/QR decoding first; decoded boxes skip OCR (opt-in)
+BARCODE_SCOPE = 'crop'           # 'crop' (each box) or 'image' (whole image once)
+
+# Sliced inference for high-resolution images (e.g. aisle panoramas): small
+# products that vanish when the whole image is downscaled to 640px are found
+# in overlapping tiles, merged with cross-tile NMS
+DETECTOR_TILE_SIZE = None        # Tile side in pixels, e.g. 640 (None = whole image only)
+DETECTOR_TILE_OVERLAP = 0.2      # Min overlap of neighbouring tiles
+DETECTOR_TILE_MIN_SIDE = 2048    # Only tile images whose longer side exceeds this
+DETECTOR_TILE_MAX_SIDE = 8192    # Uploads are decoded up to this size when tiling
+DETECTOR_TILE_IOU = 0.5          # Overlap above which boxes from different tiles are merged
+
+# CPU inference engine: 'pytorch', or 'onnx' / 'openvino' (exported next to the
+# .pt weights on first use; falls back to pytorch if unavailable)
+INFERENCE_ENGINE = 'pytorch'
+ENGINE_PARITY_IMAGES = None  # e.g. 'samples/' - exported models must match PyTorch's top-k there
+
+# Startup (or the first request, e.g. the first readiness probe, when served by
+# gunicorn / flask run): load and warm up the models MODE needs in the background;
+# /ready answers 503 until they are ready (load balancer readiness probe)
+PRELOAD_MODELS = True
+
+# Micro-batching: concurrent /api/detect requests are coalesced into one model call
+MAX_BATCH_SIZE = 8       # Max images per batched forward pass
+MAX_BATCH_WAIT_MS = 10   # Max time a request waits for the batch to fill
+
+# Admission control (/api/detect, /api/detect-batch, /api/detect-video, /api/jobs):
+# beyond these limits requests are rejected right away with Retry-After instead
+# of queueing on server threads. Limits are server-wide: serve.py gives each worker
+# process its share (keep MAX_CONCURRENT_INFERENCE >= workers x MAX_BATCH_SIZE)
+MAX_CONCURRENT_INFERENCE = 16     # Requests decoding/running inference at once (at least MAX_BATCH_SIZE)
+MAX_QUEUED_INFERENCE = 16         # Requests waiting for a slot (429 beyond)
+ADMISSION_QUEUE_TIMEOUT_MS = 5000  # Max wait for a slot (503 after)
+DEADLINE_HEADER = 'X-Request-Timeout-Ms'  # Optional client time budget; work is dropped once it passes
+
+# /api/detect-batch pipeline: parallel decode, batched YOLO, OCR worker pool
+BATCH_DECODE_WORKERS = 4
+BATCH_OCR_WORKERS = 2
+BATCH_YOLO_BATCH_SIZE = 8
+
+# /api/detect-video: shelf-walk videos or frame sequences; the detector only runs
+# on frames that changed, boxes are carried over (and tracked) in between
+VIDEO_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'webm'}
+VIDEO_DIFF_THRESHOLD = 8.0       # Mean gray level change (0-255, motion compensated) that triggers detection
+VIDEO_MAX_SHIFT_FRACTION = 0.2   # Re-detect once the camera moved this fraction of the frame
+VIDEO_MAX_SKIP_FRAMES = 30       # Re-detect at least every N frames
+VIDEO_TRACK_IOU = 0.3            # Min IoU to continue a product track
+VIDEO_BATCH_SIZE = 8             # Changed frames per batched detection call
+
+# Async scan jobs (nightly audits): submit many images, poll/subscribe for progress
+JOBS_DIR = 'jobs'
+JOB_WORKERS = 2              # Worker processes
+JOB_MAX_RETRIES = 3          # Attempts per image before it is marked failed
+JOB_WORKER_BATCH_SIZE = 8    # Images per batched model call in a worker
+JOB_EVENTS_INTERVAL = 1.0    # Seconds between SSE progress events
+
+# Result cache: identical images (scanner retries, dashboard re-uploads) skip inference
+RESULT_CACHE_MAX_ENTRIES = 1024
+RESULT_CACHE_MAX_MB = 64
+RESULT_CACHE_TTL_SECONDS = 3600
+RESULT_CACHE_DIR = 'cache/results'  # On-disk tier, shared by all worker processes (None = memory only)
+RESULT_CACHE_DISK_MAX_ENTRIES = 100000  # On-disk tier budget, enforced by a background sweeper
+RESULT_CACHE_DISK_MAX_MB = 1024
+
+# Metrics of serve.py's worker processes are merged through this directory, so
+# /metrics reports the whole server whichever worker answers it
+METRICS_MULTIPROCESS_DIR = 'cache/metrics'
+
+# Server-side inventory: synced once via /api/inventory, referenced by version
+INVENTORY_KEEP_VERSIONS = 4  # Older versions stay usable briefly after a sync
+INVENTORY_KEEP_INLINE = 8    # Indexes of legacy inline inventories, cached by content
+INVENTORY_DIR = 'cache/inventory'  # Versions published here, shared by all worker processes (None = in memory only)
+
+# Model registry: versions of the classifier/detector weights; the active version
+# is loaded in the background and swapped in without a restart (CLASSIFIER_WEIGHTS and
+# DETECTOR_WEIGHTS are registered as the first versions)
+MODEL_REGISTRY_PATH = 'weights/registry.json'
+MODEL_REGISTRY_POLL_SECONDS = 10  # How often servers look for a newly activated version
+# Registering/activating versions over HTTP needs this token (Authorization: Bearer <token>);
+# unset = only model_registry.py's CLI can. Registered weights must lie under MODEL_WEIGHTS_DIR
+# (loading weights unpickles them, so they must come from a trusted place)
+MODEL_ADMIN_TOKEN = os.environ.get('AIMS_MODEL_ADMIN_TOKEN')
+MODEL_WEIGHTS_DIR = 'weights'
+
+model_registry = ModelRegistry(MODEL_REGISTRY_PATH,
+                               defaults={'classifier': CLASSIFIER_WEIGHTS, 'detector': DETECTOR_WEIGHTS})
+
+# Global instances (lazy loading, or preloaded at startup)
 detector = None
 classifier = None
+hybrid = None
+
+model_status = {'classifier': ModelStatus('classifier'), 'detector': ModelStatus('detector')}
+_model_locks = {'classifier': threading.Lock(), 'detector': threading.Lock()}
+model_swaps = {'classifier': None, 'detector': None}  # Last hot swap per model
+_swap_threads = {}
+_registry_checked_at = 0.0
+
+def model_settings(name):
+    """Constructor arguments of a model besides its weights path (see model_loader.build_model)"""
+    if name == 'classifier':
+        return {'top_k': 5, 'engine': INFERENCE_ENGINE, 'parity_images': ENGINE_PARITY_IMAGES}
+    return {'confidence_threshold': DETECTOR_CONFIDENCE,
+            'engine': INFERENCE_ENGINE, 'parity_images': ENGINE_PARITY_IMAGES,
+            'ocr_batch_size': OCR_BATCH_SIZE,
+            'ocr_min_area': OCR_MIN_BOX_AREA,
+            'ocr_min_confidence': OCR_MIN_CONFIDENCE,
+            'ocr_classes': OCR_CLASSES,
+            'ocr_skip_classes': OCR_SKIP_CLASSES,
+            'ocr_max_crops': OCR_MAX_CROPS_PER_IMAGE,
+            'decode_barcodes': DECODE_BARCODES,
+            'barcode_scope': BARCODE_SCOPE,
+            'tile_size': DETECTOR_TILE_SIZE,
+            'tile_overlap': DETECTOR_TILE_OVERLAP,
+            'tile_min_side': DETECTOR_TILE_MIN_SIDE,
+            'tile_max_side': DETECTOR_TILE_MAX_SIDE,
+            'tile_iou': DETECTOR_TILE_IOU}
 
-def get_detector():
-    """Lazy load the detector (for detection mode)"""
+def build_model(name, entry):
+    """Instantiate one registered model version (no warmup)"""
+    return build_model_version(name, entry, model_settings(name))
+
+def get_detector(mark_ready=True):
+    """
+    Lazy load the detector (for detection mode)
+    
+    Args:
+        mark_ready: Report it ready as soon as it is loaded (preloading
+            reports it ready after warmup instead)
+    """
     global detector
     if detector is None:
-        print("🔧 Initializing Product Detector (YOLOv8 + OCR)...")
-        from product_detector import ProductDetector
-        detector = ProductDetector(confidence_threshold=0.25)
+        with _model_locks['detector']:
+            if detector is None:
+                print("🔧 Initializing Product Detector (YOLOv8 + OCR)...")
+                try:
+                    entry = model_registry.active('detector')
+                    model_status['detector'].loading(entry['version'])
+                    detector = build_model('detector', entry)
+                except Exception as e:
+                    model_status['detector'].failed(e)
+                    raise
+                model_status['detector'].loaded()
+                if mark_ready:
+                    model_status['detector'].ready()
+    else:
+        check_model_updates()
     return detector
 
-def get_classifier():
-    """Lazy load the classifier (for classification mode)"""
+def get_classifier(mark_ready=True):
+    """
+    Lazy load the classifier (for classification mode)
+    
+    Args:
+        mark_ready: Report it ready as soon as it is loaded (preloading
+            reports it ready after warmup instead)
+    """
     global classifier
     if classifier is None:
-        print("🔧 Loading Trained Grocery Classifier...")
-        from product_classifier import ProductClassifier
-        classifier = ProductClassifier(model_path='weights/grocery_classifier_best.pt', top_k=5)
+        with _model_locks['classifier']:
+            if classifier is None:
+                print("🔧 Loading Trained Grocery Classifier...")
+                try:
+                    entry = model_registry.active('classifier')
+                    model_status['classifier'].loading(entry['version'])
+                    classifier = build_model('classifier', entry)
+                except Exception as e:
+                    model_status['classifier'].failed(e)
+                    raise
+                model_status['classifier'].loaded()
+                if mark_ready:
+                    model_status['classifier'].ready()
+    else:
+        check_model_updates()
     return classifier
 
+def get_hybrid():
+    """Lazy load the detect-then-classify pipeline (for hybrid mode)"""
+    global hybrid
+    det, clf = get_detector(), get_classifier()
+    current = hybrid
+    # Rebuilt when either model was swapped
+    if current is None or current.detector is not det or current.classifier is not clf:
+        from hybrid_recognizer import HybridRecognizer
+        current = hybrid = HybridRecognizer(det, clf, ocr_confidence_threshold=HYBRID_OCR_CONFIDENCE)
+    return current
+
+def check_model_updates():
+    """Start a hot swap for every loaded model whose active version changed (rate limited)"""
+    global _registry_checked_at
+    now = time.monotonic()
+    if now - _registry_checked_at < MODEL_REGISTRY_POLL_SECONDS:
+        return
+    _registry_checked_at = now
+    try:
+        model_registry.refresh()
+        for name, model in (('classifier', classifier), ('detector', detector)):
+            if model is None:
+                continue
+            entry = model_registry.active(name)
+            if entry is not None and entry['version'] != model.version:
+                start_model_swap(name, entry)
+    except Exception as e:
+        print(f"⚠️  Model registry check failed: {e}")
+
+def start_model_swap(name, entry):
+    """
+    Load and warm up a model version in the background, then swap it in
+    
+    Requests already running finish on the old model; the next batch uses
+    the new one.
+    
+    Returns:
+        Swap state dict (the running swap if one is in progress)
+    """
+    with _model_locks[name]:
+        thread = _swap_threads.get(name)
+        if thread is not None and thread.is_alive():
+            return model_swaps[name]
+        swap = model_swaps[name] = {
+            'version': entry['version'],
+            'path': entry['path'],
+            'state': 'loading',
+            'started_at': datetime.now().isoformat(),
+            'error': None
+        }
+        thread = _swap_threads[name] = threading.Thread(target=_swap_model, args=(name, entry, swap),
+                                                        name=f'{name}-swap', daemon=True)
+        thread.start()
+        return swap
+
+def _swap_model(name, entry, swap):
+    global classifier, detector
+    try:
+        print(f"🔁 Loading {name} {entry['version']} for hot swap...")
+        model = build_model(name, entry)
+        swap['state'] = 'warming_up'
+        warmup_ms = model.warmup()
+        with _model_locks[name]:
+            previous = classifier if name == 'classifier' else detector
+            if name == 'classifier':
+                classifier = model
+            else:
+                detector = model
+        model_status[name].swapped(entry['version'], warmup_ms)
+        swap['state'] = 'active'
+        swap['finished_at'] = datetime.now().isoformat()
+        print(f"✅ {name} swapped: {getattr(previous, 'version', None)} -> {entry['version']}")
+    except Exception as e:
+        swap['state'] = 'failed'
+        swap['error'] = str(e)
+        print(f"❌ Hot swap of {name} to {entry['version']} failed: {e}")
+
+def loaded_versions(mode):
+    """Versions of the models a mode needs ({name: version}), as currently served"""
+    models = {'classifier': classifier, 'detector': detector}
+    versions = {}
+    for name in required_models(mode):
+        if models[name] is not None:
+            versions[name] = models[name].version
+        else:
+            entry = model_registry.active(name)
+            versions[name] = entry['version'] if entry else None
+    return versions
+
+def required_models(mode=None):
+    """Models a mode needs to serve requests"""
+    return {
+        'classification': ['classifier'],
+        'detection': ['detector'],
+        'hybrid': ['detector', 'classifier']
+    }[mode or MODE]
+
+def preload_models():
+    """Load and warm up the models MODE needs (runs in a background thread)"""
+    loaders = {'classifier': get_classifier, 'detector': get_detector}
+    for name in required_models():
+        try:
+            model = loaders[name](mark_ready=False)
+            print(f"🔥 Warming up {name}...")
+            warmup_ms = model.warmup()
+            model_status[name].ready(warmup_ms)
+            print(f"✅ {name} ready (load {model_status[name].load_seconds}s, warmup {warmup_ms:.0f} ms)")
+        except Exception as e:
+            model_status[name].failed(e)
+            print(f"❌ Failed to preload {name}: {e}")
+
+_preload_pid = None
+_preload_lock = threading.Lock()
+
+def start_preload():
+    """Start preloading the models MODE needs in the background (once per serving process)"""
+    global _preload_pid
+    with _preload_lock:
+        if _preload_pid == os.getpid():
+            return
+        _preload_pid = os.getpid()
+    if PRELOAD_MODELS:
+        threading.Thread(target=preload_models, name='model-preload', daemon=True).start()
+
+def start_background_services():
+    """Start model preloading and scan job workers (in the serving process)"""
+    start_preload()
+    job_queue.start()
+
+# Inference schedulers (sit between the request handlers and the models)
+# Batch functions return (result, model versions) pairs, so every request knows
+# which model instance served it, even while a hot swap happens
+def _classify_batch(images):
+    model = get_classifier()
+    return [(result, model.model_versions) for result in model.classify_batch(images)]
+
+def _detect_batch(images):
+    model = get_detector()
+    return [(result, model.model_versions) for result in model.detect_products_batch(images)]
+
+def _hybrid_batch(images):
+    model = get_hybrid()
+    return [(result, model.model_versions) for result in model.detect_products_batch(images)]
+
+classify_scheduler = InferenceScheduler(_classify_batch, max_batch_size=MAX_BATCH_SIZE,
+                                        max_wait_ms=MAX_BATCH_WAIT_MS, name='classify')
+detect_scheduler = InferenceScheduler(_detect_batch, max_batch_size=MAX_BATCH_SIZE,
+                                      max_wait_ms=MAX_BATCH_WAIT_MS, name='detect')
+hybrid_scheduler = InferenceScheduler(_hybrid_batch, max_batch_size=MAX_BATCH_SIZE,
+                                      max_wait_ms=MAX_BATCH_WAIT_MS, name='hybrid')
+
+def configure_admission(workers=1):
+    """
+    (Re)create the admission controller with this process' share of the limits
+    
+    Args:
+        workers: Number of worker processes serving the same port
+        
+    Returns:
+        The new AdmissionController
+    """
+    global admission
+    # Fewer slots than MAX_BATCH_SIZE would cap every micro-batch below its size
+    max_concurrent = max(MAX_CONCURRENT_INFERENCE, MAX_BATCH_SIZE)
+    admission = AdmissionController(max_concurrent=math.ceil(max_concurrent / workers),
+                                    max_queue=math.ceil(MAX_QUEUED_INFERENCE / workers),
+                                    queue_timeout_ms=ADMISSION_QUEUE_TIMEOUT_MS,
+                                    name='detect')
+    return admission
+
+admission = configure_admission()
+
+result_cache = ResultCache(max_entries=RESULT_CACHE_MAX_ENTRIES,
+                           max_bytes=RESULT_CACHE_MAX_MB * 1024 * 1024,
+                           ttl_seconds=RESULT_CACHE_TTL_SECONDS,
+                           disk_dir=RESULT_CACHE_DIR,
+                           disk_max_entries=RESULT_CACHE_DISK_MAX_ENTRIES,
+                           disk_max_bytes=RESULT_CACHE_DISK_MAX_MB * 1024 * 1024)
+
+inventory_store = InventoryStore(keep_versions=INVENTORY_KEEP_VERSIONS, keep_inline=INVENTORY_KEEP_INLINE,
+                                 disk_dir=INVENTORY_DIR)
+
+# Written synchronously: the annotation URL may be fetched from another worker right away
+annotation_specs = ResultCache(max_entries=4096, max_bytes=32 * 1024 * 1024,
+                               ttl_seconds=ANNOTATION_SPEC_TTL_SECONDS, disk_dir=ANNOTATION_SPEC_DIR,
+                               async_disk_writes=False)
+decoded_images = DecodedImageCache(max_bytes=DECODED_IMAGE_CACHE_MB * 1024 * 1024)
+
+batch_pipeline = BatchPipeline(decode_workers=BATCH_DECODE_WORKERS,
+                               ocr_workers=BATCH_OCR_WORKERS,
+                               yolo_batch_size=BATCH_YOLO_BATCH_SIZE)
+
+video_scanner = VideoScanner(lambda frames: get_detector().detect_products_batch(frames),
+                             batch_size=VIDEO_BATCH_SIZE,
+                             diff_threshold=VIDEO_DIFF_THRESHOLD,
+                             max_shift_fraction=VIDEO_MAX_SHIFT_FRACTION,
+                             max_skip_frames=VIDEO_MAX_SKIP_FRAMES,
+                             iou_threshold=VIDEO_TRACK_IOU)
+
+def ocr_policy_id():
+    """Short fingerprint of the OCR gating (and barcode decoding) settings"""
+    policy = [OCR_MIN_BOX_AREA, OCR_MIN_CONFIDENCE, sorted(OCR_CLASSES) if OCR_CLASSES is not None else None,
+              sorted(OCR_SKIP_CLASSES or ()), OCR_MAX_CROPS_PER_IMAGE, DECODE_BARCODES, BARCODE_SCOPE]
+    return hashlib.sha256(json.dumps(policy).encode('utf-8')).hexdigest()[:8]
+
+def tiling_id():
+    """Tiling settings (part of the cache key of detection results)"""
+    if not DETECTOR_TILE_SIZE:
+        return 'whole'
+    return (f"tile={DETECTOR_TILE_SIZE}/{DETECTOR_TILE_OVERLAP}/{DETECTOR_TILE_MIN_SIDE}"
+            f"/{DETECTOR_TILE_MAX_SIDE}/{DETECTOR_TILE_IOU}")
+
+def ocr_summary(detections):
+    """OCR'd and skipped detections of one result (skips by gating reason)"""
+    reasons = {}
+    for detection in detections:
+        if detection.get('ocr_skipped'):
+            reasons[detection['ocr_skipped']] = reasons.get(detection['ocr_skipped'], 0) + 1
+    return {
+        # Hybrid detections say whether OCR ran; detection mode OCRs everything not skipped
+        'read': sum(1 for d in detections if d.get('ocr_used', not d.get('ocr_skipped'))),
+        'skipped': sum(reasons.values()),
+        'skipped_by_reason': reasons
+    }
+
+def weights_path_identity(name, version):
+    """weights_identity() of a registered version's weights ('' if unknown)"""
+    entry = model_registry.get(name, version) if version else None
+    return weights_identity(entry['path']) if entry else ''
+
+def model_identity(mode, versions=None):
+    """
+    Identify the model versions (and settings) producing results in a mode - part of the cache key
+    
+    Args:
+        mode: 'classification', 'detection' or 'hybrid'
+        versions: {name: version} that served a result (default: currently served)
+    """
+    versions = versions or loaded_versions(mode)
+    # The weights file identity too (size, mtime), in case weights were replaced under a version
+    identity = ','.join(f"{name}@{versions[name]}:{weights_path_identity(name, versions[name])}"
+                        for name in sorted(versions))
+    if mode == 'classification':
+        return f"{identity}:{INFERENCE_ENGINE}"
+    if mode == 'hybrid':
+        return (f"{identity}:conf={DETECTOR_CONFIDENCE}:{tiling_id()}:ocr_below={HYBRID_OCR_CONFIDENCE}"
+                f":ocr_gate={ocr_policy_id()}:{INFERENCE_ENGINE}")
+    return f"{identity}:conf={DETECTOR_CONFIDENCE}:{tiling_id()}:ocr_gate={ocr_policy_id()}:{INFERENCE_ENGINE}"
+
+def job_loader(mode):
+    """Model loader of a mode for scan job workers (spawned: they don't import this module)"""
+    return ModeLoader(mode, MODEL_REGISTRY_PATH, model_registry.defaults,
+                      {name: model_settings(name) for name in ('classifier', 'detector')},
+                      hybrid_ocr_confidence=HYBRID_OCR_CONFIDENCE, poll_interval=MODEL_REGISTRY_POLL_SECONDS)
+
+job_queue = JobQueue(JOBS_DIR, loaders={mode: job_loader(mode) for mode in ('classification', 'detection', 'hybrid')},
+                     workers=JOB_WORKERS, max_retries=JOB_MAX_RETRIES, max_file_size=MAX_FILE_SIZE,
+                     worker_batch_size=JOB_WORKER_BATCH_SIZE, ocr_max_side=OCR_MAX_SIDE)
+
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def register_annotation(image, image_bytes, source_filename, detections, ext):
+    """
+    Remember what an annotated image would show, without rendering it
+    
+    Args:
+        image: Decoded NormalizedImage (its working copy is kept in the
+            decoded image cache and drawn on if it has the output
+            resolution, otherwise the original bytes are)
+        image_bytes: Original file contents
+        source_filename: Stored original (None if uploads aren't saved)
+        detections: Matched detections to draw
+        ext: Output format extension
+        
+    Returns:
+        File name of the annotated image (rendered on first GET)
+    """
+    image_digest = hashlib.sha256(image_bytes).hexdigest()
+    width, height = image.original_size
+    if ANNOTATION_MAX_SIDE and max(width, height) > ANNOTATION_MAX_SIDE:
+        ratio = ANNOTATION_MAX_SIDE / max(width, height)
+        width, height = max(1, int(round(width * ratio))), max(1, int(round(height * ratio)))
+    spec = {
+        'image_digest': image_digest,
+        'source': source_filename,
+        'ext': ext,
+        'size': [width, height],
+        'original_size': list(image.original_size),
+        'detections': [{
+            'bbox': d['bbox'],
+            'confidence': d['confidence'],
+            'detected_text': d.get('detected_text', ''),
+            'is_matched': d.get('is_matched', False),
+            'matched_inventory': {'name': d['matched_inventory'].get('name', '')} if d.get('matched_inventory') else None
+        } for d in detections]
+    }
+    # Same image + same drawing = same name, so renders are shared
+    digest = hashlib.sha256(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()
+    annotated_filename = f"annotated_{digest}.{ext}"
+    
+    annotation_specs.put(annotated_filename, spec)
+    # Draw on the working copy if it has the output size, otherwise keep the encoded original
+    # (smaller than its pixels) to decode at that size
+    decoded_images.put(image_digest, image.image if abs(image.shape[1] - width) <= 1 else image_bytes)
+    return annotated_filename
+
+def render_annotation(annotated_filename):
+    """
+    Render a registered annotated image and store it for later requests
+    
+    Returns:
+        Encoded image bytes, or None if the spec or original is gone
+    """
+    spec = annotation_specs.get(annotated_filename)
+    if spec is None:
+        return None
+    
+    cached = decoded_images.get(spec['image_digest'])
+    image = None
+    if isinstance(cached, bytes):
+        image = decode_image(cached, max_side=max(spec['size']))
+    elif cached is not None and abs(cached.shape[1] - spec['size'][0]) <= 1:
+        image = cached
+    if image is None and spec['source']:
+        source_path = upload_store.locate(spec['source'])
+        if source_path is not None:
+            with open(source_path, 'rb') as f:
+                image = decode_image(f.read(), max_side=max(spec['size']))
+    if image is None:
+        # Original gone: a smaller copy beats no image
+        image = cached
+    if image is None:
+        return None
+    
+    # Detections are in original image coordinates, the image may be downscaled
+    ratio = image.shape[1] / spec['original_size'][0]
+    detections = [{**d, 'bbox': [int(round(v * ratio)) for v in d['bbox']]} for d in spec['detections']]
+    
+    with time_stage('annotate'):
+        annotated = get_detector().visualize_detections(image, detections)
+        annotated_bytes = encode_image(annotated, spec['ext'])
+    upload_store.put_async(annotated_bytes, spec['ext'], name=annotated_filename)
+    print(f"🎨 Rendered annotated image: {annotated_filename}")
+    return annotated_bytes
+
+def resolve_inventory():
+    """
+    Get the inventory a detect request should be matched against
+    
+    Prefers 'inventory_version' (server-side index, 'latest' = current);
+    falls back to a legacy 'inventory' JSON field.
+    
+    Returns:
+        Tuple of (InventoryIndex or None, error response or None)
+    """
+    version = request.form.get('inventory_version')
+    if version:
+        index = inventory_store.get(version)
+        if index is None:
+            current = inventory_store.current
+            return None, (jsonify({
+                'success': False,
+                'error': f'Unknown inventory version: {version}',
+                'current_version': current.version if current else None
+            }), 409)
+        return index, None
+    
+    if 'inventory' in request.form:
+        try:
+            return inventory_store.inline(request.form['inventory']), None
+        except json.JSONDecodeError:
+            print("⚠️  Invalid inventory JSON, skipping matching")
+            return None, None
+    
+    return None, None
+
+def request_deadline():
+    """
+    Deadline of the current request from its DEADLINE_HEADER (time budget in ms)
+    
+    Returns:
+        Tuple of (time.monotonic() deadline or None, error response or None)
+    """
+    value = request.headers.get(DEADLINE_HEADER)
+    if value is None:
+        return None, None
+    try:
+        budget_ms = float(value)
+    except ValueError:
+        return None, (jsonify({'success': False, 'error': f'{DEADLINE_HEADER} must be a number of milliseconds'}), 400)
+    return time.monotonic() + max(0.0, budget_ms) / 1000.0, None
+
+def overloaded_response(error):
+    """429/503 with a Retry-After hint"""
+    ADMISSION_REJECTED.inc(reason=error.reason)
+    response = jsonify({'success': False, 'error': str(error), 'retry_after': error.retry_after})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, error.status
+
+def deadline_response(error):
+    """The client's deadline passed, so its request was dropped before (or instead of) inference"""
+    ADMISSION_REJECTED.inc(reason='deadline')
+    return jsonify({'success': False, 'error': str(error)}), 504
+
+@app.errorhandler(413)
+def request_too_large(error):
+    """JSON instead of werkzeug's HTML page when the route's request size cap is exceeded"""
+    limit = g.get('max_request_size', MAX_REQUEST_SIZE)
+    return jsonify({
+        'success': False,
+        'error': f'Request too large (max {limit / (1024 * 1024):.0f}MB)'
+    }), 413
+
+@app.before_request
+def track_request_start():
+    """Count in-flight requests per endpoint"""
+    g.metrics_endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.metrics_start = time.perf_counter()
+    IN_FLIGHT.inc(endpoint=g.metrics_endpoint)
+
+@app.before_request
+def limit_request_size():
+    """413 before werkzeug spools the body when its Content-Length is over the route's cap"""
+    g.max_request_size = request.max_content_length
+    if request.content_length is not None and request.content_length > g.max_request_size:
+        return request_too_large(None)
+
+@app.before_request
+def preload_on_first_request():
+    """Start preloading on the first request (probes included), however the app is served"""
+    if _preload_pid != os.getpid():
+        start_preload()
+
+@app.after_request
+def track_request_status(response):
+    """Count requests by endpoint, mode and status"""
+    endpoint = g.get('metrics_endpoint', 'unmatched')
+    mode = MODE if endpoint.startswith('/api/detect') else ''
+    REQUESTS.inc(endpoint=endpoint, mode=mode, status=response.status_code)
+    return response
+
+@app.teardown_request
+def track_request_end(error=None):
+    """Close the in-flight gauge and latency (also for unhandled errors)"""
+    if 'metrics_start' in g:
+        REQUEST_LATENCY.observe(time.perf_counter() - g.metrics_start, endpoint=g.metrics_endpoint)
+        IN_FLIGHT.dec(endpoint=g.metrics_endpoint)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics (per-stage latency histograms, request counters, in-flight gauges)"""
+    QUEUE_DEPTH.set(classify_scheduler.stats()['queued'], scheduler='classify')
+    QUEUE_DEPTH.set(detect_scheduler.stats()['queued'], scheduler='detect')
+    QUEUE_DEPTH.set(hybrid_scheduler.stats()['queued'], scheduler='hybrid')
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -57,10 +750,40 @@ def health_check():
         'service': 'AIMS Product Detection API',
         'version': '1.0.0',
         'mode': MODE,
-        'model_loaded': True,
+        'model_loaded': all(model_status[name].is_loaded for name in required_models()),
+        'models': {name: status.to_dict() for name, status in model_status.items()},
+        'inference_engine': {
+            'configured': INFERENCE_ENGINE,
+            'classifier': classifier.engine if classifier else None,
+            'detector': detector.engine if detector else None
+        },
+        'ocr_gate': detector.ocr_gate_stats() if detector else None,
+        'schedulers': {
+            'classify': classify_scheduler.stats(),
+            'detect': detect_scheduler.stats(),
+            'hybrid': hybrid_scheduler.stats()
+        },
+        'admission': admission.stats(),
+        'result_cache': result_cache.stats(),
+        'uploads': upload_store.stats(),
         'timestamp': datetime.now().isoformat()
     })
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """
+    Readiness probe: 200 once every model MODE needs is loaded and warmed up,
+    503 before that (route traffic only when this passes)
+    """
+    models = {name: model_status[name].to_dict() for name in required_models()}
+    ready = all(model_status[name].is_ready for name in required_models())
+    return jsonify({
+        'ready': ready,
+        'mode': MODE,
+        'models': models,
+        'timestamp': datetime.now().isoformat()
+    }), 200 if ready else 503
+
 @app.route('/api/detect', methods=['POST'])
 def detect_products():
     """
@@ -68,17 +791,28 @@ def detect_products():
     
     Mode 'classification': Single product per image (your trained model)
     Mode 'detection': Multiple products with OCR (YOLOv8 + EasyOCR)
+    Mode 'hybrid': Multiple products, each crop recognized by the classifier
+    (OCR only for crops it isn't confident about)
     
     Request:
         - file: Image file (multipart/form-data)
-        - inventory: JSON string of inventory items (optional)
+        - inventory_version: Version ID from /api/inventory, or 'latest' (optional)
+        - inventory: JSON string of inventory items (optional, legacy)
+        - X-Request-Timeout-Ms header: Time budget; the request is dropped
+          (504) instead of run once it is used up (optional)
         
     Response:
         - detections/prediction: Detection or classification results
         - matched: List of products matched to inventory
         - mode: Which mode was used
+        - 429/503 with Retry-After when the server is saturated
     """
+    slot = None
     try:
+        deadline, error_response = request_deadline()
+        if error_response:
+            return error_response
+        
         # Check if file is present
         if 'file' not in request.files:
             return jsonify({'error': 'No file provided'}), 400
@@ -91,80 +825,133 @@ def detect_products():
         if not allowed_file(file.filename):
             return jsonify({'error': f'Invalid file type. Allowed: {ALLOWED_EXTENSIONS}'}), 400
         
-        # Generate unique filename
+        # Get inventory to match against, if any
+        inventory, error_response = resolve_inventory()
+        if error_response:
+            return error_response
+        
         file_ext = file.filename.rsplit('.', 1)[1].lower()
-        unique_filename = f"{uuid.uuid4()}.{file_ext}"
-        file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
+        try:
+            image_bytes = read_limited(file, MAX_FILE_SIZE)
+        except FileTooLarge as e:
+            return jsonify({'success': False, 'error': str(e)}), 413
         
-        # Save uploaded file
-        file.save(file_path)
-        print(f"📁 Saved image: {file_path}")
+        # Same image + same model version = same result
+        current_versions = loaded_versions(MODE)
+        cache_key = result_cache.make_key(image_bytes, model_identity(MODE, current_versions), MODE)
+        cached = result_cache.get(cache_key)
+        model_versions = current_versions
         
-        # Get inventory data if provided
-        inventory_data = []
-        if 'inventory' in request.form:
+        # Decoding and inference only start once there is capacity for them
+        # (cache hits are served even when saturated)
+        if cached is None:
+            slot = admission.acquire(deadline)
+        
+        # Decode straight from the request stream (no disk round trip), at the
+        # resolution the model needs; a cached classification doesn't need the pixels at all
+        image = None
+        if cached is None or MODE != 'classification':
             try:
-                inventory_data = json.loads(request.form['inventory'])
-            except json.JSONDecodeError:
-                print("⚠️  Invalid inventory JSON, skipping matching")
+                with time_stage('decode'):
+                    if MODE == 'classification':
+                        # Classifier resizes the shorter side to its input size
+                        image = decode_image(image_bytes, min_side=get_classifier().input_size)
+                    else:
+                        image = NormalizedImage(image_bytes, max_side=get_detector().max_image_side,
+                                                crop_max_side=OCR_MAX_SIDE)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        
+        # Persisting the original is an optional side effect (stored once per content)
+        stored_filename = upload_store.put_async(image_bytes, file_ext) if SAVE_UPLOADS else None
         
         # Use classification or detection mode
         if MODE == 'classification':
             # Use your trained classifier
             clf = get_classifier()
             
-            print("🎯 Classifying product...")
-            prediction = clf.classify_product(file_path)
+            if cached is not None:
+                prediction = cached
+                print("⚡ Cache hit, skipping classification")
+            else:
+                print("🎯 Classifying product...")
+                prediction, model_versions = classify_scheduler.run(image, deadline=deadline)
+                result_cache.put(result_cache.make_key(image_bytes, model_identity(MODE, model_versions), MODE),
+                                 prediction)
             print(f"✅ Predicted: {prediction['predicted_class']} ({prediction['confidence']*100:.1f}%)")
             
             # Match to inventory
-            matched_result = clf.match_to_inventory(prediction, inventory_data) if inventory_data else None
+            matched_result = None
+            if inventory:
+                with time_stage('match'):
+                    matched_result = clf.match_to_inventory(prediction, inventory)
             
             return jsonify({
                 'success': True,
                 'mode': 'classification',
                 'prediction': prediction,
                 'matched': matched_result,
-                'image_path': unique_filename,
+                'image_path': stored_filename,
+                'cached': cached is not None,
+                'model_version': model_versions,
                 'timestamp': datetime.now().isoformat()
             }), 200
         
         else:
-            # Use detection mode (YOLOv8 + OCR)
-            det = get_detector()
+            # Use detection mode (YOLOv8 + OCR) or hybrid mode (YOLOv8 + classifier)
+            det = get_hybrid() if MODE == 'hybrid' else get_detector()
             
-            print("🔍 Detecting products...")
-            detections = det.detect_products(file_path)
+            if cached is not None:
+                detections = cached
+                print("⚡ Cache hit, skipping detection")
+            else:
+                print("🔍 Detecting products...")
+                scheduler = hybrid_scheduler if MODE == 'hybrid' else detect_scheduler
+                detections, model_versions = scheduler.run(image, deadline=deadline)
+                result_cache.put(result_cache.make_key(image_bytes, model_identity(MODE, model_versions), MODE),
+                                 detections)
             print(f"✅ Found {len(detections)} products")
             
             # Match to inventory
             matched_products = []
-            if inventory_data:
-                print(f"🔗 Matching against {len(inventory_data)} inventory items...")
-                matched_products = det.match_to_inventory(detections, inventory_data)
+            if inventory:
+                print(f"🔗 Matching against {len(inventory)} inventory items...")
+                with time_stage('match'):
+                    matched_products = det.match_to_inventory(detections, inventory)
             else:
                 matched_products = detections
         
-            # Generate annotated image
-            annotated_filename = f"annotated_{unique_filename}"
-            annotated_path = os.path.join(UPLOAD_FOLDER, annotated_filename)
-            det.visualize_detections(file_path, matched_products, annotated_path)
-            print(f"🎨 Saved annotated image: {annotated_path}")
+            # Annotated image is only rendered if a client fetches it
+            annotated_filename = register_annotation(image, image_bytes, stored_filename, matched_products, file_ext)
         
             # Prepare response
             response = {
                 'success': True,
+                'mode': MODE,
                 'total_detections': len(detections),
                 'matched_count': sum(1 for p in matched_products if p.get('is_matched', False)),
+                'ocr': ocr_summary(detections),
                 'detections': detections,
                 'matched_products': matched_products,
-                'original_image': f'/uploads/{unique_filename}',
+                'original_image': f'/uploads/{stored_filename}' if stored_filename else None,
                 'annotated_image': f'/uploads/{annotated_filename}',
+                'cached': cached is not None,
+                'model_version': model_versions,
                 'timestamp': datetime.now().isoformat()
             }
             
             return jsonify(response), 200
         
+    except Overloaded as e:
+        print(f"🚦 Rejected ({e.status}): {e}")
+        return overloaded_response(e)
+    except DeadlineExceeded as e:
+        print(f"⌛ Dropped: {e}")
+        if slot is not None and e.running is not None:
+            # Its batch is still on the model: the slot stays taken until the batch ends
+            admission.release_when_done(slot, e.running)
+            slot = None
+        return deadline_response(e)
     except Exception as e:
         print(f"❌ Error: {str(e)}")
         import traceback
@@ -173,95 +960,546 @@ def detect_products():
             'success': False,
             'error': str(e)
         }), 500
+    finally:
+        if slot is not None:
+            admission.release(slot)
 
 @app.route('/api/detect-batch', methods=['POST'])
 def detect_products_batch():
     """
     Detect products in multiple images
     
+    Images are decoded in parallel, run through YOLO in batches and OCR'd
+    on a worker pool; each result is streamed back as soon as it is ready.
+    
     Request:
         - files: Multiple image files
-        - inventory: JSON string of inventory items (optional)
+        - inventory_version: Version ID from /api/inventory, or 'latest' (optional)
+        - inventory: JSON string of inventory items (optional, legacy)
+        - X-Request-Timeout-Ms header: Time budget for waiting on an
+          inference slot (optional)
         
-    Response:
-        - results: List of detection results for each image
+    Response (application/x-ndjson):
+        - One JSON line per image, in completion order, with 'index'
+          (position in the upload) and 'filename'
+        - 429/503 with Retry-After when the server is saturated
     """
+    deadline, error_response = request_deadline()
+    if error_response:
+        return error_response
+    
+    if 'files' not in request.files:
+        return jsonify({'error': 'No files provided'}), 400
+    
+    files = request.files.getlist('files')
+    
+    if len(files) == 0:
+        return jsonify({'error': 'No files selected'}), 400
+    
+    # Get inventory to match against, if any
+    inventory, error_response = resolve_inventory()
+    if error_response:
+        return error_response
+    
+    # Hybrid mode recognizes crops with the classifier; otherwise YOLOv8 + OCR
+    batch_mode = 'hybrid' if MODE == 'hybrid' else 'detection'
     try:
-        if 'files' not in request.files:
-            return jsonify({'error': 'No files provided'}), 400
+        # Get detector
+        det = get_hybrid() if batch_mode == 'hybrid' else get_detector()
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+    
+    # The whole batch runs on this model instance, even if a new version is swapped in meanwhile
+    model_versions = det.model_versions
+    detection_model_id = model_identity(batch_mode, model_versions)
+    cache_keys = {}  # index -> cache key of images that missed the cache
+    
+    def prepare(entry):
+        # Decode stage: read upload, check cache, decode in memory
+        index, file = entry
+        if not allowed_file(file.filename):
+            raise ValueError('Invalid file type')
         
-        files = request.files.getlist('files')
+        image_bytes = read_limited(file, MAX_FILE_SIZE)
+        cache_key = result_cache.make_key(image_bytes, detection_model_id, batch_mode)
+        with time_stage('decode'):
+            image = NormalizedImage(image_bytes, max_side=det.max_image_side, crop_max_side=OCR_MAX_SIDE)
         
-        if len(files) == 0:
-            return jsonify({'error': 'No files selected'}), 400
+        if SAVE_UPLOADS:
+            upload_store.put_async(image_bytes, file.filename.rsplit('.', 1)[1].lower())
         
-        # Get inventory data
-        inventory_data = []
-        if 'inventory' in request.form:
-            try:
-                inventory_data = json.loads(request.form['inventory'])
-            except json.JSONDecodeError:
-                pass
+        cached = result_cache.get(cache_key)
+        if cached is None:
+            cache_keys[index] = cache_key
+        return image, cached
+    
+    def finish(entry, image, detections):
+        # Post-processing stage: cache, match to inventory
+        index, file = entry
+        if index in cache_keys:
+            result_cache.put(cache_keys[index], detections)
         
-        # Get detector
+        if inventory:
+            with time_stage('match'):
+                matched = det.match_to_inventory(detections, inventory)
+        else:
+            matched = detections
+        
+        return {
+            'index': index,
+            'filename': file.filename,
+            'success': True,
+            'total_detections': len(detections),
+            'matched_count': sum(1 for p in matched if p.get('is_matched', False)),
+            'ocr': ocr_summary(detections),
+            'detections': matched,
+            'model_version': model_versions
+        }
+    
+    def on_error(entry, error):
+        index, file = entry
+        return {
+            'index': index,
+            'filename': file.filename,
+            'success': False,
+            'error': str(error)
+        }
+    
+    # Closing the stream (e.g. client disconnect) cancels the remaining images
+    cancel = threading.Event()
+    done = Future()
+    
+    def generate():
+        for result in batch_pipeline.run(det, list(enumerate(files)), prepare, finish, on_error,
+                                          cancel=cancel, done=done):
+            yield json.dumps(result) + '\n'
+    
+    def on_close():
+        cancel.set()
+        done.cancel()  # Only succeeds if the pipeline never started
+    
+    # The whole batch holds one slot until its pipeline work has finished
+    try:
+        slot = admission.acquire(deadline)
+    except Overloaded as e:
+        print(f"🚦 Rejected ({e.status}): {e}")
+        return overloaded_response(e)
+    except DeadlineExceeded as e:
+        print(f"⌛ Dropped: {e}")
+        return deadline_response(e)
+    
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    admission.release_when_done(slot, done)
+    response.call_on_close(on_close)
+    return response
+
+@app.route('/api/detect-video', methods=['POST'])
+def detect_products_video():
+    """
+    Scan a shelf-walk video or a sequence of frames
+    
+    The detector only runs on frames whose content changed (camera motion
+    is compensated); other frames reuse the boxes of the last detected
+    frame, and detections are linked into one track per product.
+    
+    Request:
+        - file: Video file (mp4, avi, mov, mkv, webm), or
+        - frames: Multiple image files, in order
+        - stride: Only look at every n-th video frame (optional, default 1)
+        - inventory_version: Version ID from /api/inventory, or 'latest' (optional)
+        - inventory: JSON string of inventory items (optional, legacy)
+        - X-Request-Timeout-Ms header: Time budget for waiting on an
+          inference slot (optional)
+        
+    Response:
+        - tracks: One entry per product seen (best sighting, matched to inventory)
+        - frames: Per frame, whether it was detected and its boxes (by track_id)
+        - stats: Frames seen vs. frames detected
+        - 429/503 with Retry-After when the server is saturated
+    """
+    deadline, error_response = request_deadline()
+    if error_response:
+        return error_response
+    
+    video = request.files.get('file')
+    frames = request.files.getlist('frames')
+    if (video is None or video.filename == '') and not frames:
+        return jsonify({'error': 'No video or frames provided'}), 400
+    
+    if frames:
+        invalid = [frame.filename for frame in frames if not allowed_file(frame.filename)]
+        if invalid:
+            return jsonify({'error': f'Invalid file type. Allowed: {ALLOWED_EXTENSIONS}', 'files': invalid}), 400
+    elif '.' not in video.filename or video.filename.rsplit('.', 1)[1].lower() not in VIDEO_EXTENSIONS:
+        return jsonify({'error': f'Invalid video type. Allowed: {VIDEO_EXTENSIONS}'}), 400
+    
+    stride = max(1, request.form.get('stride', 1, type=int))
+    
+    inventory, error_response = resolve_inventory()
+    if error_response:
+        return error_response
+    
+    video_path = None
+    slot = None
+    try:
         det = get_detector()
         
-        results = []
+        if frames:
+            print(f"🎞️  Scanning {len(frames)} frames...")
+            source = iter_encoded_frames(read_limited(frame, MAX_FILE_SIZE) for frame in frames[::stride])
+        else:
+            # OpenCV reads videos from a path
+            suffix = '.' + video.filename.rsplit('.', 1)[1].lower()
+            with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+                video_path = tmp.name
+                save_limited(video, tmp, MAX_VIDEO_SIZE)
+            print(f"🎞️  Scanning video {video.filename}...")
+            source = iter_video_frames(video_path, stride=stride)
         
-        for file in files:
-            if not allowed_file(file.filename):
-                results.append({
-                    'filename': file.filename,
-                    'success': False,
-                    'error': 'Invalid file type'
-                })
-                continue
-            
-            # Save file
-            file_ext = file.filename.rsplit('.', 1)[1].lower()
-            unique_filename = f"{uuid.uuid4()}.{file_ext}"
-            file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
-            file.save(file_path)
-            
-            # Detect
-            try:
-                detections = det.detect_products(file_path)
-                
-                if inventory_data:
-                    matched = det.match_to_inventory(detections, inventory_data)
-                else:
-                    matched = detections
-                
-                results.append({
-                    'filename': file.filename,
-                    'success': True,
-                    'total_detections': len(detections),
-                    'matched_count': sum(1 for p in matched if p.get('is_matched', False)),
-                    'detections': matched
-                })
-            except Exception as e:
-                results.append({
-                    'filename': file.filename,
-                    'success': False,
-                    'error': str(e)
-                })
+        slot = admission.acquire(deadline)
+        result = video_scanner.scan(source, detect_batch=det.detect_products_batch)
+        stats = result['stats']
+        print(f"✅ {stats['tracks']} products in {stats['frames']} frames "
+              f"(detected {stats['detected_frames']}, skipped {stats['skipped_frames']})")
+        
+        tracks = result['tracks']
+        if inventory:
+            with time_stage('match'):
+                tracks = det.match_to_inventory(tracks, inventory)
         
         return jsonify({
             'success': True,
-            'processed': len(results),
-            'results': results
+            'mode': 'detection',
+            'total_detections': len(tracks),
+            'matched_count': sum(1 for t in tracks if t.get('is_matched', False)),
+            'tracks': tracks,
+            'frames': result['frames'],
+            'stats': stats,
+            'model_version': det.model_versions,
+            'timestamp': datetime.now().isoformat()
         }), 200
-        
+    
+    except Overloaded as e:
+        print(f"🚦 Rejected ({e.status}): {e}")
+        return overloaded_response(e)
+    except DeadlineExceeded as e:
+        print(f"⌛ Dropped: {e}")
+        return deadline_response(e)
+    except FileTooLarge as e:
+        return jsonify({'success': False, 'error': str(e)}), 413
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
+        print(f"❌ Error: {str(e)}")
+        import traceback
+        traceback.print_exc()
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
+    finally:
+        if slot is not None:
+            admission.release(slot)
+        if video_path is not None:
+            os.remove(video_path)
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """
+    Submit a large scan batch as an asynchronous job
+    
+    Request:
+        - files: Multiple image files
+        - mode: 'classification', 'detection' or 'hybrid' (optional, defaults to MODE)
+        - inventory_version: Version ID from /api/inventory, or 'latest' (optional)
+        - inventory: JSON string of inventory items (optional, legacy)
+        - X-Request-Timeout-Ms header: Time budget for waiting on a slot (optional)
+        
+    Response (202):
+        - job_id: ID to poll (/api/jobs/<id>) or subscribe to (/api/jobs/<id>/events)
+        - 429/503 with Retry-After when the server is saturated
+    """
+    deadline, error_response = request_deadline()
+    if error_response:
+        return error_response
+    
+    files = request.files.getlist('files')
+    if len(files) == 0:
+        return jsonify({'error': 'No files provided'}), 400
+    
+    invalid = [file.filename for file in files if not allowed_file(file.filename)]
+    if invalid:
+        return jsonify({'error': f'Invalid file type. Allowed: {ALLOWED_EXTENSIONS}', 'files': invalid}), 400
+    
+    mode = request.form.get('mode', MODE)
+    if mode not in ('classification', 'detection', 'hybrid'):
+        return jsonify({'error': f'Unknown mode: {mode}'}), 400
+    
+    inventory, error_response = resolve_inventory()
+    if error_response:
+        return error_response
+    
+    # Intake is admitted like inference: a flood of submissions gets 429 instead of piling up
+    try:
+        slot = admission.acquire(deadline)
+    except Overloaded as e:
+        print(f"🚦 Rejected ({e.status}): {e}")
+        return overloaded_response(e)
+    except DeadlineExceeded as e:
+        print(f"⌛ Dropped: {e}")
+        return deadline_response(e)
+    try:
+        job = job_queue.submit(files, mode, list(inventory.items.values()) if inventory else None)
+    except FileTooLarge as e:
+        return jsonify({'success': False, 'error': str(e)}), 413
+    finally:
+        admission.release(slot)
+    print(f"📋 Job {job['job_id']} queued: {job['total']} images ({mode})")
+    
+    return jsonify({
+        'success': True,
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'total': job['total'],
+        'status_url': f"/api/jobs/{job['job_id']}",
+        'events_url': f"/api/jobs/{job['job_id']}/events"
+    }), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Job progress and results
+    
+    Query:
+        - since: Only return results after this cursor (from a previous poll)
+        - limit: Max results returned (default 500)
+    """
+    job = job_queue.get(job_id, since=request.args.get('since', 0, type=int),
+                        limit=request.args.get('limit', 500, type=int))
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-sent events: progress and partial results until the job ends"""
+    if job_queue.get(job_id, limit=0) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    def generate():
+        cursor = request.args.get('since', 0, type=int)
+        last_counts = None
+        while True:
+            job = job_queue.get(job_id, since=cursor)
+            if job is None:
+                yield f"event: end\ndata: {json.dumps({'status': 'not_found'})}\n\n"
+                return
+            if job['results'] or job['counts'] != last_counts:
+                yield f"event: progress\ndata: {json.dumps(job)}\n\n"
+                cursor, last_counts = job['cursor'], job['counts']
+            if job['status'] in ('completed', 'cancelled') and not job['results']:
+                yield f"event: end\ndata: {json.dumps({'status': job['status']})}\n\n"
+                return
+            time.sleep(JOB_EVENTS_INTERVAL)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a job (?purge=1 also deletes its images)"""
+    if request.args.get('purge'):
+        found = job_queue.delete(job_id)
+    else:
+        found = job_queue.cancel(job_id)
+    if not found:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'job_id': job_id, 'status': job_queue.get(job_id, limit=0)['status']})
+
+@app.route('/api/jobs/<job_id>/retry', methods=['POST'])
+def retry_job(job_id):
+    """Re-queue the images of a job that failed after all retries"""
+    if job_queue.get(job_id, limit=0) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'job_id': job_id, 'requeued': job_queue.retry_failed(job_id)})
+
+@app.route('/api/inventory', methods=['GET'])
+def inventory_info():
+    """Current server-side inventory version"""
+    current = inventory_store.current
+    if current is None:
+        return jsonify({'version': None, 'count': 0})
+    return jsonify(current.info())
+
+@app.route('/api/inventory', methods=['PUT', 'POST'])
+def sync_inventory():
+    """
+    Upload the full inventory once; detect requests then refer to its version
+    
+    Request (JSON):
+        - items: List of inventory items (or the list itself as body)
+        
+    Response:
+        - version: New inventory version ID
+        - count: Number of indexed items
+    """
+    payload = request.get_json(silent=True)
+    items = payload.get('items') if isinstance(payload, dict) else payload
+    if not isinstance(items, list):
+        return jsonify({'success': False, 'error': 'Expected a JSON list of inventory items'}), 400
+    
+    index = inventory_store.sync(items)
+    print(f"📦 Inventory synced: {len(index)} items (version {index.version})")
+    return jsonify({'success': True, **index.info()}), 200
+
+@app.route('/api/inventory', methods=['PATCH'])
+def update_inventory():
+    """
+    Apply an incremental inventory change
+    
+    Request (JSON):
+        - base_version: Version the change is based on (must be current)
+        - upsert: Items to add or replace, matched by id (or sku)
+        - delete: IDs (or SKUs) of items to remove
+        
+    Response:
+        - version: New inventory version ID (409 if base_version is stale)
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or 'base_version' not in payload:
+        return jsonify({'success': False, 'error': 'Expected JSON with base_version, upsert and/or delete'}), 400
+    
+    try:
+        index = inventory_store.apply_delta(payload['base_version'],
+                                            upserts=payload.get('upsert', []),
+                                            deletes=payload.get('delete', []))
+    except VersionConflict as e:
+        return jsonify({'success': False, 'error': str(e), 'current_version': e.current_version}), 409
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    print(f"📦 Inventory updated: {len(index)} items (version {index.version})")
+    return jsonify({'success': True, **index.info()}), 200
+
+@app.route('/api/models', methods=['GET'])
+def models_info():
+    """Registered model versions, the versions this server runs and the last hot swaps"""
+    model_registry.refresh()
+    return jsonify({
+        'models': model_registry.info(),
+        'loaded': {name: getattr(model, 'version', None)
+                   for name, model in (('classifier', classifier), ('detector', detector))},
+        'swaps': model_swaps
+    })
+
+def require_model_admin():
+    """
+    Check the current request's model admin token
+    
+    Returns:
+        Error response, or None if the request may change model versions
+    """
+    if not MODEL_ADMIN_TOKEN:
+        return jsonify({'success': False,
+                        'error': 'Model management over HTTP is disabled (set AIMS_MODEL_ADMIN_TOKEN, '
+                                 'or use python model_registry.py)'}), 403
+    auth = request.headers.get('Authorization', '')
+    if not (auth.startswith('Bearer ') and
+            hmac.compare_digest(auth[len('Bearer '):].encode(), MODEL_ADMIN_TOKEN.encode())):
+        return jsonify({'success': False, 'error': 'Invalid or missing admin token'}), 401
+    return None
+
+def trusted_weights_path(path):
+    """Resolved weights path if it lies under MODEL_WEIGHTS_DIR (symlinks followed), else None"""
+    weights_dir = os.path.realpath(MODEL_WEIGHTS_DIR)
+    resolved = os.path.realpath(path)
+    if os.path.commonpath([weights_dir, resolved]) != weights_dir:
+        return None
+    return resolved
+
+@app.route('/api/models/<name>/versions', methods=['POST'])
+def register_model_version(name):
+    """
+    Register new weights as a version of a model
+    
+    Request (JSON, with Authorization: Bearer <MODEL_ADMIN_TOKEN>):
+        - path: Weights path on the server, under MODEL_WEIGHTS_DIR (.pt or exported model)
+        - version: Version ID (optional, default: derived from the weights content)
+        - metadata: Free-form info, e.g. accuracy (optional)
+        - activate: Also switch to it (optional, default false)
+        
+    Response:
+        - version entry; 202 if a hot swap was started
+    """
+    error_response = require_model_admin()
+    if error_response:
+        return error_response
+    if name not in model_status:
+        return jsonify({'success': False, 'error': f'Unknown model: {name}'}), 404
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('path'), str) or not payload['path']:
+        return jsonify({'success': False, 'error': 'Expected JSON with path'}), 400
+    path = trusted_weights_path(payload['path'])
+    if path is None:
+        return jsonify({'success': False, 'error': f'Weights must be under {MODEL_WEIGHTS_DIR}/'}), 400
+    if not os.path.exists(path):
+        return jsonify({'success': False, 'error': f"Weights not found: {payload['path']}"}), 400
+    
+    entry = model_registry.register(name, path, version=payload.get('version'),
+                                    metadata=payload.get('metadata'), activate=bool(payload.get('activate')))
+    print(f"📦 Registered {name} {entry['version']} ({entry['path']})")
+    loaded = classifier if name == 'classifier' else detector
+    if payload.get('activate') and loaded is not None and loaded.version != entry['version']:
+        return jsonify({'success': True, **entry, 'swap': start_model_swap(name, entry)}), 202
+    return jsonify({'success': True, **entry}), 201
+
+@app.route('/api/models/<name>/activate', methods=['POST'])
+def activate_model_version(name):
+    """
+    Switch a model to a registered version (rollback = activate an older one)
+    
+    Request (JSON, with Authorization: Bearer <MODEL_ADMIN_TOKEN>):
+        - version: Registered version ID
+        
+    Response:
+        - version entry and the hot swap state (202 while it loads)
+    """
+    error_response = require_model_admin()
+    if error_response:
+        return error_response
+    if name not in model_status:
+        return jsonify({'success': False, 'error': f'Unknown model: {name}'}), 404
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not payload.get('version'):
+        return jsonify({'success': False, 'error': 'Expected JSON with version'}), 400
+    
+    try:
+        entry = model_registry.activate(name, payload['version'])
+    except KeyError as e:
+        return jsonify({'success': False, 'error': str(e.args[0])}), 404
+    
+    print(f"🔁 Activated {name} {entry['version']}")
+    loaded = classifier if name == 'classifier' else detector
+    if loaded is not None and loaded.version != entry['version']:
+        return jsonify({'success': True, **entry, 'swap': start_model_swap(name, entry)}), 202
+    # Not loaded here yet: the next load uses the new version
+    return jsonify({'success': True, **entry, 'swap': None}), 200
 
 @app.route('/uploads/<filename>', methods=['GET'])
 def serve_upload(filename):
-    """Serve uploaded/annotated images"""
-    from flask import send_from_directory
+    """Serve uploaded/annotated images (annotated ones are rendered on first request)"""
+    from flask import send_file, send_from_directory
+    path = upload_store.locate(filename)
+    if path is not None:
+        return send_file(os.path.abspath(path))
+    if filename.startswith('annotated_') and upload_store.path_for(filename) is not None:
+        annotated_bytes = render_annotation(filename)
+        if annotated_bytes is not None:
+            return Response(annotated_bytes, mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    # Files stored before content addressing (flat, UUID-named)
     return send_from_directory(UPLOAD_FOLDER, filename)
 
 @app.route('/api/train-info', methods=['GET'])
@@ -291,4 +1529,8 @@ if __name__ == '__main__':
     print(f"📊 Max file size: {MAX_FILE_SIZE / (1024*1024)}MB")
     print("\n✅ API ready at http://localhost:5001")
     
+    # Preload models, resume unfinished scan jobs (only in the reloader's serving process)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_services()
+    
     app.run(host='0.0.0.0', port=5001, debug=True)
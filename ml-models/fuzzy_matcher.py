@@ -0,0 +1,283 @@
+"""
+AIMS Fuzzy Matcher
+OCR-tolerant matching of text against inventory SKUs, barcodes and name
+words: candidates come from a character trigram index, and are confirmed
+with an approximate substring edit distance
+"""
+
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Characters EasyOCR confuses, folded to one representative in keys and text alike
+_CONFUSABLE = str.maketrans({'0': 'o', '1': 'l', 'i': 'l', '|': 'l', '5': 's', '8': 'b'})
+_NOT_ALNUM = re.compile(r'[^a-z0-9]+')
+
+GRAM = 3
+
+# Key roles
+SKU, BARCODE, NAME_WORD = 0, 1, 2
+
+# Fuzzy keys confirmed by edit distance per lookup (most trigram hits first)
+MAX_FUZZY_CANDIDATES = 64
+
+
+def normalize(text: str) -> str:
+    """Lowercase, fold OCR-confusable characters and drop everything but letters and digits"""
+    return _NOT_ALNUM.sub('', text.lower().translate(_CONFUSABLE))
+
+
+def allowed_edits(length: int) -> int:
+    """Edits tolerated in a key of this length (short keys must match exactly)"""
+    if length <= 4:
+        return 0
+    return 1 if length <= 8 else 2
+
+
+def substring_distance(key: str, text: str, max_distance: int) -> Optional[int]:
+    """
+    Fewest edits turning key into some substring of text (Myers' bit-parallel
+    algorithm: one pass over the text, the key's DP column packed in an int)
+
+    Returns:
+        Edit distance, or None if it is larger than max_distance
+    """
+    length = len(key)
+    char_masks: Dict[str, int] = {}
+    for i, char in enumerate(key):
+        char_masks[char] = char_masks.get(char, 0) | (1 << i)
+    mask = (1 << length) - 1
+    last = 1 << (length - 1)
+
+    positive, negative, score = mask, 0, length
+    best = length
+    for char in text:
+        eq = char_masks.get(char, 0)
+        xv = eq | negative
+        xh = (((eq & positive) + positive) ^ positive) | eq
+        horizontal_positive = negative | (~(xh | positive) & mask)
+        horizontal_negative = positive & xh
+        if horizontal_positive & last:
+            score += 1
+        elif horizontal_negative & last:
+            score -= 1
+        # No carry into the first row: a match may start anywhere in the text
+        horizontal_positive = (horizontal_positive << 1) & mask
+        horizontal_negative = (horizontal_negative << 1) & mask
+        positive = horizontal_negative | (~(xv | horizontal_positive) & mask)
+        negative = horizontal_positive & xv
+        best = min(best, score)
+    return best if best <= max_distance else None
+
+
+def _csr(rows: List[List[int]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Pack lists of ints into (offsets, values) arrays"""
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(row) for row in rows])
+    values = np.fromiter((value for row in rows for value in row), dtype=np.int32, count=int(offsets[-1]))
+    return offsets, values
+
+
+class FuzzyMatcher:
+    def __init__(self, entries: Sequence[Tuple[str, str, List[str]]]):
+        """
+        Index the match keys of inventory items
+
+        Args:
+            entries: (sku, barcode, name words) per item, in inventory order
+        """
+        self.size = len(entries)
+
+        keys: Dict[str, int] = {}
+        key_items: List[List[int]] = []
+        key_roles: List[List[int]] = []
+        key_starts: List[List[int]] = []  # Offset of a name word in its (normalized) name, -1 for codes
+        self._name_length = np.zeros(self.size)
+
+        for position, (sku, barcode, name_words) in enumerate(entries):
+            item_keys = [(normalize(sku), SKU, -1), (normalize(barcode), BARCODE, -1)]
+            for word in name_words:
+                key = normalize(word)
+                item_keys.append((key, NAME_WORD, int(self._name_length[position])))
+                self._name_length[position] += len(key)
+            for key, role, start in item_keys:
+                if not key:  # An empty SKU/barcode matches nothing
+                    continue
+                key_id = keys.setdefault(key, len(keys))
+                if key_id == len(key_items):
+                    key_items.append([])
+                    key_roles.append([])
+                    key_starts.append([])
+                key_items[key_id].append(position)
+                key_roles[key_id].append(role)
+                key_starts[key_id].append(start)
+
+        self._keys = list(keys)
+        self._key_offsets, self._key_items = _csr(key_items)
+        self._key_roles = np.fromiter((role for roles in key_roles for role in roles), dtype=np.int8,
+                                      count=len(self._key_items))
+        self._key_starts = np.fromiter((start for starts in key_starts for start in starts), dtype=np.int32,
+                                       count=len(self._key_items))
+
+        # Trigram -> keys containing it
+        grams: Dict[str, int] = {}
+        gram_keys: List[List[int]] = []
+        key_grams = np.zeros(len(self._keys), dtype=np.int32)
+        self._short_keys = []  # Too short for trigrams: checked as plain substrings
+        for key_id, key in enumerate(self._keys):
+            if len(key) < GRAM:
+                self._short_keys.append(key_id)
+                continue
+            key_gram_set = {key[i:i + GRAM] for i in range(len(key) - GRAM + 1)}
+            key_grams[key_id] = len(key_gram_set)
+            for gram in key_gram_set:
+                gram_id = grams.setdefault(gram, len(grams))
+                if gram_id == len(gram_keys):
+                    gram_keys.append([])
+                gram_keys[gram_id].append(key_id)
+        self._grams = grams
+        self._gram_offsets, self._gram_keys = _csr(gram_keys)
+
+        # A key occurring with k edits still shares at least (distinct trigrams - 3k) trigrams with the text
+        edits = np.fromiter((allowed_edits(len(key)) for key in self._keys), dtype=np.int32, count=len(self._keys))
+        self._edits = edits
+        self._min_hits = np.maximum(1, key_grams - GRAM * edits)
+        self._key_grams = key_grams
+
+    def key_similarities(self, text: str) -> Dict[int, float]:
+        """
+        Keys occurring (approximately) in normalized text
+
+        Returns:
+            Key ID -> similarity (1 - edits / key length)
+        """
+        found = {key_id: 1.0 for key_id in self._short_keys if self._keys[key_id] in text}
+        if len(text) < GRAM:
+            return found
+
+        text_grams: Dict[str, List[int]] = {}  # Trigram -> its positions in the text
+        for i in range(len(text) - GRAM + 1):
+            text_grams.setdefault(text[i:i + GRAM], []).append(i)
+        gram_ids = [self._grams[gram] for gram in text_grams if gram in self._grams]
+        if not gram_ids:
+            return found
+        postings = np.concatenate([self._gram_keys[self._gram_offsets[g]:self._gram_offsets[g + 1]]
+                                   for g in gram_ids])
+        key_ids, hits = np.unique(postings, return_counts=True)
+        passed = hits >= self._min_hits[key_ids]
+        candidates, hits = key_ids[passed].tolist(), hits[passed].tolist()
+
+        text_bigrams = {text[i:i + 2] for i in range(len(text) - 1)}
+        fuzzy = []
+        for key_id, key_hits in zip(candidates, hits):
+            key = self._keys[key_id]
+            if key in text:
+                found[key_id] = 1.0
+                continue
+            edits = int(self._edits[key_id])
+            if not edits:
+                continue
+            # Bigram count filter (tighter than trigrams for short keys): each edit
+            # destroys at most 2 of the key's bigrams
+            if sum(key[i:i + 2] in text_bigrams for i in range(len(key) - 1)) < len(key) - 1 - 2 * edits:
+                continue
+            fuzzy.append((key_hits / self._key_grams[key_id], key_id))
+
+        # Edit distance only for the most promising inexact candidates
+        if len(fuzzy) > MAX_FUZZY_CANDIDATES:
+            fuzzy.sort(reverse=True)
+            fuzzy = fuzzy[:MAX_FUZZY_CANDIDATES]
+        for _, key_id in fuzzy:
+            key = self._keys[key_id]
+            edits = int(self._edits[key_id])
+            # Only where the shared trigrams put the key
+            starts = [position - offset for offset in range(len(key) - GRAM + 1)
+                      for position in text_grams.get(key[offset:offset + GRAM], ())]
+            window = text[max(0, min(starts) - edits):max(starts) + len(key) + edits]
+            distance = substring_distance(key, window, edits)
+            if distance is not None:
+                found[key_id] = 1.0 - distance / len(key)
+        return found
+
+    def scores(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Match scores (0-1) of the items sharing evidence with OCR text
+        (see _scores)
+
+        Returns:
+            Tuple of (item positions in inventory order, their scores)
+        """
+        items, scores, _ = self._scores(text)
+        return items, scores
+
+    def _scores(self, text: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Match scores (0-1) of the items sharing evidence with OCR text
+
+        An item's evidence is its SKU, its barcode and its name, each as
+        similar as the best-aligned part of the text; they are combined as
+        independent evidence (1 - product of misses). The name scores the
+        better of:
+        - the length-weighted share of the whole name found in the text
+        - the match between the text and the best-matching span of name
+          words (first to last word found): found length / the longer of
+          span and text, so "C0CA-C0LA" fully matches the "Coca-Cola" of
+          "Coca-Cola Classic 500ml", while extra unmatched text or a span
+          with words missing in between lowers it
+
+        Returns:
+            Tuple of (item positions in inventory order, their scores, share
+            of each item's name found)
+        """
+        text = normalize(text)
+        found = self.key_similarities(text)
+        if not found:
+            return np.zeros(0, dtype=np.int32), np.zeros(0), np.zeros(0)
+
+        slices = [(self._key_offsets[key_id], self._key_offsets[key_id + 1]) for key_id in found]
+        counts = [end - start for start, end in slices]
+        positions = np.concatenate([self._key_items[start:end] for start, end in slices])
+        roles = np.concatenate([self._key_roles[start:end] for start, end in slices])
+        starts = np.concatenate([self._key_starts[start:end] for start, end in slices])
+        similarities = np.repeat(list(found.values()), counts)
+        key_lengths = np.repeat([len(self._keys[key_id]) for key_id in found], counts)
+
+        # Only the items some found key belongs to
+        items, item_index = np.unique(positions, return_inverse=True)
+
+        def role_sum(role, weights):
+            mask = roles == role
+            return np.bincount(item_index[mask], weights=weights[mask], minlength=len(items))
+
+        sku = np.minimum(role_sum(SKU, similarities), 1.0)
+        barcode = np.minimum(role_sum(BARCODE, similarities), 1.0)
+        name_found = role_sum(NAME_WORD, similarities * key_lengths)
+        name_length = self._name_length[items]
+        whole_name = np.divide(name_found, name_length, out=np.zeros(len(items)), where=name_length > 0)
+
+        # Span of the found name words of each item
+        words = roles == NAME_WORD
+        span_start = np.full(len(items), np.iinfo(np.int32).max, dtype=np.int64)
+        span_end = np.zeros(len(items), dtype=np.int64)
+        np.minimum.at(span_start, item_index[words], starts[words])
+        np.maximum.at(span_end, item_index[words], starts[words] + key_lengths[words])
+        span = np.maximum(span_end - span_start, len(text))
+        best_span = np.divide(name_found, span, out=np.zeros(len(items)), where=span > 0)
+
+        name = np.minimum(np.maximum(whole_name, best_span), 1.0)
+        return items, 1.0 - (1.0 - sku) * (1.0 - barcode) * (1.0 - name), whole_name
+
+    def match(self, text: str) -> Tuple[Optional[int], float]:
+        """
+        Best matching item for OCR text
+
+        Returns:
+            Tuple of (item position or None, score 0-100; ties go to the
+            item with more of its name found, then to the first item)
+        """
+        items, scores, whole_name = self._scores(text)
+        if not len(items):
+            return None, 0.0
+        best = int(np.lexsort((-whole_name, -scores))[0])
+        return int(items[best]), round(float(scores[best]) * 100, 1)
@@ -0,0 +1,170 @@
+"""
+AIMS Hybrid Recognition
+Detect-then-classify for shelf photos: YOLOv8 finds the products, the
+trained grocery classifier recognizes all crops in one batched forward
+pass, and OCR only runs on crops the classifier isn't sure about
+"""
+
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+
+from image_io import NormalizedImage, load_image
+from inventory_index import InventoryIndex, TEXT_MATCH_THRESHOLD
+
+
+class HybridRecognizer:
+    def __init__(self, detector, classifier, ocr_confidence_threshold=0.6):
+        """
+        Combine a detector and a classifier
+
+        Args:
+            detector: ProductDetector (boxes and OCR)
+            classifier: ProductClassifier (product recognition of crops)
+            ocr_confidence_threshold: Crops classified below this confidence
+                are OCR'd (and matched by text too)
+        """
+        self.detector = detector
+        self.classifier = classifier
+        self.ocr_confidence_threshold = ocr_confidence_threshold
+
+    @property
+    def model_versions(self) -> Dict:
+        """Versions of the detector and classifier behind this pipeline's results"""
+        return {**self.detector.model_versions, **self.classifier.model_versions}
+
+    @property
+    def input_size(self) -> int:
+        """Detector input size (images are decoded for YOLO)"""
+        return self.detector.input_size
+
+    @property
+    def max_image_side(self) -> int:
+        """Longer side to decode images at (see ProductDetector.max_image_side)"""
+        return self.detector.max_image_side
+
+    def detect_products(self, image: Union[str, np.ndarray, NormalizedImage]) -> List[Dict]:
+        """Recognize the products in one image"""
+        return self.detect_products_batch([image])[0]
+
+    def detect_products_batch(self, images: List[Union[str, np.ndarray, NormalizedImage]]) -> List[List[Dict]]:
+        """
+        Recognize products in several images: one batched YOLOv8 call, one
+        batched classifier call over the crops of all images, then batched
+        OCR over the uncertain crops
+
+        Args:
+            images: List of image file paths, decoded BGR arrays or NormalizedImages
+
+        Returns:
+            List of detection lists, in input order
+        """
+        images = [image if isinstance(image, NormalizedImage) else load_image(image) for image in images]
+        boxes_per_image = self.detector.detect_boxes(images)
+        return self._recognize(list(zip(images, boxes_per_image)))
+
+    def detect_boxes(self, images: List[Union[np.ndarray, NormalizedImage]]) -> List[List[Dict]]:
+        """YOLOv8 stage only (see ProductDetector.detect_boxes)"""
+        return self.detector.detect_boxes(images)
+
+    def read_products(self, image: Union[np.ndarray, NormalizedImage], boxes: List[Dict]) -> List[Dict]:
+        """Classify (and if needed OCR) the boxes of one image (see ProductDetector.read_products)"""
+        return self._recognize([(image, boxes)])[0]
+
+    def _recognize(self, images_and_boxes: List[Tuple[Union[np.ndarray, NormalizedImage], List[Dict]]]) -> List[List[Dict]]:
+        cropped = [self.detector.crop_boxes(image, boxes) for image, boxes in images_and_boxes]
+
+        # One forward pass over every (non-empty) crop of every image
+        crops = [crop for _, image_crops in cropped for crop in image_crops if crop.size]
+        predictions = iter(self.classifier.classify_batch(crops) if crops else [])
+
+        # Crops the classifier isn't sure about (and that pass the detector's
+        # OCR gating policy) get a barcode decoding attempt, the rest is OCR'd
+        # together in one batched call
+        recognized = []
+        for (image, boxes), (_, image_crops) in zip(images_and_boxes, cropped):
+            image_predictions = [next(predictions) if crop.size else None for crop in image_crops]
+            uncertain = [idx for idx, (crop, prediction) in enumerate(zip(image_crops, image_predictions))
+                         if crop.size and (prediction['confidence'] if prediction else 0.0) < self.ocr_confidence_threshold]
+            skipped = self.detector.gate_ocr(boxes, image_crops, uncertain)
+            codes = self.detector.find_codes(image, boxes, image_crops,
+                                             [idx for idx in uncertain if idx not in skipped])
+            skipped.update((idx, 'barcode') for idx in codes)
+            recognized.append((image_predictions, {idx for idx in uncertain if idx not in skipped}, skipped, codes))
+        ocr_crops = [image_crops[idx] for (_, image_crops), (_, to_read, _, _) in zip(cropped, recognized)
+                     for idx in sorted(to_read)]
+        texts = iter(self.detector.read_text_batch(ocr_crops) if ocr_crops else [])
+
+        results = []
+        for (_, boxes), (bboxes, _), (image_predictions, to_read, skipped, codes) in zip(
+                images_and_boxes, cropped, recognized):
+            detected_products = []
+            for idx, (box, bbox, prediction) in enumerate(zip(boxes, bboxes, image_predictions)):
+                product_confidence = prediction['confidence'] if prediction else 0.0
+                needs_ocr = idx in to_read
+                detected_text, ocr_details = next(texts) if needs_ocr else ('', [])
+
+                detected_products.append({
+                    'id': idx,
+                    'bbox': bbox,
+                    'confidence': box['confidence'],
+                    'class': prediction['predicted_class'] if prediction else box['class'],
+                    'detector_class': box['class'],
+                    'product_confidence': product_confidence,
+                    'top_predictions': prediction['top_predictions'] if prediction else [],
+                    'detected_text': detected_text,
+                    'ocr_details': ocr_details,
+                    'ocr_used': needs_ocr,
+                    'ocr_skipped': skipped.get(idx),
+                    'barcode': codes.get(idx)
+                })
+            results.append(detected_products)
+        return results
+
+    def match_to_inventory(self, detected_products: List[Dict],
+                           inventory_items: Union[InventoryIndex, List[Dict]]) -> List[Dict]:
+        """
+        Match recognized products to inventory: by predicted class name,
+        and by OCR text for crops the classifier wasn't sure about
+
+        Args:
+            detected_products: Detections from detect_products()
+            inventory_items: InventoryIndex (or raw list of inventory items)
+
+        Returns:
+            List of matched products with inventory info
+        """
+        index = inventory_items if isinstance(inventory_items, InventoryIndex) else InventoryIndex(inventory_items)
+        matched_products = []
+
+        for detection in detected_products:
+            best_match, best_score, source = None, 0, None
+
+            if detection['top_predictions']:
+                class_matches = index.match_class_name(detection['class'].lower().replace('-', ' '))
+                if class_matches:
+                    best_match, _, best_score = class_matches[0]
+                    source = 'class'
+
+            # Low classifier confidence: a decoded barcode decides, else OCR text if it finds a match
+            code_match = index.match_code(detection['barcode']['data'])[0] if detection.get('barcode') else None
+            if code_match is not None:
+                best_match, best_score, source = code_match, 100.0, 'barcode'
+            elif detection['ocr_used'] and detection['detected_text']:
+                text_match, text_score = index.match_text(detection['detected_text'])
+                if text_score >= TEXT_MATCH_THRESHOLD:
+                    best_match, best_score, source = text_match, text_score, 'text'
+
+            matched_products.append({
+                **detection,
+                'matched_inventory': best_match,
+                'match_confidence': best_score,
+                'match_source': source,
+                'is_matched': best_match is not None and best_score >= TEXT_MATCH_THRESHOLD
+            })
+
+        return matched_products
+
+    def visualize_detections(self, image, detections: List[Dict], output_path: str = None):
+        """Draw boxes and labels (see ProductDetector.visualize_detections)"""
+        return self.detector.visualize_detections(image, detections, output_path)
@@ -0,0 +1,297 @@
+"""
+AIMS Image I/O
+In-memory decoding and encoding of uploaded images (size-limited reads,
+reduced-resolution decoding), and a cache of decoded images
+"""
+
+import io
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+
+# cv2 decode flags by downscale factor (JPEG is decoded directly at 1/2, 1/4, 1/8 size)
+_REDUCED_FLAGS = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+                  4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+_READ_CHUNK = 64 * 1024
+
+
+class FileTooLarge(ValueError):
+    def __init__(self, max_bytes: int):
+        super().__init__(f"File too large (max {max_bytes / (1024 * 1024):.0f}MB)")
+        self.max_bytes = max_bytes
+
+
+def read_limited(stream, max_bytes: int) -> bytes:
+    """
+    Read an upload stream, giving up as soon as it exceeds max_bytes
+
+    Uploads in a multipart form are already spooled by werkzeug when the
+    handler reads them; this bounds the bytes held in memory per file. The
+    body itself is bounded by the route's request size cap
+    (detection_api.ROUTE_MAX_REQUEST_SIZE), checked before it is read.
+
+    Args:
+        stream: File-like object (e.g. a werkzeug FileStorage)
+        max_bytes: Size limit
+
+    Returns:
+        File contents
+
+    Raises:
+        FileTooLarge: If the stream is larger than max_bytes
+    """
+    chunks = []
+    total = 0
+    while True:
+        chunk = stream.read(_READ_CHUNK)
+        if not chunk:
+            return b''.join(chunks)
+        total += len(chunk)
+        if total > max_bytes:
+            raise FileTooLarge(max_bytes)
+        chunks.append(chunk)
+
+
+def save_limited(stream, dest, max_bytes: int) -> int:
+    """
+    Copy an upload stream to an open file, giving up beyond max_bytes
+
+    Returns:
+        Number of bytes written
+
+    Raises:
+        FileTooLarge: If the stream is larger than max_bytes
+    """
+    total = 0
+    while True:
+        chunk = stream.read(_READ_CHUNK)
+        if not chunk:
+            return total
+        total += len(chunk)
+        if total > max_bytes:
+            raise FileTooLarge(max_bytes)
+        dest.write(chunk)
+
+
+def image_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Read (width, height) from the image header, without decoding pixels
+
+    Returns:
+        Size as stored (before EXIF rotation), or None if unknown
+    """
+    try:
+        from PIL import Image
+        with Image.open(io.BytesIO(data)) as header:
+            return header.size
+    except Exception:
+        return None
+
+
+def decode_image(data: bytes, max_side: int = None, min_side: int = None) -> np.ndarray:
+    """
+    Decode encoded image bytes (JPEG/PNG/WebP/BMP) into a BGR array,
+    optionally downscaled
+
+    Downscaled JPEGs are decoded at 1/2, 1/4 or 1/8 resolution directly
+    (never materializing the full image), then resized to the target.
+
+    Args:
+        data: Raw file contents
+        max_side: Downscale so the longer side is at most this
+        min_side: ... but keep the shorter side at least this
+
+    Returns:
+        Decoded image as numpy array (same layout as cv2.imread)
+    """
+    scale = 1.0
+    size = image_size(data) if max_side or min_side else None
+    if size is not None:
+        if max_side:
+            scale = min(1.0, max_side / max(size))
+        if min_side:
+            floor = min(1.0, min_side / min(size))
+            scale = max(scale, floor) if max_side else floor
+
+    # Largest reduction that still leaves at least the target resolution
+    factor = 1
+    for candidate in (8, 4, 2):
+        if scale * candidate <= 1.0:
+            factor = candidate
+            break
+
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), _REDUCED_FLAGS[factor])
+    if image is None:
+        raise ValueError("Could not decode image data")
+
+    if scale < 1.0:
+        target_long = max(1, int(round(max(size) * scale)))
+        height, width = image.shape[:2]
+        if max(height, width) > target_long:
+            ratio = target_long / max(height, width)
+            image = cv2.resize(image, (max(1, int(round(width * ratio))), max(1, int(round(height * ratio)))),
+                               interpolation=cv2.INTER_AREA)
+    return image
+
+
+class NormalizedImage:
+    def __init__(self, data: bytes, max_side: int = None, min_side: int = None, crop_max_side: int = None):
+        """
+        An upload prepared for inference: a downscaled working copy for the
+        models, plus crops of boxes at (near) full resolution for OCR
+
+        Args:
+            data: Encoded file contents
+            max_side: Longer side of the working copy (see decode_image)
+            min_side: Shorter side of the working copy (see decode_image)
+            crop_max_side: Bound on the resolution crops are taken from
+                (None = full resolution)
+        """
+        self.data = data
+        self.crop_max_side = crop_max_side
+        self.image = decode_image(data, max_side=max_side, min_side=min_side)
+
+        height, width = self.image.shape[:2]
+        size = image_size(data)
+        if size is None:
+            self.original_size = (width, height)
+        elif (size[0] >= size[1]) == (width >= height):
+            self.original_size = size
+        else:
+            self.original_size = (size[1], size[0])  # EXIF-rotated on decode
+        # Original pixels per working copy pixel
+        self.scale = max(self.original_size) / max(width, height)
+
+    @property
+    def shape(self):
+        return self.image.shape
+
+    def to_original(self, bbox: List[int]) -> List[int]:
+        """Map a working copy box to original image coordinates"""
+        width, height = self.original_size
+        x1, y1, x2, y2 = (int(round(v * self.scale)) for v in bbox)
+        return [max(0, x1), max(0, y1), min(width, x2), min(height, y2)]
+
+    def source(self) -> np.ndarray:
+        """
+        High resolution decode (bounded by crop_max_side) that crops and
+        full-image barcode decoding read from; not kept after the call
+        """
+        if self.scale == 1.0:
+            return self.image
+        return _decode_bounded(self.data, self.crop_max_side)
+
+    def crops(self, bboxes: List[List[int]]) -> List[np.ndarray]:
+        """
+        Cut boxes (original coordinates) out of the high resolution image
+
+        The high resolution decode only lives for the duration of this call.
+
+        Returns:
+            One crop per box (in the crop source's resolution)
+        """
+        if not bboxes:
+            return []
+        source = self.source()
+        ratio = source.shape[1] / self.original_size[0]
+        crops = []
+        for x1, y1, x2, y2 in bboxes:
+            crops.append(source[int(y1 * ratio):int(round(y2 * ratio)),
+                                int(x1 * ratio):int(round(x2 * ratio))].copy())
+        return crops
+
+
+def _decode_bounded(data: bytes, max_side: int = None) -> np.ndarray:
+    """Decode at the lowest JPEG reduction keeping the longer side within max_side (if any)"""
+    size = image_size(data)
+    factor = 1
+    if max_side and size is not None:
+        for candidate in (1, 2, 4, 8):
+            factor = candidate
+            if max(size) / candidate <= max_side:
+                break
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), _REDUCED_FLAGS[factor])
+    if image is None:
+        raise ValueError("Could not decode image data")
+    return image
+
+
+def encode_image(image: np.ndarray, ext: str = 'jpg') -> bytes:
+    """
+    Encode a BGR array to image file bytes
+
+    Args:
+        image: Image as numpy array
+        ext: Target format extension (jpg, png, ...)
+
+    Returns:
+        Encoded file contents
+    """
+    ok, buffer = cv2.imencode(f".{ext.lstrip('.')}", image)
+    if not ok:
+        raise ValueError(f"Could not encode image as {ext}")
+    return buffer.tobytes()
+
+
+def load_image(image: Union[str, np.ndarray, NormalizedImage]) -> np.ndarray:
+    """
+    Accept either an image path or an already decoded array
+
+    Args:
+        image: Path to image file, decoded BGR array or NormalizedImage
+            (its working copy is returned)
+
+    Returns:
+        Decoded image as numpy array
+    """
+    if isinstance(image, np.ndarray):
+        return image
+    if isinstance(image, NormalizedImage):
+        return image.image
+    decoded = cv2.imread(image)
+    if decoded is None:
+        raise ValueError(f"Could not read image from {image}")
+    return decoded
+
+
+class DecodedImageCache:
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        """
+        LRU cache of decoded images, bounded by pixel memory (images too
+        large to keep decoded can be kept as their encoded bytes instead)
+
+        Args:
+            max_bytes: Memory bound (sum of array and bytes sizes)
+        """
+        self.max_bytes = max_bytes
+        self._images = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Union[np.ndarray, bytes]]:
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+            return image
+
+    def put(self, key: str, image: Union[np.ndarray, bytes]):
+        if _nbytes(image) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._images:
+                self._bytes -= _nbytes(self._images.pop(key))
+            self._images[key] = image
+            self._bytes += _nbytes(image)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._images.popitem(last=False)
+                self._bytes -= _nbytes(evicted)
+
+
+def _nbytes(image: Union[np.ndarray, bytes]) -> int:
+    return image.nbytes if isinstance(image, np.ndarray) else len(image)
@@ -0,0 +1,270 @@
+"""
+AIMS Inference Engines
+Runs YOLOv8 weights on CPU through PyTorch, ONNX Runtime or OpenVINO.
+Non-PyTorch engines use a model exported once next to the .pt weights
+(re-exported when the weights change); if the runtime is missing, the
+export fails or the parity check disagrees, PyTorch is used instead.
+
+Usage (export, parity check and latency comparison):
+    python inference_engine.py --weights weights/grocery_classifier_best.pt --engine onnx --images samples/
+"""
+
+import importlib
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from result_cache import weights_identity
+
+ENGINES = ('pytorch', 'onnx', 'openvino')
+
+# Python package each engine needs at runtime
+_RUNTIMES = {'onnx': 'onnxruntime', 'openvino': 'openvino'}
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def model_input_size(model, default: int = 640) -> int:
+    """Training image size of an ultralytics model (square, in pixels)"""
+    imgsz = model.overrides.get('imgsz') or default
+    return max(imgsz) if isinstance(imgsz, (list, tuple)) else int(imgsz)
+
+
+def artifact_engine(path: str) -> Optional[str]:
+    """Engine an already exported model belongs to (None for PyTorch weights)"""
+    path = path.rstrip('/\\')
+    if path.endswith('.onnx'):
+        return 'onnx'
+    if path.endswith('_openvino_model') or path.endswith('.xml'):
+        return 'openvino'
+    return None
+
+
+def _artifact_input_size(path: str, engine: str) -> Optional[int]:
+    """Input size stored in an exported model's ultralytics metadata"""
+    try:
+        if engine == 'openvino':
+            import yaml
+            directory = path if os.path.isdir(path) else os.path.dirname(path)
+            with open(os.path.join(directory, 'metadata.yaml'), 'r', encoding='utf-8') as f:
+                imgsz = yaml.safe_load(f).get('imgsz')
+        else:
+            import ast
+            import onnxruntime
+            session = onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+            imgsz = ast.literal_eval(session.get_modelmeta().custom_metadata_map['imgsz'])
+    except Exception:
+        return None
+    return max(imgsz) if isinstance(imgsz, (list, tuple)) else int(imgsz)
+
+
+def _manifest_path(weights: str, engine: str, variant: str) -> str:
+    stem = os.path.splitext(weights)[0]
+    return f"{stem}.{engine}{'_' + variant if variant else ''}.json"
+
+
+def export_model(weights: str, engine: str, variant: str = '', force: bool = False,
+                 **export_args) -> Tuple[str, int]:
+    """
+    Export weights for an engine, reusing a previous export of the same weights
+
+    Args:
+        weights: PyTorch .pt weights
+        engine: 'onnx' or 'openvino'
+        variant: Name distinguishing exports with different settings (e.g. 'int8')
+        force: Export again even if an up to date export exists
+        **export_args: Extra ultralytics export() arguments
+
+    Returns:
+        Tuple of (exported model path, input size)
+    """
+    manifest_path = _manifest_path(weights, engine, variant)
+    source = weights_identity(weights)
+    if os.path.exists(manifest_path) and not force:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('source') == source and manifest.get('export_args') == export_args \
+                and os.path.exists(manifest['path']):
+            return manifest['path'], manifest['imgsz']
+
+    from ultralytics import YOLO
+
+    print(f"📦 Exporting {weights} for {engine}{' (' + variant + ')' if variant else ''}...")
+    model = YOLO(weights)
+    imgsz = model_input_size(model)
+    # Dynamic axes, so batched calls (scheduler, batch pipeline) keep working
+    path = str(model.export(format=engine, imgsz=imgsz, dynamic=True, **export_args))
+
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump({'source': source, 'path': path, 'imgsz': imgsz, 'export_args': export_args}, f, indent=2)
+    print(f"✅ Exported: {path}")
+    return path, imgsz
+
+
+def load_model(weights: str, engine: str = 'pytorch', task: str = None,
+               parity_images: Optional[str] = None, variant: str = '', **export_args):
+    """
+    Load YOLOv8 weights on the requested engine, falling back to PyTorch
+
+    An already exported model (.onnx file or *_openvino_model directory,
+    e.g. from quantize_classifier.py) is loaded as-is on its own engine.
+
+    Args:
+        weights: PyTorch .pt weights, or an exported model
+        engine: 'pytorch', 'onnx' or 'openvino'
+        task: 'classify' or 'detect' (exported models don't always carry it)
+        parity_images: Directory of sample images; if set, the exported model
+            must agree with PyTorch on them (see check_parity) or it isn't used
+        variant: See export_model
+        **export_args: See export_model
+
+    Returns:
+        Tuple of (ultralytics model, engine actually used)
+    """
+    from ultralytics import YOLO
+
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown inference engine: {engine} (choose from {ENGINES})")
+
+    exported = artifact_engine(weights)
+    if exported is not None:
+        model = YOLO(weights, task=task)
+        imgsz = _artifact_input_size(weights, exported)
+        if imgsz:
+            model.overrides['imgsz'] = imgsz
+        return model, exported
+
+    if engine != 'pytorch':
+        try:
+            importlib.import_module(_RUNTIMES[engine])
+            path, imgsz = export_model(weights, engine, variant, **export_args)
+            model = YOLO(path, task=task)
+            model.overrides['imgsz'] = imgsz  # Exported models would predict at the default size
+
+            if parity_images:
+                report = check_parity(YOLO(weights), model, list_images(parity_images))
+                if not report['passed']:
+                    raise RuntimeError(f"parity check failed on {len(report['mismatches'])}/{report['images']} images")
+                print(f"✅ {engine} parity check passed on {report['images']} images")
+                model.predictor = None  # Runtime session is created again on first use
+            return model, engine
+        except Exception as e:
+            print(f"⚠️  {engine} engine not used for {weights} ({e}), falling back to PyTorch")
+
+    return YOLO(weights), 'pytorch'
+
+
+def list_images(directory: str, limit: int = 32) -> List[str]:
+    """Up to limit image paths from a directory (recursively, sorted)"""
+    paths = []
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(dirpath, filename))
+    return sorted(paths)[:limit]
+
+
+def _iou(a, b) -> float:
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    intersection = max(0.0, ix2 - ix1) * max(0.0, iy2 - iy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def check_parity(reference, candidate, images: List[str], top_k: int = 5, iou_threshold: float = 0.8) -> Dict:
+    """
+    Check that two models (e.g. PyTorch and its export) agree
+
+    Classification: same top-1 class and same set of top-k classes.
+    Detection: each of the top-k most confident reference boxes has a
+    candidate box of the same class with IoU >= iou_threshold.
+
+    Args:
+        reference: Reference ultralytics model (PyTorch)
+        candidate: Model to check
+        images: Image paths to compare on
+        top_k: Number of top predictions compared per image
+        iou_threshold: Min IoU for detection boxes to count as the same
+
+    Returns:
+        Dict with passed, images and mismatches (per image details)
+    """
+    if not images:
+        raise ValueError("No images for the parity check")
+
+    mismatches = []
+    for image in images:
+        expected = reference(image, verbose=False)[0]
+        actual = candidate(image, verbose=False)[0]
+
+        if expected.probs is not None:
+            expected_top = [int(i) for i in expected.probs.top5[:top_k]]
+            actual_top = [int(i) for i in actual.probs.top5[:top_k]]
+            if expected_top[0] != actual_top[0] or set(expected_top) != set(actual_top):
+                mismatches.append({'image': image, 'expected': expected_top, 'actual': actual_top})
+            continue
+
+        expected_boxes = sorted(expected.boxes.data.tolist(), key=lambda box: box[4], reverse=True)[:top_k]
+        actual_boxes = actual.boxes.data.tolist()
+        missing = [box for box in expected_boxes
+                   if not any(int(other[5]) == int(box[5]) and _iou(box[:4], other[:4]) >= iou_threshold
+                              for other in actual_boxes)]
+        if missing:
+            mismatches.append({'image': image, 'missing_boxes': missing})
+
+    return {'passed': not mismatches, 'images': len(images), 'mismatches': mismatches}
+
+
+def measure_latency(model, images: List[str], runs: int = 3) -> float:
+    """Median per-image latency in milliseconds (after one warmup pass)"""
+    for image in images[:1]:
+        model(image, verbose=False)
+    timings = []
+    for _ in range(runs):
+        for image in images:
+            start = time.perf_counter()
+            model(image, verbose=False)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Export a model for a CPU inference engine and check it against PyTorch')
+    parser.add_argument('--weights', type=str, default='weights/grocery_classifier_best.pt',
+                        help='PyTorch weights')
+    parser.add_argument('--engine', type=str, default='onnx', choices=[e for e in ENGINES if e != 'pytorch'],
+                        help='Engine to export for')
+    parser.add_argument('--task', type=str, default=None, choices=['classify', 'detect'],
+                        help='Model task (default: from the weights)')
+    parser.add_argument('--images', type=str, required=True,
+                        help='Directory of sample images for the parity check')
+    parser.add_argument('--top-k', type=int, default=5,
+                        help='Top predictions compared per image')
+
+    args = parser.parse_args()
+
+    from ultralytics import YOLO
+
+    samples = list_images(args.images)
+    reference = YOLO(args.weights)
+    candidate, used = load_model(args.weights, args.engine, task=args.task or reference.task)
+    if used != args.engine:
+        sys.exit(1)
+
+    report = check_parity(reference, candidate, samples, top_k=args.top_k)
+    print(f"\n🔍 Parity ({args.engine} vs PyTorch, top-{args.top_k}): "
+          f"{'✅ passed' if report['passed'] else '❌ failed'} on {report['images']} images")
+    for mismatch in report['mismatches']:
+        print(f"   {mismatch}")
+
+    print("\n⏱️  Median latency per image:")
+    print(f"   PyTorch: {measure_latency(reference, samples):.1f} ms")
+    print(f"   {args.engine}: {measure_latency(candidate, samples):.1f} ms")
+
+    sys.exit(0 if report['passed'] else 1)
@@ -0,0 +1,226 @@
+"""
+AIMS Inference Scheduler
+Coalesces concurrent inference requests into batched model calls
+"""
+
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, TimeoutError as FuturesTimeout
+from typing import Any, Callable, Dict, List, Optional
+
+# Queue wait histogram bucket upper bounds (milliseconds)
+WAIT_BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000]
+
+
+class DeadlineExceeded(TimeoutError):
+    """The caller's deadline passed before its input reached the model (or before the model finished)"""
+
+    def __init__(self, message: str, running: Optional[Future] = None):
+        super().__init__(message)
+        # Future of the batch the input was already running in (it can't be stopped)
+        self.running = running
+
+
+class InferenceScheduler:
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]], max_batch_size=8,
+                 max_wait_ms=10, name='inference'):
+        """
+        Initialize the scheduler
+
+        Args:
+            batch_fn: Function taking a list of inputs and returning a list of
+                results in the same order (one batched model call)
+            max_batch_size: Maximum number of requests coalesced into one call
+            max_wait_ms: Maximum time the oldest queued request waits for
+                the batch to fill up before it is dispatched anyway
+            name: Name used in logs and stats
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+        self.name = name
+
+        self._queue = []  # (item, future, enqueued_at, deadline)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+
+        # Stats
+        self._requests = 0
+        self._batches = 0
+        self._failures = 0
+        self._expired = 0
+        self._batch_sizes = Counter()
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_buckets = Counter()
+
+    def submit(self, item: Any, deadline: Optional[float] = None) -> Future:
+        """
+        Queue an input for the next batch
+
+        Args:
+            item: Single model input (image path or array)
+            deadline: time.monotonic() after which the result isn't wanted
+                anymore; the input is then dropped before the model call
+
+        Returns:
+            Future resolved with this input's result (DeadlineExceeded if dropped)
+        """
+        future = Future()
+        with self._cond:
+            self._ensure_worker()
+            self._queue.append((item, future, time.monotonic(), deadline))
+            self._cond.notify()
+        return future
+
+    def run(self, item: Any, timeout: float = None, deadline: Optional[float] = None) -> Any:
+        """Submit an input and block until its result is ready (or the deadline passes)"""
+        future = self.submit(item, deadline)
+        if deadline is not None:
+            remaining = max(0.0, deadline - time.monotonic())
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        try:
+            return future.result(timeout=timeout)
+        except DeadlineExceeded:
+            raise
+        except FuturesTimeout:
+            # Still queued: the worker skips it; already running: it finishes regardless
+            running = None if future.cancel() else future
+            if deadline is not None and time.monotonic() >= deadline:
+                raise DeadlineExceeded(f"{self.name}: request deadline passed before inference finished", running)
+            raise
+
+    def _ensure_worker(self):
+        """Start the dispatch thread (again after a fork, threads don't survive it)"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._start_worker()
+
+    def _start_worker(self):
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._worker_loop,
+                                        name=f"{self.name}-scheduler", daemon=True)
+        self._thread.start()
+
+    def _next_batch(self) -> List:
+        """Block until a batch is full or its oldest request has waited max_wait"""
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+
+            deadline = self._queue[0][2] + self.max_wait
+            while len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = self._queue[:self.max_batch_size]
+            del self._queue[:self.max_batch_size]
+            return batch
+
+    def _worker_loop(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._run_batch(batch)
+            except BaseException as e:
+                # Fatal (e.g. SystemExit from a native library): fail this batch's
+                # callers instead of leaving them hanging, and keep dispatching in a
+                # new thread so queued requests aren't stranded
+                print(f"❌ {self.name} scheduler thread died ({e!r}), restarting")
+                for _, future, _, _ in batch:
+                    if not future.done():
+                        future.set_exception(RuntimeError(f"{self.name}: inference failed: {e!r}"))
+                with self._cond:
+                    self._start_worker()
+                raise
+
+    def _run_batch(self, batch: List):
+        # Skip requests whose caller already gave up
+        batch = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+        batch = self._drop_expired(batch)
+        if not batch:
+            return
+
+        self._record_batch(batch)
+        items = [entry[0] for entry in batch]
+
+        try:
+            results = self.batch_fn(items)
+            if len(results) != len(items):
+                raise RuntimeError(f"{self.name}: batch_fn returned {len(results)} results for {len(items)} inputs")
+            for (_, future, _, _), result in zip(batch, results):
+                future.set_result(result)
+        except Exception as e:
+            if len(batch) == 1:
+                self._failures += 1
+                batch[0][1].set_exception(e)
+                return
+            # One bad input shouldn't fail the whole batch: retry individually,
+            # except inputs whose deadline passed during the failed call
+            print(f"⚠️  {self.name} batch of {len(batch)} failed ({e}), retrying one by one")
+            for entry in batch:
+                item, future = entry[0], entry[1]
+                if not self._drop_expired([entry], 'during a failed batch'):
+                    continue
+                try:
+                    future.set_result(self.batch_fn([item])[0])
+                except Exception as item_error:
+                    self._failures += 1
+                    future.set_exception(item_error)
+
+    def _drop_expired(self, batch: List, where: str = 'in the queue') -> List:
+        """Fail inputs whose deadline already passed instead of running them"""
+        now = time.monotonic()
+        kept = []
+        for entry in batch:
+            deadline = entry[3]
+            if deadline is not None and now >= deadline:
+                self._expired += 1
+                entry[1].set_exception(DeadlineExceeded(f"{self.name}: request deadline passed {where}"))
+            else:
+                kept.append(entry)
+        return kept
+
+    def _record_batch(self, batch: List):
+        now = time.monotonic()
+        with self._cond:
+            self._batches += 1
+            self._requests += len(batch)
+            self._batch_sizes[len(batch)] += 1
+            for _, _, enqueued_at, _ in batch:
+                wait = now - enqueued_at
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+                wait_ms = wait * 1000
+                bucket = next((b for b in WAIT_BUCKETS_MS if wait_ms <= b), None)
+                self._wait_buckets[f"le_{bucket}ms" if bucket is not None else 'inf'] += 1
+
+    def stats(self) -> Dict:
+        """
+        Get scheduler counters
+
+        Returns:
+            Dict with batch-size distribution and queue wait statistics
+        """
+        with self._cond:
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'queued': len(self._queue),
+                'requests': self._requests,
+                'batches': self._batches,
+                'failures': self._failures,
+                'expired': self._expired,
+                'avg_batch_size': round(self._requests / self._batches, 2) if self._batches else 0,
+                'batch_size_distribution': {str(k): v for k, v in sorted(self._batch_sizes.items())},
+                'queue_wait': {
+                    'avg_ms': round(self._wait_total / self._requests * 1000, 2) if self._requests else 0,
+                    'max_ms': round(self._wait_max * 1000, 2),
+                    'buckets': dict(self._wait_buckets)
+                }
+            }
@@ -0,0 +1,438 @@
+"""
+AIMS Inventory Index
+Versioned, server-side inventory snapshots with precomputed match keys,
+so detect requests don't have to ship and re-parse the whole inventory
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl  # Serializes updates across processes sharing a disk_dir (POSIX)
+except ImportError:
+    fcntl = None
+
+from fuzzy_matcher import FuzzyMatcher
+from product_codes import barcode_key, extract_codes, sku_key
+
+
+def item_key(item: Dict):
+    """Identity of an inventory item for deltas (database id, falling back to SKU)"""
+    key = item.get('id')
+    return key if key is not None else item.get('sku')
+
+
+# Min match_text() score (0-100) for a text match to count
+TEXT_MATCH_THRESHOLD = 50
+
+# Version IDs as generated by InventoryIndex (also their file names in a disk_dir)
+VERSION_ID = re.compile(r'^[0-9a-f]{16}$')
+
+
+class InventoryIndex:
+    # Max distinct predicted class names whose matches are memoized per version
+    MAX_MEMOIZED_CLASSES = 4096
+
+    def __init__(self, items: Iterable[Dict], version: str = None):
+        """
+        Build an immutable index over inventory items
+
+        Args:
+            items: Inventory items (id, sku, barcode, name, ...)
+            version: Version ID (generated if omitted)
+        """
+        self.version = version or uuid.uuid4().hex[:16]
+        self.created_at = datetime.now().isoformat()
+
+        self.items: Dict = OrderedDict()
+        for position, item in enumerate(items):
+            key = item_key(item)
+            self.items[key if key is not None else f"_pos{position}"] = item
+
+        # Precomputed lowercase match keys, in inventory order
+        self._entries: List[Tuple[Dict, str, str, List[str], str]] = []
+        for item in self.items.values():
+            sku = str(item.get('sku') or '').lower()
+            barcode = str(item.get('barcode') or '').lower()
+            name = str(item.get('name') or '').lower()
+            name_words = [word for word in name.split() if len(word) > 3]
+            self._entries.append((item, sku, barcode, name_words, name))
+
+        # Code maps and the fuzzy matcher are built on the first text/code lookup
+        # (classification requests only ever match class names)
+        self._by_barcode: Optional[Dict[str, Dict]] = None
+        self._by_sku: Optional[Dict[str, Dict]] = None
+        self._matcher: Optional[FuzzyMatcher] = None
+        self._build_lock = threading.Lock()
+
+        self._class_matches: Dict[str, List[Tuple[Dict, str, float]]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.items)
+
+    def apply_delta(self, upserts: Iterable[Dict] = (), deletes: Iterable = ()) -> 'InventoryIndex':
+        """
+        Build the next version from this one (this index stays unchanged)
+
+        Args:
+            upserts: Items to add or replace (matched by id, then SKU)
+            deletes: IDs/SKUs of items to remove
+
+        Returns:
+            New InventoryIndex with a new version ID
+        """
+        items = OrderedDict(self.items)
+        for key in deletes:
+            items.pop(key, None)
+        for item in upserts:
+            key = item_key(item)
+            if key is None:
+                raise ValueError("Delta items need an 'id' or 'sku'")
+            items[key] = {**items[key], **item} if key in items else item
+        return InventoryIndex(items.values())
+
+    def prepare(self) -> 'InventoryIndex':
+        """Build the code maps and fuzzy matcher now, before the index serves requests"""
+        self._code_maps()
+        self._fuzzy_matcher()
+        return self
+
+    def _code_maps(self) -> Tuple[Dict[str, Dict], Dict[str, Dict]]:
+        """Exact barcode and SKU lookups (the first item listed wins, like ties in text matching)"""
+        if self._by_sku is None:
+            with self._build_lock:
+                if self._by_sku is None:
+                    by_barcode, by_sku = {}, {}
+                    for item in self.items.values():
+                        barcode = barcode_key(item.get('barcode'))
+                        if barcode:
+                            by_barcode.setdefault(barcode, item)
+                        sku = sku_key(item.get('sku'))
+                        if sku:
+                            by_sku.setdefault(sku, item)
+                    self._by_barcode = by_barcode
+                    self._by_sku = by_sku
+        return self._by_barcode, self._by_sku
+
+    def _fuzzy_matcher(self) -> FuzzyMatcher:
+        """OCR-tolerant text matching (trigram index over SKUs, barcodes and name words)"""
+        if self._matcher is None:
+            with self._build_lock:
+                if self._matcher is None:
+                    self._matcher = FuzzyMatcher([(sku, barcode, name_words)
+                                                  for _, sku, barcode, name_words, _ in self._entries])
+        return self._matcher
+
+    def match_text(self, detected_text: str) -> Tuple[Optional[Dict], float]:
+        """
+        Find the inventory item best matching OCR text
+
+        A barcode or SKU read in the text resolves the match directly (score
+        100, see match_code); otherwise OCR noise ("C0CA-C0LA", "Mi1k") is
+        tolerated: see FuzzyMatcher.scores for how SKU, barcode and name
+        word evidence is combined.
+
+        Args:
+            detected_text: OCR text of one detection
+
+        Returns:
+            Tuple of (best matching item or None, score 0-100;
+            TEXT_MATCH_THRESHOLD and above counts as a match)
+        """
+        item, _ = self.match_code(detected_text)
+        if item is not None:
+            return item, 100.0
+
+        position, score = self._fuzzy_matcher().match(detected_text)
+        if position is None:
+            return None, 0.0
+        return self._entries[position][0], score
+
+    def match_code(self, detected_text: str) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        Look up barcodes (check digit validated) and SKUs read in OCR text
+
+        Args:
+            detected_text: OCR text of one detection
+
+        Returns:
+            Tuple of (item, 'barcode' or 'sku'), or (None, None)
+        """
+        if not detected_text:
+            return None, None
+        by_barcode, by_sku = self._code_maps()
+        skus, barcodes = extract_codes(detected_text)
+        for barcode in barcodes:
+            item = by_barcode.get(barcode_key(barcode))
+            if item is not None:
+                return item, 'barcode'
+
+        # Labeled SKUs first, then any code-like token (has a digit) printed unlabeled
+        tokens = [token for token in detected_text.split() if len(token) >= 4 and any(c.isdigit() for c in token)]
+        for sku in skus + tokens:
+            item = by_sku.get(sku_key(sku))
+            if item is not None:
+                return item, 'sku'
+        return None, None
+
+    def match_class_name(self, predicted_name: str) -> List[Tuple[Dict, str, float]]:
+        """
+        Find inventory items matching a classifier class name
+
+        Results are memoized per version: the classifier only has a fixed
+        set of classes, so each one is resolved against the inventory once.
+
+        Args:
+            predicted_name: Normalized predicted class (lowercase, spaces)
+
+        Returns:
+            List of (item, match_type, match_score), best first
+        """
+        with self._lock:
+            cached = self._class_matches.get(predicted_name)
+        if cached is not None:
+            return cached
+
+        pred_words = set(predicted_name.split())
+        matches = []
+
+        for item, _, _, _, item_name in self._entries:
+            # Direct name match
+            if predicted_name in item_name or item_name in predicted_name:
+                matches.append((item, 'name_exact', 100))
+                continue
+
+            # Partial word match
+            item_words = set(item_name.split())
+            common_words = pred_words & item_words
+            if common_words:
+                match_score = (len(common_words) / max(len(pred_words), len(item_words))) * 100
+                if match_score > 30:  # Threshold
+                    matches.append((item, 'name_partial', match_score))
+
+        matches.sort(key=lambda match: match[2], reverse=True)
+
+        with self._lock:
+            if len(self._class_matches) < self.MAX_MEMOIZED_CLASSES:
+                self._class_matches[predicted_name] = matches
+        return matches
+
+    def info(self) -> Dict:
+        """Summary of this version"""
+        return {
+            'version': self.version,
+            'count': len(self.items),
+            'created_at': self.created_at
+        }
+
+
+class InventoryStore:
+    def __init__(self, keep_versions=4, keep_inline=8, disk_dir: str = None):
+        """
+        Hold the current inventory index plus a few recent versions, so
+        requests referring to the previous version keep working after a sync
+
+        Args:
+            keep_versions: Number of versions kept in memory (and on disk)
+            keep_inline: Number of inline inventories (sent with requests)
+                whose indexes are kept, by content
+            disk_dir: Directory versions are published to, so all worker
+                processes serve the same current version (None = this
+                process only)
+        """
+        self.keep_versions = max(1, keep_versions)
+        self.keep_inline = max(0, keep_inline)
+        self.disk_dir = disk_dir
+        self._versions: Dict[str, InventoryIndex] = OrderedDict()
+        self._inline: Dict[str, InventoryIndex] = OrderedDict()
+        self._current: Optional[InventoryIndex] = None
+        self._current_stamp = None  # mtime of the CURRENT file last read
+        self._lock = threading.Lock()
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @property
+    def current(self) -> Optional[InventoryIndex]:
+        if self.disk_dir:
+            self._refresh()
+        return self._current
+
+    def get(self, version: str) -> Optional[InventoryIndex]:
+        """
+        Look up an index by version ID ('latest' = current)
+
+        Returns:
+            InventoryIndex or None if the version is unknown/expired
+        """
+        if version == 'latest':
+            return self.current
+        with self._lock:
+            index = self._versions.get(version)
+        if index is None and self.disk_dir:
+            index = self._load(version)
+        return index
+
+    def inline(self, payload: str) -> Optional[InventoryIndex]:
+        """
+        Index of an inventory sent inline as JSON (legacy 'inventory' field)
+
+        Clients resend the same inventory with every request, so indexes are
+        cached by payload content: parsing and indexing happen once.
+
+        Returns:
+            InventoryIndex, or None for an empty inventory
+
+        Raises:
+            ValueError: If the payload isn't valid JSON
+        """
+        digest = hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+        with self._lock:
+            index = self._inline.get(digest)
+            if index is not None:
+                self._inline.move_to_end(digest)
+                return index
+
+        items = json.loads(payload)
+        if not items:
+            return None
+        index = InventoryIndex(items, version=f"inline-{digest}")
+        with self._lock:
+            self._inline[digest] = index
+            while len(self._inline) > self.keep_inline:
+                self._inline.popitem(last=False)
+        return index
+
+    def sync(self, items: Iterable[Dict]) -> InventoryIndex:
+        """Replace the inventory with a full snapshot"""
+        index = InventoryIndex(items).prepare()
+        with self._shared_lock():
+            self._write(index)
+            with self._lock:
+                self._publish_locked(index)
+        return index
+
+    def apply_delta(self, base_version: str, upserts: Iterable[Dict] = (), deletes: Iterable = ()) -> InventoryIndex:
+        """
+        Apply an incremental change on top of the current version
+
+        Args:
+            base_version: Version the delta was computed against (must be current)
+            upserts: Items to add or replace
+            deletes: IDs/SKUs of items to remove
+
+        Returns:
+            The new current index
+        """
+        with self._shared_lock():
+            current = self.current
+            if current is None or current.version != base_version:
+                raise VersionConflict(current.version if current else None)
+
+            # Built outside the lock, so lookups of existing versions don't wait for it
+            index = current.apply_delta(upserts, deletes)
+            index.prepare()
+            self._write(index)
+            with self._lock:
+                if self._current is not current:  # Another update won meanwhile
+                    raise VersionConflict(self._current.version if self._current else None)
+                self._publish_locked(index)
+        return index
+
+    def _publish_locked(self, index: InventoryIndex):
+        self._remember_locked(index)
+        self._current = index
+        if self.disk_dir:
+            self._current_stamp = _atomic_write(os.path.join(self.disk_dir, 'CURRENT'), index.version)
+
+    def _remember_locked(self, index: InventoryIndex):
+        self._versions[index.version] = index
+        while len(self._versions) > self.keep_versions:
+            self._versions.popitem(last=False)
+
+    @contextmanager
+    def _shared_lock(self):
+        """Serialize updates with the other processes publishing to disk_dir"""
+        if not self.disk_dir or fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.disk_dir, '.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _write(self, index: InventoryIndex):
+        """Store a version's items in disk_dir (dropping the oldest beyond keep_versions)"""
+        if not self.disk_dir:
+            return
+        _atomic_write(os.path.join(self.disk_dir, f"{index.version}.json"),
+                      json.dumps(list(index.items.values())))
+        files = sorted((os.path.getmtime(os.path.join(self.disk_dir, name)), name)
+                       for name in os.listdir(self.disk_dir)
+                       if name.endswith('.json') and VERSION_ID.match(name[:-len('.json')]))
+        for _, name in files[:-self.keep_versions]:
+            try:
+                os.remove(os.path.join(self.disk_dir, name))
+            except OSError:
+                pass
+
+    def _load(self, version: str) -> Optional[InventoryIndex]:
+        """Index of a version another process published (None if unknown or expired)"""
+        if not VERSION_ID.match(version):
+            return None
+        try:
+            with open(os.path.join(self.disk_dir, f"{version}.json"), 'r', encoding='utf-8') as f:
+                items = json.load(f)
+        except (OSError, ValueError):
+            return None
+        index = InventoryIndex(items, version=version).prepare()
+        with self._lock:
+            self._remember_locked(index)
+        return index
+
+    def _refresh(self):
+        """Follow the current version published by any process"""
+        path = os.path.join(self.disk_dir, 'CURRENT')
+        try:
+            stamp = os.stat(path).st_mtime_ns
+            if stamp == self._current_stamp:
+                return
+            with open(path, 'r', encoding='utf-8') as f:
+                version = f.read().strip()
+        except OSError:
+            return
+        current = self._current
+        if current is None or current.version != version:
+            index = self.get(version)
+            if index is None:
+                return
+            with self._lock:
+                if self._current is current:
+                    self._current = index
+        self._current_stamp = stamp
+
+
+def _atomic_write(path: str, text: str) -> int:
+    """Replace a file's contents in one step; returns its new mtime (ns)"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+    return os.stat(path).st_mtime_ns
+
+
+class VersionConflict(Exception):
+    def __init__(self, current_version: Optional[str]):
+        super().__init__(f"Inventory delta is not based on the current version ({current_version})")
+        self.current_version = current_version
@@ -0,0 +1,524 @@
+"""
+AIMS Scan Job Queue
+Asynchronous processing of large scan batches (e.g. nightly full-store audits):
+jobs are persisted in SQLite, images on disk, and processed by a pool of
+local worker processes with retries and cancellation
+"""
+
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import time
+import traceback
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from image_io import FileTooLarge, save_limited
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    mode TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    finished_seq INTEGER,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS idx_job_items_status ON job_items (status, job_id);
+"""
+
+# Job statuses: queued -> running -> completed | cancelled
+# Item statuses: pending -> running -> done | failed | cancelled
+ACTIVE_JOB_STATUSES = ('queued', 'running')
+
+
+def _now():
+    return datetime.now().isoformat()
+
+
+class JobStore:
+    def __init__(self, db_path: str):
+        """
+        SQLite-backed job store (one connection per operation, safe across
+        threads and processes)
+
+        Args:
+            db_path: Path to the SQLite database file
+        """
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def create_job(self, job_id: str, mode: str, items: List[Dict]):
+        """
+        Persist a new job
+
+        Args:
+            job_id: Job ID
+            mode: 'classification' or 'detection'
+            items: List of {'filename', 'path'} in upload order
+        """
+        now = _now()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('INSERT INTO jobs (id, mode, status, total, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                         (job_id, mode, 'queued', len(items), now, now))
+            conn.executemany(
+                'INSERT INTO job_items (job_id, idx, filename, path, status, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                [(job_id, idx, item['filename'], item['path'], 'pending', now) for idx, item in enumerate(items)])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def claim(self, limit: int) -> List[Dict]:
+        """
+        Atomically claim up to limit pending items of the oldest active job
+
+        Returns:
+            Claimed items (job_id, idx, filename, path, attempts, mode)
+        """
+        now = _now()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute(
+                """SELECT i.job_id, i.idx, i.filename, i.path, i.attempts, j.mode
+                   FROM job_items i JOIN jobs j ON j.id = i.job_id
+                   WHERE i.status = 'pending' AND j.status IN (?, ?)
+                   ORDER BY j.created_at, i.job_id, i.idx
+                   LIMIT ?""", (*ACTIVE_JOB_STATUSES, limit)).fetchall()
+            # Keep a claim within one job (one inventory, one mode)
+            rows = [row for row in rows if row['job_id'] == rows[0]['job_id']] if rows else []
+            for row in rows:
+                conn.execute("UPDATE job_items SET status = 'running', attempts = attempts + 1, updated_at = ? "
+                             "WHERE job_id = ? AND idx = ?", (now, row['job_id'], row['idx']))
+            if rows:
+                conn.execute("UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ? AND status = 'queued'",
+                             (now, rows[0]['job_id']))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        return [{**dict(row), 'attempts': row['attempts'] + 1} for row in rows]
+
+    def finish_item(self, job_id: str, idx: int, result: Dict = None, error: str = None,
+                    retry: bool = False):
+        """
+        Record the outcome of a claimed item
+
+        Args:
+            job_id: Job ID
+            idx: Item index
+            result: Result dict (success)
+            error: Error message (failure)
+            retry: Put a failed item back in the queue instead of failing it
+        """
+        now = _now()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            if retry:
+                conn.execute("UPDATE job_items SET status = 'pending', error = ?, updated_at = ? "
+                             "WHERE job_id = ? AND idx = ? AND status = 'running'", (error, now, job_id, idx))
+            else:
+                seq = conn.execute('SELECT COALESCE(MAX(finished_seq), 0) + 1 FROM job_items WHERE job_id = ?',
+                                   (job_id,)).fetchone()[0]
+                conn.execute("UPDATE job_items SET status = ?, result = ?, error = ?, finished_seq = ?, updated_at = ? "
+                             "WHERE job_id = ? AND idx = ?",
+                             ('failed' if error else 'done', json.dumps(result) if result is not None else None,
+                              error, seq, now, job_id, idx))
+            self._update_job_status(conn, job_id, now)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _update_job_status(conn: sqlite3.Connection, job_id: str, now: str):
+        """Mark a running job completed once no item is pending or running"""
+        open_items = conn.execute("SELECT COUNT(*) FROM job_items WHERE job_id = ? AND status IN ('pending', 'running')",
+                                  (job_id,)).fetchone()[0]
+        if open_items == 0:
+            conn.execute("UPDATE jobs SET status = 'completed', updated_at = ? WHERE id = ? AND status IN (?, ?)",
+                         (now, job_id, *ACTIVE_JOB_STATUSES))
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a job: pending items are dropped, running items finish
+
+        Returns:
+            False if the job doesn't exist
+        """
+        now = _now()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            updated = conn.execute("UPDATE jobs SET status = 'cancelled', updated_at = ? WHERE id = ? AND status IN (?, ?)",
+                                   (now, job_id, *ACTIVE_JOB_STATUSES)).rowcount
+            conn.execute("UPDATE job_items SET status = 'cancelled', updated_at = ? WHERE job_id = ? AND status = 'pending'",
+                         (now, job_id))
+            exists = updated or conn.execute('SELECT 1 FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        return bool(exists)
+
+    def retry_failed(self, job_id: str) -> int:
+        """
+        Re-queue all permanently failed items of a job
+
+        Returns:
+            Number of items re-queued
+        """
+        now = _now()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            count = conn.execute("UPDATE job_items SET status = 'pending', attempts = 0, finished_seq = NULL, "
+                                 "updated_at = ? WHERE job_id = ? AND status = 'failed'", (now, job_id)).rowcount
+            if count:
+                conn.execute("UPDATE jobs SET status = 'queued', updated_at = ? WHERE id = ? AND status = 'completed'",
+                             (now, job_id))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        return count
+
+    def recover(self):
+        """Put items left 'running' by a crashed/restarted worker back in the queue"""
+        conn = self._connect()
+        try:
+            conn.execute("UPDATE job_items SET status = 'pending', updated_at = ? WHERE status = 'running'", (_now(),))
+        finally:
+            conn.close()
+
+    def get_job(self, job_id: str, since: int = 0, limit: int = 500) -> Optional[Dict]:
+        """
+        Get job progress and results finished after a cursor
+
+        Args:
+            job_id: Job ID
+            since: Return results with finished_seq greater than this
+            limit: Max results returned
+
+        Returns:
+            Job dict (None if unknown) with counts, progress and results;
+            'cursor' is the value to pass as since on the next poll
+        """
+        conn = self._connect()
+        try:
+            job = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if job is None:
+                return None
+            counts = {row['status']: row['n'] for row in conn.execute(
+                'SELECT status, COUNT(*) AS n FROM job_items WHERE job_id = ? GROUP BY status', (job_id,))}
+            rows = conn.execute(
+                """SELECT idx, filename, status, attempts, result, error, finished_seq FROM job_items
+                   WHERE job_id = ? AND finished_seq > ? ORDER BY finished_seq LIMIT ?""",
+                (job_id, since, limit)).fetchall()
+        finally:
+            conn.close()
+
+        finished = counts.get('done', 0) + counts.get('failed', 0) + counts.get('cancelled', 0)
+        results = [{
+            'index': row['idx'],
+            'filename': row['filename'],
+            'status': row['status'],
+            'attempts': row['attempts'],
+            'result': json.loads(row['result']) if row['result'] else None,
+            'error': row['error']
+        } for row in rows]
+
+        return {
+            'job_id': job['id'],
+            'mode': job['mode'],
+            'status': job['status'],
+            'total': job['total'],
+            'counts': {status: counts.get(status, 0) for status in ('pending', 'running', 'done', 'failed', 'cancelled')},
+            'progress': round(finished / job['total'], 4) if job['total'] else 1.0,
+            'created_at': job['created_at'],
+            'updated_at': job['updated_at'],
+            'results': results,
+            'cursor': rows[-1]['finished_seq'] if rows else since
+        }
+
+
+class JobQueue:
+    def __init__(self, jobs_dir: str, loaders: Dict[str, Callable], workers=2, max_retries=3,
+                 max_file_size=None, worker_batch_size=8, poll_interval=0.5, ocr_max_side=None):
+        """
+        Initialize the job queue
+
+        Args:
+            jobs_dir: Directory holding the job database and uploaded images
+            loaders: Mode -> picklable model loader (e.g. model_loader.ModeLoader),
+                called inside each worker process; it is pickled into the
+                workers, so it must not live in a module with import side effects
+            workers: Number of worker processes
+            max_retries: Attempts per image before it is marked failed
+            max_file_size: Largest accepted image in bytes (None = no limit)
+            worker_batch_size: Images a worker claims (and infers) at once
+            poll_interval: Seconds an idle worker waits before polling again
+            ocr_max_side: Bound on the resolution OCR crops are taken from
+                (None = full resolution)
+        """
+        self.jobs_dir = jobs_dir
+        self._store = None
+        self.loaders = loaders
+        self.workers = workers
+        self.max_retries = max_retries
+        self.max_file_size = max_file_size
+        self.worker_batch_size = worker_batch_size
+        self.poll_interval = poll_interval
+        self.ocr_max_side = ocr_max_side
+
+        # Start the worker pool on submit; off in processes that don't own it
+        self.autostart = True
+
+        self._processes: List[multiprocessing.Process] = []
+        self._pid = None
+        # Spawn (not fork): the API process is multi-threaded
+        self._context = multiprocessing.get_context('spawn')
+        self._stop_event = None
+
+    @property
+    def store(self) -> JobStore:
+        """The job database, created on first use (not when the API is imported)"""
+        if self._store is None:
+            self._store = JobStore(os.path.join(self.jobs_dir, 'jobs.db'))
+        return self._store
+
+    def start(self):
+        """Start the worker pool (no-op if already running in this process)"""
+        if self._pid == os.getpid() and all(p.is_alive() for p in self._processes):
+            return
+        self.stop()
+        self.store.recover()
+        self._pid = os.getpid()
+        self._stop_event = self._context.Event()
+        self._processes = [
+            self._context.Process(target=_worker_main, name=f"scan-job-worker-{n}", daemon=True,
+                                  args=(self.store.db_path, self.jobs_dir, self.loaders, self.max_retries,
+                                        self.worker_batch_size, self.poll_interval, self.ocr_max_side,
+                                        self._stop_event))
+            for n in range(self.workers)
+        ]
+        for process in self._processes:
+            process.start()
+        print(f"👷 Started {self.workers} scan job workers")
+
+    def stop(self, timeout=10):
+        """Ask workers to finish their current batch and exit"""
+        if self._stop_event is not None:
+            self._stop_event.set()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+
+    def submit(self, files, mode: str, inventory_items: List[Dict] = None) -> Dict:
+        """
+        Create a job from uploaded files
+
+        Args:
+            files: Uploaded files (objects with .filename and .read())
+            mode: 'classification' or 'detection'
+            inventory_items: Inventory snapshot to match results against
+
+        Returns:
+            Initial job status
+
+        Raises:
+            FileTooLarge: If a file is larger than max_file_size (nothing is queued)
+        """
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.jobs_dir, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+
+        items = []
+        try:
+            for idx, file in enumerate(files):
+                file_ext = file.filename.rsplit('.', 1)[1].lower()
+                path = os.path.join(job_dir, f"{idx}.{file_ext}")
+                with open(path, 'wb') as f:
+                    if self.max_file_size is None:
+                        shutil.copyfileobj(file, f)
+                    else:
+                        save_limited(file, f, self.max_file_size)
+                items.append({'filename': file.filename, 'path': path})
+        except FileTooLarge:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+
+        # Snapshot the inventory so the job is self-contained across restarts
+        if inventory_items:
+            with open(os.path.join(job_dir, 'inventory.json'), 'w', encoding='utf-8') as f:
+                json.dump(inventory_items, f)
+
+        self.store.create_job(job_id, mode, items)
+        if self.autostart:
+            self.start()
+        return self.store.get_job(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        return self.store.cancel(job_id)
+
+    def retry_failed(self, job_id: str) -> int:
+        count = self.store.retry_failed(job_id)
+        if count and self.autostart:
+            self.start()
+        return count
+
+    def get(self, job_id: str, since: int = 0, limit: int = 500) -> Optional[Dict]:
+        return self.store.get_job(job_id, since, limit)
+
+    def delete(self, job_id: str) -> bool:
+        """Cancel a job and remove its images from disk"""
+        if not self.store.cancel(job_id):
+            return False
+        shutil.rmtree(os.path.join(self.jobs_dir, job_id), ignore_errors=True)
+        return True
+
+
+def _worker_main(db_path: str, jobs_dir: str, loaders: Dict[str, Callable], max_retries: int,
+                 batch_size: int, poll_interval: float, ocr_max_side: Optional[int], stop_event):
+    """Worker process loop: claim a batch, run the model once on it, record results"""
+    from image_io import NormalizedImage, decode_image
+    from inventory_index import InventoryIndex
+
+    store = JobStore(db_path)
+    inventories = {}  # job_id -> InventoryIndex (or None)
+
+    def get_inventory(job_id):
+        if job_id not in inventories:
+            path = os.path.join(jobs_dir, job_id, 'inventory.json')
+            index = None
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    index = InventoryIndex(json.load(f))
+            inventories.clear()  # Jobs are processed mostly in order
+            inventories[job_id] = index
+        return inventories[job_id]
+
+    def process(model, mode, inventory, images):
+        model_versions = getattr(model, 'model_versions', None)
+        if mode == 'classification':
+            predictions = model.classify_batch(images)
+            return [{
+                'prediction': prediction,
+                'matched': model.match_to_inventory(prediction, inventory) if inventory else None,
+                'model_version': model_versions
+            } for prediction in predictions]
+
+        results = []
+        for detections in model.detect_products_batch(images):
+            matched = model.match_to_inventory(detections, inventory) if inventory else detections
+            results.append({
+                'total_detections': len(detections),
+                'matched_count': sum(1 for p in matched if p.get('is_matched', False)),
+                'detections': matched,
+                'model_version': model_versions
+            })
+        return results
+
+    def decode(model, mode, path):
+        # At the resolution the model needs, like the API does (not the full-size original)
+        with open(path, 'rb') as f:
+            data = f.read()
+        if mode == 'classification':
+            return decode_image(data, min_side=model.input_size)
+        return NormalizedImage(data, max_side=model.max_image_side, crop_max_side=ocr_max_side)
+
+    def record_failure(item, error):
+        # Failed images stay on disk for a manual retry (/retry) until the job is purged
+        store.finish_item(item['job_id'], item['idx'], error=error, retry=item['attempts'] < max_retries)
+
+    while not stop_event.is_set():
+        claimed = store.claim(batch_size)
+        if not claimed:
+            stop_event.wait(poll_interval)
+            continue
+
+        job_id, mode = claimed[0]['job_id'], claimed[0]['mode']
+        try:
+            model = loaders[mode]()
+            inventory = get_inventory(job_id)
+        except Exception as e:
+            for item in claimed:
+                record_failure(item, f"Model load failed: {e}")
+            time.sleep(poll_interval)
+            continue
+
+        # Decode; unreadable images fail on their own
+        ready = []
+        for item in claimed:
+            try:
+                ready.append((item, decode(model, mode, item['path'])))
+            except Exception as e:
+                record_failure(item, str(e))
+
+        # One batched call; if it fails, isolate the bad image(s)
+        batches = [ready] if ready else []
+        while batches:
+            batch = batches.pop()
+            try:
+                results = process(model, mode, inventory, [image for _, image in batch])
+            except Exception as e:
+                if len(batch) > 1:
+                    batches.extend([entry] for entry in batch)
+                else:
+                    traceback.print_exc()
+                    record_failure(batch[0][0], str(e))
+                continue
+            for (item, _), result in zip(batch, results):
+                store.finish_item(item['job_id'], item['idx'], result=result)
+                _remove_image(item['path'])
+
+
+def _remove_image(path: str):
+    """Processed images are not needed anymore (results live in the database)"""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,285 @@
+"""
+AIMS Metrics
+Minimal Prometheus-compatible metrics (counters, gauges, histograms)
+rendered in the text exposition format for /metrics; worker processes
+behind one port (serve.py) merge theirs through a shared directory
+"""
+
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Latency buckets (seconds): sub-ms decode/match up to multi-second OCR
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self, state: List = None) -> List[str]:
+        """Exposition lines of this metric's values (or of a state, e.g. merged across processes)"""
+        state = self.state() if state is None else state
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples(state)
+
+    def state(self) -> List:
+        """Values as JSON-serializable [labels, ...] rows"""
+        raise NotImplementedError
+
+    @staticmethod
+    def merge(states: List[List]) -> List:
+        """Sum the states of the same metric in several processes"""
+        raise NotImplementedError
+
+    def _samples(self, state: List) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def state(self) -> List:
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    @staticmethod
+    def merge(states: List[List]) -> List:
+        totals = {}
+        for state in states:
+            for key, value in state:
+                totals[tuple(key)] = totals.get(tuple(key), 0) + value
+        return [[list(key), value] for key, value in totals.items()]
+
+    def _samples(self, state: List) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, tuple(key))} {_format_value(value)}"
+                for key, value in sorted(state)]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List] = {}  # key -> [bucket counts, sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a with-block (also when it raises)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def state(self) -> List:
+        with self._lock:
+            return [[list(key), list(counts), total, count] for key, (counts, total, count) in self._series.items()]
+
+    @staticmethod
+    def merge(states: List[List]) -> List:
+        series = {}
+        for state in states:
+            for key, counts, total, count in state:
+                merged = series.setdefault(tuple(key), [[0] * len(counts), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+        return [[list(key), counts, total, count] for key, (counts, total, count) in series.items()]
+
+    def _samples(self, state: List) -> List[str]:
+        lines = []
+        for key, counts, total, count in sorted(state):
+            key = tuple(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self.multiprocess_dir: Optional[str] = None
+        self._dump_interval = 5.0
+        self._dumper = None
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def enable_multiprocess(self, directory: str, dump_interval: float = 5.0):
+        """
+        Share this process' metrics with the other workers serving the same port
+
+        Each process writes its values to <directory>/<pid>.json (every
+        dump_interval seconds and on each scrape); render() sums all files,
+        so whichever worker a scrape reaches reports the whole server.
+        Counters and histograms of exited workers keep counting (totals
+        never go backwards); their gauges are dropped.
+
+        Args:
+            directory: Directory shared by the workers (emptied by the
+                server on startup)
+            dump_interval: Seconds between background writes
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.multiprocess_dir = directory
+        self._dump_interval = dump_interval
+        self._dumper = threading.Thread(target=self._dump_loop, name='metrics-dump', daemon=True)
+        self._dumper.start()
+
+    def _dump_loop(self):
+        while True:
+            try:
+                self.dump()
+            except OSError as e:
+                print(f"⚠️  Could not write metrics: {e}")
+            time.sleep(self._dump_interval)
+
+    def dump(self):
+        """Write this process' values for the other workers"""
+        path = os.path.join(self.multiprocess_dir, f"{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({metric.name: metric.state() for metric in self._metrics}, f)
+        os.replace(tmp_path, path)
+
+    def _process_states(self) -> List[Tuple[bool, Dict]]:
+        """(process alive, values) of every worker that dumped its metrics"""
+        states = []
+        for path in glob.glob(os.path.join(self.multiprocess_dir, '*.json')):
+            try:
+                pid = int(os.path.basename(path)[:-len('.json')])
+                with open(path, 'r', encoding='utf-8') as f:
+                    values = json.load(f)
+            except (OSError, ValueError):
+                continue
+            states.append((_pid_alive(pid), values))
+        return states
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        if self.multiprocess_dir is None:
+            for metric in self._metrics:
+                lines.extend(metric.render())
+        else:
+            self.dump()
+            states = self._process_states()
+            for metric in self._metrics:
+                lines.extend(metric.render(metric.merge([
+                    values.get(metric.name, []) for alive, values in states
+                    if alive or metric.kind != 'gauge'])))
+        return '\n'.join(lines) + '\n'
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+REGISTRY = Registry()
+
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    'aims_stage_duration_seconds',
+    'Latency of pipeline stages (decode, yolo, classify, barcode, ocr per crop, ocr_batch, match, annotate)',
+    ('stage',)))
+REQUESTS = REGISTRY.register(Counter(
+    'aims_requests_total', 'HTTP requests by endpoint, mode and status code',
+    ('endpoint', 'mode', 'status')))
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    'aims_request_duration_seconds', 'HTTP request latency by endpoint', ('endpoint',)))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    'aims_requests_in_flight', 'HTTP requests currently being handled', ('endpoint',)))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'aims_inference_queue_depth', 'Requests waiting in an inference scheduler', ('scheduler',)))
+ADMISSION_REJECTED = REGISTRY.register(Counter(
+    'aims_admission_rejected_total', 'Requests turned away by admission control',
+    ('reason',)))
+
+
+def time_stage(stage: str):
+    """
+    Time one pipeline stage
+
+    Usage:
+        with time_stage('ocr'):
+            ocr_results = reader.readtext(crop)
+    """
+    return STAGE_LATENCY.time(stage=stage)
@@ -0,0 +1,103 @@
+"""
+AIMS Model Loader
+Builds registered model versions from plain settings. Importing it has no
+side effects, so spawned worker processes (scan jobs) load their models
+through it without importing (and initializing) the whole API
+"""
+
+import time
+from typing import Dict, Optional
+
+from model_registry import ModelRegistry
+
+
+def build_model(name: str, entry: Dict, settings: Dict):
+    """
+    Instantiate one registered model version (no warmup)
+
+    Args:
+        name: 'classifier' or 'detector'
+        entry: Registry entry (path, version)
+        settings: Constructor arguments of that model besides model_path
+            (see detection_api.model_settings)
+
+    Returns:
+        ProductClassifier or ProductDetector with .version set
+    """
+    if name == 'classifier':
+        from product_classifier import ProductClassifier
+        model = ProductClassifier(model_path=entry['path'], **settings)
+    else:
+        from product_detector import ProductDetector
+        model = ProductDetector(model_path=entry['path'], **settings)
+    model.version = entry['version']
+    return model
+
+
+class ModeLoader:
+    def __init__(self, mode: str, registry_path: str, defaults: Dict[str, str], settings: Dict[str, Dict],
+                 hybrid_ocr_confidence: float, poll_interval: float = 10.0):
+        """
+        Picklable loader of the model(s) a mode needs, for worker processes
+
+        Args:
+            mode: 'classification', 'detection' or 'hybrid'
+            registry_path: Model registry file (the active versions are loaded)
+            defaults: Model name -> default weights path (see ModelRegistry)
+            settings: Model name -> constructor arguments (see build_model)
+            hybrid_ocr_confidence: Hybrid mode: OCR only crops classified below this
+            poll_interval: Seconds between checks for a newly activated version
+        """
+        self.mode = mode
+        self.registry_path = registry_path
+        self.defaults = defaults
+        self.settings = settings
+        self.hybrid_ocr_confidence = hybrid_ocr_confidence
+        self.poll_interval = poll_interval
+        self._registry: Optional[ModelRegistry] = None
+        self._models: Dict = {}
+        self._model = None
+        self._checked_at = 0.0
+
+    def __getstate__(self):
+        # Only the settings cross the process boundary; models load in the worker
+        state = self.__dict__.copy()
+        state.update(_registry=None, _models={}, _model=None, _checked_at=0.0)
+        return state
+
+    def __call__(self):
+        """
+        Get the mode's model, (re)loaded when the active version changed
+
+        Returns:
+            ProductClassifier, ProductDetector or HybridRecognizer
+        """
+        now = time.monotonic()
+        if self._model is not None and now - self._checked_at < self.poll_interval:
+            return self._model
+        self._checked_at = now
+
+        if self._registry is None:
+            self._registry = ModelRegistry(self.registry_path, defaults=self.defaults)
+        else:
+            self._registry.refresh()
+
+        names = {'classification': ['classifier'], 'detection': ['detector'],
+                 'hybrid': ['detector', 'classifier']}[self.mode]
+        changed = False
+        for name in names:
+            entry = self._registry.active(name)
+            model = self._models.get(name)
+            if model is None or model.version != entry['version']:
+                print(f"🔧 Loading {name} {entry['version']} in worker...")
+                self._models[name] = build_model(name, entry, self.settings[name])
+                changed = True
+
+        if changed or self._model is None:
+            if self.mode == 'hybrid':
+                from hybrid_recognizer import HybridRecognizer
+                self._model = HybridRecognizer(self._models['detector'], self._models['classifier'],
+                                               ocr_confidence_threshold=self.hybrid_ocr_confidence)
+            else:
+                self._model = self._models[names[0]]
+        return self._model
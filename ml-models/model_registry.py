@@ -0,0 +1,259 @@
+"""
+AIMS Model Registry
+Versions, paths and metadata of the served models, kept in a JSON file
+shared by all server processes; the active version of each model is
+switched here and picked up by running servers without a restart
+
+Usage:
+    python model_registry.py list
+    python model_registry.py register classifier weights/grocery_classifier_20250101.pt --activate
+    python model_registry.py activate classifier <version>
+"""
+
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from result_cache import weights_identity
+
+try:
+    import fcntl  # Serializes writes of servers and the CLI to the same file (POSIX)
+except ImportError:
+    fcntl = None
+
+
+def version_for(path: str) -> str:
+    """Content-derived version ID (same weights = same version)"""
+    digest = hashlib.sha256()
+    if os.path.isfile(path):
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    else:
+        # Directories (exported models) or weights not downloaded yet
+        digest.update(weights_identity(path).encode('utf-8'))
+    return digest.hexdigest()[:12]
+
+
+class ModelRegistry:
+    def __init__(self, path: str, defaults: Dict[str, str] = None):
+        """
+        Open (or create on first write) a registry file
+
+        Args:
+            path: Registry JSON file
+            defaults: Model name -> weights path registered and activated
+                when a model has no versions yet, and again when they
+                change (edited path, retrained in place) while still active
+        """
+        self.path = path
+        self.defaults = defaults or {}
+        self._lock = threading.Lock()
+        self._warned = set()
+        self._mtime = None
+        self._data = {'models': {}}
+        self.refresh()
+
+    def refresh(self) -> bool:
+        """
+        Re-read the file if another process changed it
+
+        Returns:
+            True if the registry was reloaded
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return False
+        with self._lock:
+            if mtime == self._mtime:
+                return False
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._data = json.load(f)
+            self._mtime = mtime
+        return True
+
+    def _save_locked(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._data, f, indent=2)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock of the registry file across processes"""
+        if fcntl is None:
+            yield
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(f"{self.path}.lock", 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _update(self, change: Callable[[Dict], Dict]) -> Dict:
+        """Apply a change to the latest file contents and save them (read-modify-write under both locks)"""
+        with self._file_lock():
+            self.refresh()
+            with self._lock:
+                result = change(self._data['models'])
+                self._save_locked()
+                return result
+
+    def register(self, name: str, path: str, version: str = None, metadata: Dict = None,
+                 activate: bool = False) -> Dict:
+        """
+        Add a version of a model
+
+        Args:
+            name: Model name ('classifier', 'detector')
+            path: Weights path (.pt or exported model)
+            version: Version ID (default: derived from the weights content)
+            metadata: Free-form info (accuracy, training run, ...)
+            activate: Also make it the active version
+
+        Returns:
+            The version entry
+        """
+        version = version or version_for(path)
+
+        def change(models):
+            model = models.setdefault(name, {'active': None, 'versions': {}})
+            entry = model['versions'].get(version)
+            if entry is None:
+                entry = model['versions'][version] = {
+                    'path': path,
+                    'registered_at': datetime.now().isoformat(),
+                    'metadata': metadata or {}
+                }
+            elif metadata:
+                entry['metadata'].update(metadata)
+            if activate or model['active'] is None:
+                model['active'] = version
+                model['activated_at'] = datetime.now().isoformat()
+            return {'name': name, 'version': version, **entry}
+
+        return self._update(change)
+
+    def activate(self, name: str, version: str) -> Dict:
+        """
+        Make a registered version the active one (servers pick it up)
+
+        Raises:
+            KeyError: If the model or version isn't registered
+        """
+        def change(models):
+            model = models.get(name)
+            if model is None or version not in model['versions']:
+                raise KeyError(f"Unknown version of {name}: {version}")
+            model['active'] = version
+            model['activated_at'] = datetime.now().isoformat()
+            return {'name': name, 'version': version, **model['versions'][version]}
+
+        return self._update(change)
+
+    def get(self, name: str, version: str) -> Optional[Dict]:
+        """Entry of a version (None if not registered)"""
+        with self._lock:
+            entry = self._data['models'].get(name, {}).get('versions', {}).get(version)
+            return {'name': name, 'version': version, **entry} if entry else None
+
+    def active(self, name: str) -> Optional[Dict]:
+        """
+        Entry of the active version
+
+        The default weights of a model are registered when it has no versions
+        yet, and registered and activated again when they changed (path
+        edited, or retrained in place) while the default is still active;
+        if another version is active, a changed default is only reported.
+        """
+        with self._lock:
+            model = self._data['models'].get(name)
+            version = model['active'] if model else None
+            default = model.get('default') if model else None
+        path = self.defaults.get(name)
+        if path is not None:
+            identity = weights_identity(path)
+            if version is None:
+                return self._register_default(name, path, identity)
+            if default is None or default['path'] != path or default['identity'] != identity:
+                entry = self.get(name, version)
+                if (default['version'] == version) if default else (entry is not None and entry['path'] == path):
+                    return self._register_default(name, path, identity)
+                if (name, path, identity) not in self._warned:
+                    self._warned.add((name, path, identity))
+                    print(f"⚠️  Default {name} weights {path} changed, but version {version} is active: "
+                          "register them with model_registry.py to serve them")
+        if version is None:
+            return None
+        return self.get(name, version)
+
+    def _register_default(self, name: str, path: str, identity: str) -> Dict:
+        """Register and activate the configured default weights, remembering what they were"""
+        version = version_for(path)
+
+        def change(models):
+            model = models.setdefault(name, {'active': None, 'versions': {}})
+            entry = model['versions'].setdefault(version, {
+                'path': path,
+                'registered_at': datetime.now().isoformat(),
+                'metadata': {}
+            })
+            if model['active'] != version:
+                model['active'] = version
+                model['activated_at'] = datetime.now().isoformat()
+            model['default'] = {'path': path, 'identity': identity, 'version': version}
+            return {'name': name, 'version': version, **entry}
+
+        return self._update(change)
+
+    def info(self) -> Dict:
+        """All models with their versions and active version"""
+        with self._lock:
+            return json.loads(json.dumps(self._data['models']))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Manage served model versions')
+    parser.add_argument('--registry', type=str, default='weights/registry.json',
+                        help='Registry file')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='Show models and versions')
+    register_parser = commands.add_parser('register', help='Register a weights file')
+    register_parser.add_argument('name', choices=['classifier', 'detector'])
+    register_parser.add_argument('path')
+    register_parser.add_argument('--version', default=None)
+    register_parser.add_argument('--activate', action='store_true')
+    activate_parser = commands.add_parser('activate', help='Switch the active version')
+    activate_parser.add_argument('name', choices=['classifier', 'detector'])
+    activate_parser.add_argument('version')
+
+    args = parser.parse_args()
+    registry = ModelRegistry(args.registry)
+
+    if args.command == 'register':
+        entry = registry.register(args.name, args.path, version=args.version, activate=args.activate)
+        print(f"✅ Registered {args.name} {entry['version']} ({entry['path']})")
+    elif args.command == 'activate':
+        entry = registry.activate(args.name, args.version)
+        print(f"✅ Activated {args.name} {entry['version']} - running servers switch to it in the background")
+    else:
+        for name, model in registry.info().items():
+            print(f"\n📦 {name}")
+            for version, entry in model['versions'].items():
+                marker = '*' if version == model['active'] else ' '
+                print(f"  {marker} {version}  {entry['path']}  ({entry['registered_at']})")
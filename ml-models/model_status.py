@@ -0,0 +1,81 @@
+"""
+AIMS Model Status
+Tracks load and warmup state of each model for readiness reporting
+"""
+
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+# States: not_loaded -> loading -> warming_up -> ready (or failed)
+READY = 'ready'
+
+
+class ModelStatus:
+    def __init__(self, name: str):
+        """
+        Args:
+            name: Model name shown in health/readiness responses
+        """
+        self.name = name
+        self.state = 'not_loaded'
+        self.version: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.warmup_ms: Optional[float] = None
+        self.error: Optional[str] = None
+        self.ready_at: Optional[str] = None
+        self._started = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_ready(self) -> bool:
+        return self.state == READY
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.state in ('warming_up', READY)
+
+    def loading(self, version: str = None):
+        with self._lock:
+            self.state = 'loading'
+            self.version = version
+            self.error = None
+            self._started = time.perf_counter()
+
+    def loaded(self):
+        """Model object exists; warmup still pending"""
+        with self._lock:
+            self.load_seconds = round(time.perf_counter() - self._started, 3)
+            self.state = 'warming_up'
+
+    def ready(self, warmup_ms: float = None):
+        with self._lock:
+            if warmup_ms is not None:
+                self.warmup_ms = round(warmup_ms, 1)
+            self.state = READY
+            self.ready_at = datetime.now().isoformat()
+
+    def swapped(self, version: str, warmup_ms: float = None):
+        """A new version replaced the served one (state stays ready)"""
+        with self._lock:
+            self.version = version
+            if warmup_ms is not None:
+                self.warmup_ms = round(warmup_ms, 1)
+            self.ready_at = datetime.now().isoformat()
+
+    def failed(self, error: Exception):
+        with self._lock:
+            self.state = 'failed'
+            self.error = str(error)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                'state': self.state,
+                'version': self.version,
+                'load_seconds': self.load_seconds,
+                'warmup_ms': self.warmup_ms,
+                'ready_at': self.ready_at,
+                'error': self.error
+            }
@@ -3,48 +3,106 @@ AIMS Product Classification Service
 Uses trained YOLOv8 classification model for grocery product recognition
 """
 
-from ultralytics import YOLO
 from PIL import Image
-from typing import List, Dict
+from typing import List, Dict, Union
+import numpy as np
 import os
+import threading
+import time
+from inference_engine import load_model, model_input_size
+from inventory_index import InventoryIndex
+from metrics import time_stage
 
 class ProductClassifier:
-    def __init__(self, model_path='weights/grocery_classifier_best.pt', top_k=5):
+    def __init__(self, model_path='weights/grocery_classifier_best.pt', top_k=5,
+                 engine='pytorch', parity_images=None):
         """
         Initialize the product classifier
         
         Args:
             model_path: Path to trained classification model
             top_k: Number of top predictions to return
+            engine: 'pytorch', 'onnx' or 'openvino' (falls back to pytorch)
+            parity_images: Sample images an exported model must agree on with PyTorch
         """
         print(f"🔧 Loading trained grocery classifier: {model_path}...")
         
         if not os.path.exists(model_path):
             raise FileNotFoundError(f"Model not found: {model_path}")
         
-        self.model = YOLO(model_path)
+        self.model, self.engine = load_model(model_path, engine, task='classify', parity_images=parity_images)
+        self.model_path = model_path
+        self.version = None  # Registry version (set by whoever loads it)
         self.top_k = top_k
-        print("✅ Classifier loaded successfully")
+        self._lock = threading.Lock()
+        print(f"✅ Classifier loaded successfully ({self.engine})")
         
         # Get class names from model
         self.class_names = self.model.names
         print(f"✅ Model trained on {len(self.class_names)} product classes")
     
-    def classify_product(self, image_path: str) -> Dict:
+    @property
+    def model_versions(self) -> Dict:
+        """Versions of the models behind this classifier's results"""
+        return {'classifier': self.version}
+    
+    @property
+    def input_size(self) -> int:
+        """Image size the model was trained at (square, in pixels)"""
+        return model_input_size(self.model, default=224)
+    
+    def warmup(self, runs=2) -> float:
+        """
+        Run dummy inferences at the model's input size, so the first real
+        request doesn't pay for lazy initialization
+        
+        Args:
+            runs: Number of warmup inferences
+            
+        Returns:
+            Latency of the last warmup inference in milliseconds
+        """
+        dummy = np.zeros((self.input_size, self.input_size, 3), dtype=np.uint8)
+        latency_ms = 0.0
+        for _ in range(runs):
+            start = time.perf_counter()
+            self.classify_batch([dummy])
+            latency_ms = (time.perf_counter() - start) * 1000
+        return latency_ms
+    
+    def classify_product(self, image: Union[str, np.ndarray]) -> Dict:
         """
         Classify a single product image
         
         Args:
-            image_path: Path to product image
+            image: Path to product image or decoded BGR array
             
         Returns:
             Dict with top predictions and confidence scores
         """
-        # Run prediction
-        results = self.model(image_path, verbose=False)
+        return self.classify_batch([image])[0]
+    
+    def classify_batch(self, images: List[Union[str, np.ndarray]]) -> List[Dict]:
+        """
+        Classify several product images in one batched forward pass
         
+        Args:
+            images: List of product image paths or decoded BGR arrays
+            
+        Returns:
+            List of classification results, in input order
+        """
+        # Run prediction (one batched call)
+        with self._lock, time_stage('classify'):  # The predictor isn't thread-safe
+            results = self.model(list(images), verbose=False)
+        
+        return [self._format_result(result, image if isinstance(image, str) else None)
+                for result, image in zip(results, images)]
+    
+    def _format_result(self, result, image_path: str) -> Dict:
+        """Convert one ultralytics classification result to our response format"""
         # Get top-k predictions
-        probs = results[0].probs
+        probs = result.probs
         
         # Get top predictions
         top_indices = probs.top5[:self.top_k]  # Top K indices
@@ -70,53 +128,31 @@ class ProductClassifier:
             'all_classes': self.class_names
         }
     
-    def match_to_inventory(self, prediction: Dict, inventory_items: List[Dict]) -> Dict:
+    def match_to_inventory(self, prediction: Dict,
+                           inventory_items: Union[InventoryIndex, List[Dict]]) -> Dict:
         """
         Match classified product to inventory database
         
         Args:
             prediction: Classification result
-            inventory_items: List of inventory items with SKU, name, etc.
+            inventory_items: InventoryIndex (or raw list of items with SKU, name, etc.)
             
         Returns:
             Dict with matched inventory item or None
         """
+        index = inventory_items if isinstance(inventory_items, InventoryIndex) else InventoryIndex(inventory_items)
         predicted_name = prediction['predicted_class'].lower().replace('-', ' ')
         
-        matched_items = []
-        
-        for item in inventory_items:
-            item_name = item.get('name', '').lower()
-            
-            # Direct name match
-            if predicted_name in item_name or item_name in predicted_name:
-                matched_items.append({
-                    **item,
-                    'match_type': 'name_exact',
-                    'match_score': 100,
-                    'predicted_class': prediction['predicted_class'],
-                    'confidence': prediction['confidence']
-                })
-                continue
-            
-            # Partial word match
-            pred_words = set(predicted_name.split())
-            item_words = set(item_name.split())
-            
-            common_words = pred_words & item_words
-            if common_words:
-                match_score = (len(common_words) / max(len(pred_words), len(item_words))) * 100
-                if match_score > 30:  # Threshold
-                    matched_items.append({
-                        **item,
-                        'match_type': 'name_partial',
-                        'match_score': match_score,
-                        'predicted_class': prediction['predicted_class'],
-                        'confidence': prediction['confidence']
-                    })
-        
-        # Sort by match score
-        matched_items.sort(key=lambda x: x['match_score'], reverse=True)
+        matched_items = [
+            {
+                **item,
+                'match_type': match_type,
+                'match_score': match_score,
+                'predicted_class': prediction['predicted_class'],
+                'confidence': prediction['confidence']
+            }
+            for item, match_type, match_score in index.match_class_name(predicted_name)
+        ]
         
         return {
             'prediction': prediction,
@@ -135,6 +171,12 @@ class ProductClassifier:
         Returns:
             List of classification results
         """
+        try:
+            return self.classify_batch(image_paths)
+        except Exception:
+            pass
+        
+        # Batch failed (e.g. one unreadable image): fall back to one by one
         results = []
         for img_path in image_paths:
             try:
@@ -0,0 +1,108 @@
+"""
+AIMS Product Codes
+Extraction of SKUs and barcodes (EAN-8, UPC-A, EAN-13, GTIN-14) from OCR
+text, with check digit validation, for exact inventory lookups
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+# Labeled SKUs ("SKU: AB-123", "ITEM 4411", "#AB123")
+SKU_PATTERNS = [
+    re.compile(r'SKU[:\s]*([A-Z0-9-]+)', re.IGNORECASE),
+    re.compile(r'ITEM[:\s]*([A-Z0-9-]+)', re.IGNORECASE),
+    re.compile(r'#([A-Z0-9-]+)', re.IGNORECASE),
+]
+
+# Digit groups separated by single spaces/dashes, as printed under barcodes ("5 901234 123457")
+_DIGIT_RUN = re.compile(r'\d+(?:[ -]\d+)*')
+_SEPARATOR = re.compile(r'[ -]')
+_NOT_ALNUM = re.compile(r'[^A-Z0-9]+')
+
+GTIN_LENGTHS = (8, 12, 13, 14)
+
+
+def valid_gtin(code: str) -> bool:
+    """Check digit of an EAN-8, UPC-A, EAN-13 or GTIN-14"""
+    if len(code) not in GTIN_LENGTHS or not code.isdigit():
+        return False
+    total = sum(int(digit) * (3 if i % 2 == 0 else 1) for i, digit in enumerate(reversed(code[:-1])))
+    return (10 - total % 10) % 10 == int(code[-1])
+
+
+def barcode_key(code) -> Optional[str]:
+    """
+    Lookup key of a barcode: GTINs are zero-padded to 14 digits, so a UPC-A
+    and its EAN-13 form are the same key
+
+    Returns:
+        Key, or None for an empty code
+    """
+    code = str(code or '').strip()
+    if not code:
+        return None
+    digits = code.replace(' ', '').replace('-', '')
+    if digits.isdigit() and len(digits) in GTIN_LENGTHS:
+        return digits.zfill(14)
+    return code.upper()
+
+
+def sku_key(sku) -> Optional[str]:
+    """Lookup key of a SKU (case, spaces and punctuation ignored)"""
+    key = _NOT_ALNUM.sub('', str(sku or '').upper())
+    return key or None
+
+
+def extract_barcodes(text: str) -> List[str]:
+    """
+    Barcodes with a valid check digit in OCR text
+
+    Returns:
+        Barcodes without separators (no duplicates), longest first within
+        a run of numbers
+    """
+    found = []
+    for run in _DIGIT_RUN.finditer(text):
+        groups = _SEPARATOR.split(run.group(0))
+
+        # Consecutive groups forming a valid code (a run may also hold a price, a weight, ...)
+        spans = []
+        for first in range(len(groups)):
+            length = 0
+            for last in range(first, len(groups)):
+                length += len(groups[last])
+                if length > max(GTIN_LENGTHS):
+                    break
+                code = ''.join(groups[first:last + 1])
+                if valid_gtin(code):
+                    spans.append((first, last, code))
+
+        # Longest codes first, without reusing a group
+        used = set()
+        for first, last, code in sorted(spans, key=lambda span: (-len(span[2]), span[0])):
+            if used.isdisjoint(range(first, last + 1)):
+                used.update(range(first, last + 1))
+                if code not in found:
+                    found.append(code)
+    return found
+
+
+def extract_skus(text: str) -> List[str]:
+    """Labeled SKUs in OCR text (text order, no duplicates)"""
+    matches = sorted((match.start(1), match.group(1).strip('-'))
+                     for pattern in SKU_PATTERNS for match in pattern.finditer(text))
+    found = []
+    for _, sku in matches:
+        if sku and sku not in found:
+            found.append(sku)
+    return found
+
+
+def extract_codes(text: str) -> Tuple[List[str], List[str]]:
+    """
+    SKUs and validated barcodes in OCR text
+
+    Returns:
+        Tuple of (skus, barcodes)
+    """
+    return extract_skus(text), extract_barcodes(text)
@@ -5,27 +5,80 @@ Uses YOLOv8 for object detection + EasyOCR for text recognition
 
 import cv2
 import easyocr
-from ultralytics import YOLO
+import math
 import numpy as np
 from PIL import Image
-import re
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Union
 import os
+import threading
+import time
+from collections import Counter
+from barcode_decoder import BarcodeDecoder
+from image_io import NormalizedImage, load_image
+from inference_engine import load_model, model_input_size
+from inventory_index import InventoryIndex, TEXT_MATCH_THRESHOLD
+from metrics import STAGE_LATENCY, time_stage
+from product_codes import extract_codes
+from tiling import cut_by_tile, merge_boxes, tile_grid
+
+# Batched OCR: crops are grouped by size and each group is resized to one shape.
+# Sides snap to a geometric grid (32, 40, 50, 62, ...), so a crop is stretched
+# by at most ~12% to fit its group
+OCR_BUCKET_BASE = 32
+OCR_BUCKET_RATIO = 1.25
+
+
+def ocr_bucket(shape) -> Tuple[int, int]:
+    """(width, height) a crop of this shape is resized to for batched OCR"""
+    def snap(side):
+        step = max(0, round(math.log(max(side, 1) / OCR_BUCKET_BASE, OCR_BUCKET_RATIO)))
+        return int(round(OCR_BUCKET_BASE * OCR_BUCKET_RATIO ** step))
+    height, width = shape[:2]
+    return snap(width), snap(height)
+
 
 class ProductDetector:
-    def __init__(self, confidence_threshold=0.3):
+    def __init__(self, confidence_threshold=0.3, model_path='yolov8n.pt', engine='pytorch', parity_images=None,
+                 ocr_batch_size=16, ocr_min_area=0, ocr_min_confidence=0.0, ocr_classes=None,
+                 ocr_skip_classes=None, ocr_max_crops=None, decode_barcodes=False, barcode_scope='crop',
+                 tile_size=None, tile_overlap=0.2, tile_min_side=None, tile_max_side=8192, tile_iou=0.5):
         """
         Initialize the product detector with YOLOv8 and EasyOCR
         
         Args:
             confidence_threshold: Minimum confidence for detections (0-1)
+            model_path: YOLOv8 detection weights
+            engine: 'pytorch', 'onnx' or 'openvino' (falls back to pytorch)
+            parity_images: Sample images an exported model must agree on with PyTorch
+            ocr_batch_size: Max crops per batched OCR call
+            ocr_min_area: Boxes smaller than this (in pixels of the image YOLO
+                saw) are not OCR'd
+            ocr_min_confidence: Boxes below this detection confidence are not OCR'd
+            ocr_classes: Only OCR boxes of these classes (None = all)
+            ocr_skip_classes: Never OCR boxes of these classes (e.g. 'person')
+            ocr_max_crops: OCR at most this many boxes per image, most
+                confident first (None = no limit)
+            decode_barcodes: Try OpenCV's barcode/QR decoders before OCR;
+                boxes with a decoded code aren't OCR'd
+            barcode_scope: 'crop' (decode each box) or 'image' (decode the
+                whole image once, codes go to the box containing them)
+            tile_size: Sliced inference: large images are also run as
+                overlapping tiles of this side (None = whole image only)
+            tile_overlap: Min overlap of neighbouring tiles (fraction)
+            tile_min_side: Only tile images whose longer side exceeds this
+                (default: tile_size)
+            tile_max_side: Longer side uploads are decoded at when tiling
+            tile_iou: Overlap above which boxes from different tiles are
+                merged (cross-tile NMS)
         """
         print("🔧 Initializing Product Detector...")
         
         # Initialize YOLOv8 with pre-trained weights
         # Using YOLOv8n (nano) for speed - you can use yolov8s/m/l/x for better accuracy
-        self.yolo_model = YOLO('yolov8n.pt')
-        print("✅ YOLOv8 model loaded")
+        self.model_path = model_path
+        self.version = None  # Registry version (set by whoever loads it)
+        self.yolo_model, self.engine = load_model(model_path, engine, task='detect', parity_images=parity_images)
+        print(f"✅ YOLOv8 model loaded ({self.engine})")
         
         # Initialize EasyOCR reader (English language)
         # You can add more languages: ['en', 'ch_sim', 'hi', etc.]
@@ -33,128 +86,447 @@ class ProductDetector:
         print("✅ EasyOCR reader initialized")
         
         self.confidence_threshold = confidence_threshold
+        self.ocr_batch_size = max(1, int(ocr_batch_size))
+        
+        # OCR gating: detections that can't (or needn't) be read are returned without text
+        self.ocr_min_area = ocr_min_area
+        self.ocr_min_confidence = ocr_min_confidence
+        self.ocr_classes = set(ocr_classes) if ocr_classes is not None else None
+        self.ocr_skip_classes = set(ocr_skip_classes or ())
+        self.ocr_max_crops = ocr_max_crops
+        self._ocr_stats = Counter()
+        self._ocr_stats_lock = threading.Lock()
+        
+        # Native barcode/QR decoding
+        self.barcode_decoder = None
+        if decode_barcodes:
+            self.barcode_decoder = BarcodeDecoder(scope=barcode_scope)
+            print(f"✅ Barcode decoding enabled (per {barcode_scope})")
+        
+        # Sliced inference for high-resolution images
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self.tile_min_side = tile_min_side or tile_size
+        self.tile_max_side = tile_max_side
+        self.tile_iou = tile_iou
+        if tile_size:
+            print(f"✅ Tiled inference enabled ({tile_size}px tiles, {tile_overlap:.0%} overlap)")
+        self._yolo_lock = threading.Lock()
+    
+    @property
+    def model_versions(self) -> Dict:
+        """Versions of the models behind this detector's results"""
+        return {'detector': self.version}
+    
+    @property
+    def input_size(self) -> int:
+        """Side length YOLOv8 letterboxes images to"""
+        return model_input_size(self.yolo_model, default=640)
+    
+    @property
+    def max_image_side(self) -> int:
+        """Longer side to decode images at for detection (larger than the input size when tiling)"""
+        return self.tile_max_side if self.tile_size else self.input_size
         
-    def detect_products(self, image_path: str) -> List[Dict]:
+    def warmup(self, image_sizes=((640, 640), (480, 640), (640, 480)), runs=2) -> float:
+        """
+        Run dummy YOLOv8 and OCR inferences at the expected input sizes, so
+        the first real request doesn't pay for lazy initialization
+        
+        Args:
+            image_sizes: (height, width) shapes to warm up (after letterboxing)
+            runs: Number of warmup passes
+            
+        Returns:
+            Latency of the last warmup pass in milliseconds
+        """
+        dummies = [np.zeros((height, width, 3), dtype=np.uint8) for height, width in image_sizes]
+        dummy_crop = np.full((64, 256), 255, dtype=np.uint8)
+        latency_ms = 0.0
+        for _ in range(runs):
+            start = time.perf_counter()
+            for dummy in dummies:
+                self.detect_boxes([dummy])
+            self.ocr_reader.recognize(dummy_crop)
+            latency_ms = (time.perf_counter() - start) * 1000
+        return latency_ms
+    
+    def detect_products(self, image: Union[str, np.ndarray]) -> List[Dict]:
         """
         Detect products in an image and extract text from each detection
         
         Args:
-            image_path: Path to the image file
+            image: Path to the image file or decoded BGR array
             
         Returns:
             List of detected products with their info
         """
-        # Read image
-        image = cv2.imread(image_path)
-        if image is None:
-            raise ValueError(f"Could not read image from {image_path}")
-        
-        # Run YOLOv8 detection
-        results = self.yolo_model(image, conf=self.confidence_threshold)
-        
-        detected_products = []
-        
-        # Process each detection
-        for idx, result in enumerate(results[0].boxes.data):
-            x1, y1, x2, y2, confidence, class_id = result
-            
-            # Convert to integers
-            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-            
-            # Crop the detected region
-            cropped = image[y1:y2, x1:x2]
-            
-            # Extract text using OCR
-            ocr_results = self.ocr_reader.readtext(cropped)
-            
-            # Combine all detected text
-            detected_text = " ".join([text[1] for text in ocr_results])
-            
-            # Get class name
-            class_name = self.yolo_model.names[int(class_id)]
-            
-            product_info = {
-                'id': idx,
-                'bbox': [x1, y1, x2, y2],
-                'confidence': float(confidence),
-                'class': class_name,
-                'detected_text': detected_text,
-                'ocr_details': [
-                    {
-                        'text': text[1],
-                        'confidence': float(text[2]),
-                        'bbox': text[0]
-                    }
-                    for text in ocr_results
-                ]
-            }
+        return self.detect_products_batch([image])[0]
+    
+    def detect_products_batch(self, images: List[Union[str, np.ndarray]]) -> List[List[Dict]]:
+        """
+        Detect products in several images with one batched YOLOv8 call
+        and batched OCR over the crops of all images
+        
+        Args:
+            images: List of image file paths, decoded BGR arrays or
+                NormalizedImages (YOLO on the working copy, OCR on full resolution crops)
+            
+        Returns:
+            List of detection lists, in input order
+        """
+        # Read images (paths are loaded, arrays are used as-is)
+        images = [image if isinstance(image, NormalizedImage) else load_image(image) for image in images]
+        
+        boxes_per_image = self.detect_boxes(images)
+        
+        return self.read_products_batch(list(zip(images, boxes_per_image)))
+    
+    def detect_boxes(self, images: List[np.ndarray]) -> List[List[Dict]]:
+        """
+        Run YOLOv8 detection only (no OCR) on a batch of decoded images;
+        with tiling on, the whole image and its tiles of all images go
+        through YOLO as one batch
+        
+        Args:
+            images: List of decoded BGR arrays (or NormalizedImages)
+            
+        Returns:
+            Per image, list of boxes with bbox, confidence and class
+            (in the coordinates of the array YOLO saw)
+        """
+        arrays = [load_image(image) for image in images]
+        
+        # Sliced inference: large images also go in as overlapping tiles
+        inputs, tiles = [], []  # Per YOLO input: (image index, tile or None for the whole image)
+        tiled = set()
+        for image_idx, array in enumerate(arrays):
+            inputs.append(array)
+            tiles.append((image_idx, None))
+            height, width = array.shape[:2]
+            if self.tile_size and max(width, height) > self.tile_min_side:
+                tiled.add(image_idx)
+                for tile in tile_grid(width, height, self.tile_size, self.tile_overlap):
+                    x1, y1, x2, y2 = tile
+                    inputs.append(array[y1:y2, x1:x2])
+                    tiles.append((image_idx, tile))
+        
+        # Run YOLOv8 detection (one batched call; the predictor isn't thread-safe)
+        with self._yolo_lock, time_stage('yolo'):
+            results = self.yolo_model(inputs, conf=self.confidence_threshold)
+        
+        # Boxes back in image coordinates: (bbox, confidence, class ID, cut by a tile border)
+        found = [[] for _ in arrays]
+        for (image_idx, tile), result in zip(tiles, results):
+            offset_x, offset_y = tile[:2] if tile else (0, 0)
+            height, width = arrays[image_idx].shape[:2]
+            for box in result.boxes.data:
+                x1, y1, x2, y2, confidence, class_id = box
+                bbox = [int(x1) + offset_x, int(y1) + offset_y, int(x2) + offset_x, int(y2) + offset_y]
+                found[image_idx].append((bbox, float(confidence), int(class_id),
+                                         tile is not None and cut_by_tile(bbox, tile, width, height)))
+        
+        boxes_per_image = []
+        for image_idx, image_found in enumerate(found):
+            # Cross-tile NMS: one box per product
+            if image_idx in tiled and len(image_found) > 1:
+                bboxes, confidences, class_ids, cut = zip(*image_found)
+                kept = merge_boxes(bboxes, confidences, class_ids, cut, iou_threshold=self.tile_iou)
+                image_found = [image_found[i] for i in kept]
+            boxes_per_image.append([{
+                'bbox': bbox,
+                'confidence': confidence,
+                'class': self.yolo_model.names[class_id]
+            } for bbox, confidence, class_id, _ in image_found])
+        
+        return boxes_per_image
+    
+    def read_products(self, image: np.ndarray, boxes: List[Dict]) -> List[Dict]:
+        """
+        Run OCR on every detected box of one image
+        
+        Args:
+            image: Image the boxes belong to (array, or NormalizedImage to
+                crop from full resolution and report original coordinates)
+            boxes: Boxes from detect_boxes() for that image
+            
+        Returns:
+            List of detected products with their info
+        """
+        return self.read_products_batch([(image, boxes)])[0]
+    
+    def read_products_batch(self, images_and_boxes: List[Tuple[Union[np.ndarray, NormalizedImage], List[Dict]]]) -> List[List[Dict]]:
+        """
+        Run OCR on every detected box of several images in batched calls
+        
+        Args:
+            images_and_boxes: (image, boxes from detect_boxes()) per image
+            
+        Returns:
+            Per image, list of detected products with their info
+        """
+        # Crop the detected regions of all images
+        cropped = [self.crop_boxes(image, boxes) for image, boxes in images_and_boxes]
+        
+        # Decide which boxes are worth reading; boxes with a decoded barcode need no OCR
+        skipped = [self.gate_ocr(boxes, crops) for (_, boxes), (_, crops) in zip(images_and_boxes, cropped)]
+        codes = []
+        for (image, boxes), (_, crops), image_skipped in zip(images_and_boxes, cropped, skipped):
+            image_codes = self.find_codes(image, boxes, crops,
+                                          [idx for idx in range(len(boxes)) if idx not in image_skipped])
+            image_skipped.update((idx, 'barcode') for idx in image_codes)
+            codes.append(image_codes)
+        
+        # OCR every selected crop at once, then hand the texts back to their boxes
+        texts = iter(self.read_text_batch([crop for (_, crops), image_skipped in zip(cropped, skipped)
+                                           for idx, crop in enumerate(crops) if idx not in image_skipped]))
+        
+        results = []
+        for (_, boxes), (bboxes, _), image_skipped, image_codes in zip(images_and_boxes, cropped, skipped, codes):
+            detected_products = []
+            for idx, (box, bbox) in enumerate(zip(boxes, bboxes)):
+                skip_reason = image_skipped.get(idx)
+                detected_text, ocr_details = next(texts) if skip_reason is None else ('', [])
+                detected_products.append({
+                    'id': idx,
+                    'bbox': bbox,
+                    'confidence': box['confidence'],
+                    'class': box['class'],
+                    'detected_text': detected_text,
+                    'ocr_details': ocr_details,
+                    'ocr_skipped': skip_reason,
+                    'barcode': image_codes.get(idx)
+                })
+            results.append(detected_products)
+        
+        return results
+    
+    def crop_boxes(self, image: Union[np.ndarray, NormalizedImage], boxes: List[Dict]) -> Tuple[List[List[int]], List[np.ndarray]]:
+        """
+        Cut detected boxes out of their image
+        
+        Args:
+            image: Image the boxes belong to (NormalizedImage crops come
+                from full resolution)
+            boxes: Boxes from detect_boxes() for that image
+            
+        Returns:
+            Tuple of (boxes in original image coordinates, crops)
+        """
+        if isinstance(image, NormalizedImage):
+            bboxes = [image.to_original(box['bbox']) for box in boxes]
+            return bboxes, image.crops(bboxes)
+        bboxes = [box['bbox'] for box in boxes]
+        return bboxes, [image[y1:y2, x1:x2] for x1, y1, x2, y2 in bboxes]
+    
+    def gate_ocr(self, boxes: List[Dict], crops: List[np.ndarray], candidates=None) -> Dict[int, str]:
+        """
+        Apply the OCR gating policy to the boxes of one image
+        
+        Args:
+            boxes: Boxes from detect_boxes() (area is measured in their coordinates)
+            crops: Their crops (empty crops are never OCR'd)
+            candidates: Indices still in question (None = all boxes)
             
-            detected_products.append(product_info)
+        Returns:
+            Index -> skip reason ('empty', 'class', 'confidence', 'area',
+            'max_crops') for every candidate box that won't be OCR'd
+        """
+        candidates = range(len(boxes)) if candidates is None else candidates
+        skipped, selected = {}, []
+        for idx in candidates:
+            box = boxes[idx]
+            x1, y1, x2, y2 = box['bbox']
+            if not crops[idx].size:
+                skipped[idx] = 'empty'
+            elif box['class'] in self.ocr_skip_classes or (
+                    self.ocr_classes is not None and box['class'] not in self.ocr_classes):
+                skipped[idx] = 'class'
+            elif box['confidence'] < self.ocr_min_confidence:
+                skipped[idx] = 'confidence'
+            elif (x2 - x1) * (y2 - y1) < self.ocr_min_area:
+                skipped[idx] = 'area'
+            else:
+                selected.append(idx)
+        
+        if self.ocr_max_crops is not None and len(selected) > self.ocr_max_crops:
+            selected.sort(key=lambda idx: boxes[idx]['confidence'], reverse=True)
+            for idx in selected[self.ocr_max_crops:]:
+                skipped[idx] = 'max_crops'
+            selected = selected[:self.ocr_max_crops]
+        
+        with self._ocr_stats_lock:
+            self._ocr_stats['read'] += len(selected)
+            self._ocr_stats.update(skipped.values())
+        return skipped
+    
+    def find_codes(self, image: Union[np.ndarray, NormalizedImage], boxes: List[Dict],
+                   crops: List[np.ndarray], candidates: List[int]) -> Dict[int, Dict]:
+        """
+        Decode barcodes/QR codes of some boxes of one image (no-op unless
+        decode_barcodes is enabled)
+        
+        Args:
+            image: Image the boxes belong to
+            boxes: Boxes from detect_boxes()
+            crops: Their crops
+            candidates: Indices of the boxes to decode
+            
+        Returns:
+            Index -> decoded code ({'type', 'data'}) of the boxes that had one
+        """
+        if self.barcode_decoder is None or not candidates:
+            return {}
         
-        return detected_products
+        with time_stage('barcode'):
+            found = self.barcode_decoder.find_codes(image, boxes, crops, candidates)
+        
+        if found:
+            with self._ocr_stats_lock:
+                self._ocr_stats['read'] -= len(found)
+                self._ocr_stats['barcode'] += len(found)
+        return found
     
-    def match_to_inventory(self, detected_products: List[Dict], inventory_items: List[Dict]) -> List[Dict]:
+    def ocr_gate_stats(self) -> Dict:
+        """
+        Get OCR gating counters (since startup)
+        
+        Returns:
+            Dict with crops read and crops skipped per reason
+        """
+        with self._ocr_stats_lock:
+            stats = dict(self._ocr_stats)
+        read = stats.pop('read', 0)
+        skipped = sum(stats.values())
+        return {
+            'read': read,
+            'skipped': skipped,
+            'skipped_by_reason': stats,
+            'skip_rate': round(skipped / (read + skipped), 3) if read + skipped else 0.0
+        }
+    
+    def read_text(self, cropped: np.ndarray) -> Tuple[str, List[Dict]]:
+        """
+        OCR one crop
+        
+        Returns:
+            Tuple of (all text joined by spaces, per-text details)
+        """
+        return self.read_text_batch([cropped])[0]
+    
+    def read_text_batch(self, crops: List[np.ndarray]) -> List[Tuple[str, List[Dict]]]:
+        """
+        OCR several crops: crops of similar size (see ocr_bucket) are resized
+        to one shape and go through EasyOCR's detector and recognizer together
+        
+        Args:
+            crops: BGR crops (empty crops get no text)
+            
+        Returns:
+            Per crop, tuple of (all text joined by spaces, per-text details
+            with boxes in crop coordinates)
+        """
+        results = [('', [])] * len(crops)
+        
+        buckets = {}
+        for i, crop in enumerate(crops):
+            if crop.size:
+                buckets.setdefault(ocr_bucket(crop.shape), []).append(i)
+        
+        for (width, height), indices in buckets.items():
+            for start in range(0, len(indices), self.ocr_batch_size):
+                chunk = indices[start:start + self.ocr_batch_size]
+                started = time.perf_counter()
+                if len(chunk) == 1:
+                    # Alone in its bucket: no need to resize
+                    batch_results = [self.ocr_reader.readtext(crops[chunk[0]])]
+                    scales = [(1.0, 1.0)]
+                else:
+                    batch_results = self.ocr_reader.readtext_batched(
+                        [crops[i] for i in chunk], n_width=width, n_height=height, batch_size=len(chunk))
+                    scales = [(crops[i].shape[1] / width, crops[i].shape[0] / height) for i in chunk]
+                
+                # 'ocr' stays per crop (its share of the batch), 'ocr_batch' is the whole call
+                elapsed = time.perf_counter() - started
+                STAGE_LATENCY.observe(elapsed, stage='ocr_batch')
+                for _ in chunk:
+                    STAGE_LATENCY.observe(elapsed / len(chunk), stage='ocr')
+                
+                for i, ocr_results, scale in zip(chunk, batch_results, scales):
+                    results[i] = self._format_ocr(ocr_results, scale)
+        
+        return results
+    
+    @staticmethod
+    def _format_ocr(ocr_results, scale: Tuple[float, float]) -> Tuple[str, List[Dict]]:
+        """Join EasyOCR results into text and details (boxes scaled back to the crop)"""
+        scale_x, scale_y = scale
+        
+        # Combine all detected text
+        detected_text = " ".join([text[1] for text in ocr_results])
+        ocr_details = [
+            {
+                'text': text[1],
+                'confidence': float(text[2]),
+                'bbox': [[int(round(x * scale_x)), int(round(y * scale_y))] for x, y in text[0]]
+            }
+            for text in ocr_results
+        ]
+        return detected_text, ocr_details
+    
+    def match_to_inventory(self, detected_products: List[Dict],
+                           inventory_items: Union[InventoryIndex, List[Dict]]) -> List[Dict]:
         """
         Match detected products to inventory database
         
         Args:
             detected_products: List of detected products from detect_products()
-            inventory_items: List of inventory items from database
+            inventory_items: InventoryIndex (or raw list of inventory items)
             
         Returns:
             List of matched products with inventory info
         """
+        index = inventory_items if isinstance(inventory_items, InventoryIndex) else InventoryIndex(inventory_items)
         matched_products = []
         
         for detection in detected_products:
-            detected_text = detection['detected_text'].lower()
-            best_match = None
-            best_score = 0
+            best_match, source = None, None
             
-            # Try to match with inventory
-            for item in inventory_items:
-                score = 0
-                
-                # Check if SKU appears in text
-                if item.get('sku', '').lower() in detected_text:
-                    score += 50
-                
-                # Check if barcode appears in text
-                if item.get('barcode', '').lower() in detected_text:
-                    score += 50
-                
-                # Check if product name words appear in text
-                name_words = item.get('name', '').lower().split()
-                for word in name_words:
-                    if len(word) > 3 and word in detected_text:
-                        score += 10
-                
-                if score > best_score:
-                    best_score = score
-                    best_match = item
+            # A decoded barcode is an exact lookup
+            if detection.get('barcode'):
+                best_match, source = index.match_code(detection['barcode']['data'])
+            if best_match is not None:
+                best_score = 100.0
+            else:
+                best_match, best_score = index.match_text(detection['detected_text'])
+                source = 'text' if best_match is not None else None
             
             matched_products.append({
                 **detection,
                 'matched_inventory': best_match,
                 'match_confidence': best_score,
-                'is_matched': best_score > 30  # Threshold for matching
+                'match_source': source,
+                'is_matched': best_score >= TEXT_MATCH_THRESHOLD
             })
         
         return matched_products
     
-    def visualize_detections(self, image_path: str, detections: List[Dict], output_path: str = None):
+    def visualize_detections(self, image: Union[str, np.ndarray], detections: List[Dict], output_path: str = None):
         """
         Draw bounding boxes and labels on the image
         
         Args:
-            image_path: Path to original image
+            image: Path to original image or decoded BGR array (left untouched)
             detections: List of detected products
             output_path: Path to save annotated image (optional)
             
         Returns:
             Annotated image as numpy array
         """
-        image = cv2.imread(image_path)
+        image = load_image(image).copy()
+        # Lines and labels grow with the image, so they stay legible at full resolution
+        thickness = max(2, int(round(max(image.shape[:2]) / 1000)) * 2)
+        font_scale = 0.25 * thickness
         
         for detection in detections:
             x1, y1, x2, y2 = detection['bbox']
@@ -163,20 +535,20 @@ class ProductDetector:
             
             # Draw rectangle
             color = (0, 255, 0) if detection.get('is_matched', False) else (0, 165, 255)
-            cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
+            cv2.rectangle(image, (x1, y1), (x2, y2), color, thickness)
             
             # Draw label
             label = f"{confidence:.2f}"
             if detection.get('matched_inventory'):
                 label = f"{detection['matched_inventory']['name'][:20]} ({confidence:.2f})"
             
-            cv2.putText(image, label, (x1, y1 - 10), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+            cv2.putText(image, label, (x1, y1 - 5 * thickness), 
+                       cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, thickness)
             
             # Draw detected text
             if text:
-                cv2.putText(image, text, (x1, y2 + 20), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
+                cv2.putText(image, text, (x1, y2 + 10 * thickness), 
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.8 * font_scale, (255, 255, 255), thickness // 2)
         
         if output_path:
             cv2.imwrite(output_path, image)
@@ -191,38 +563,11 @@ def extract_sku_barcode(text: str) -> Tuple[str, str]:
         text: Detected text string
         
     Returns:
-        Tuple of (sku, barcode)
+        Tuple of (sku, barcode): the first labeled SKU and the first barcode
+        with a valid check digit (None if not found)
     """
-    sku = None
-    barcode = None
-    
-    # Common SKU patterns
-    sku_patterns = [
-        r'SKU[:\s]*([A-Z0-9-]+)',
-        r'ITEM[:\s]*([A-Z0-9-]+)',
-        r'#([A-Z0-9-]+)',
-    ]
-    
-    for pattern in sku_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            sku = match.group(1)
-            break
-    
-    # Barcode patterns (common formats)
-    barcode_patterns = [
-        r'\b(\d{8})\b',   # EAN-8
-        r'\b(\d{12})\b',  # UPC-A
-        r'\b(\d{13})\b',  # EAN-13
-    ]
-    
-    for pattern in barcode_patterns:
-        match = re.search(pattern, text)
-        if match:
-            barcode = match.group(1)
-            break
-    
-    return sku, barcode
+    skus, barcodes = extract_codes(text)
+    return (skus[0] if skus else None), (barcodes[0] if barcodes else None)
 
 
 if __name__ == "__main__":
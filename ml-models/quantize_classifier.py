@@ -0,0 +1,214 @@
+"""
+AIMS - INT8 Post-Training Quantization for the Grocery Classifier
+Quantizes the trained classifier to INT8 (OpenVINO + NNCF), calibrated on a
+sample of the grocery_yolo val split, and reports top-1/top-5 accuracy and
+per-image latency against the FP32 PyTorch model
+"""
+
+import json
+import random
+import shutil
+import statistics
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from ultralytics import YOLO
+
+from inference_engine import IMAGE_EXTENSIONS, export_model, load_model
+
+DATA_DIR = Path(__file__).parent / 'data' / 'grocery_yolo'
+CALIBRATION_DIR = Path(__file__).parent / 'data' / 'grocery_calibration'
+
+
+def sample_split(split_dir: Path, per_class: int, seed: int) -> List[Tuple[Path, str]]:
+    """
+    Pick up to per_class random images of every class in a split
+
+    Returns:
+        List of (image path, class name)
+    """
+    rng = random.Random(seed)
+    samples = []
+    for class_dir in sorted(path for path in split_dir.iterdir() if path.is_dir()):
+        images = sorted(path for path in class_dir.iterdir() if path.suffix.lower() in IMAGE_EXTENSIONS)
+        rng.shuffle(images)
+        samples.extend((image, class_dir.name) for image in images[:per_class])
+    return samples
+
+
+def build_calibration_set(samples: List[Tuple[Path, str]], output_dir: Path) -> Path:
+    """
+    Lay the calibration sample out as a classification dataset
+    (ultralytics calibrates on its 'val' split and reads classes from 'train')
+    """
+    if output_dir.exists():
+        shutil.rmtree(output_dir)
+    for image, class_name in samples:
+        for split in ('train', 'val'):
+            class_dir = output_dir / split / class_name
+            class_dir.mkdir(parents=True, exist_ok=True)
+            shutil.copy(image, class_dir / image.name)
+    return output_dir
+
+
+def evaluate(model, samples: List[Tuple[Path, str]], warmup: int = 5) -> Dict:
+    """
+    Top-1/top-5 accuracy and per-image latency (batch size 1)
+
+    Args:
+        model: ultralytics classification model (any engine)
+        samples: List of (image path, class name)
+        warmup: Untimed inferences before measuring
+
+    Returns:
+        Dict with top1, top5, latency_ms (median), latency_p95_ms, images_per_second
+    """
+    name_to_index = {name: index for index, name in model.names.items()}
+    for image, _ in samples[:warmup]:
+        model(str(image), verbose=False)
+
+    top1 = top5 = 0
+    latencies = []
+    for image, class_name in samples:
+        start = time.perf_counter()
+        result = model(str(image), verbose=False)[0]
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        top = [int(index) for index in result.probs.top5]
+        label = name_to_index.get(class_name)
+        top1 += int(top[0] == label)
+        top5 += int(label in top)
+
+    latencies.sort()
+    return {
+        'top1': top1 / len(samples),
+        'top5': top5 / len(samples),
+        'latency_ms': round(statistics.median(latencies), 2),
+        'latency_p95_ms': round(latencies[int(0.95 * (len(latencies) - 1))], 2),
+        'images_per_second': round(1000 * len(latencies) / sum(latencies), 1)
+    }
+
+
+def quantize_classifier(
+    weights='weights/grocery_classifier_best.pt',
+    calibration_per_class=10,
+    eval_split='test',
+    eval_per_class=20,
+    tolerance=0.01,
+    seed=0
+):
+    """
+    Quantize the classifier to INT8 and compare it to FP32
+
+    Args:
+        weights: FP32 PyTorch weights from train_classification.py
+        calibration_per_class: Calibration images per class (from val)
+        eval_split: Split accuracy/latency are measured on (falls back to val)
+        eval_per_class: Evaluation images per class
+        tolerance: Max allowed top-1/top-5 accuracy drop (absolute, 0.01 = 1 point)
+        seed: Sampling seed
+
+    Returns:
+        Report dict (also saved next to the quantized model)
+    """
+    print("=" * 80)
+    print("🚀 AIMS - INT8 Quantization of the Grocery Classifier")
+    print("=" * 80)
+
+    # Calibration sample
+    print(f"\n[1/4] Sampling {calibration_per_class} calibration images per class from val...")
+    calibration = sample_split(DATA_DIR / 'val', calibration_per_class, seed)
+    if not calibration:
+        raise FileNotFoundError(f"No validation images in {DATA_DIR / 'val'} - run train_classification.py first")
+    calibration_dir = build_calibration_set(calibration, CALIBRATION_DIR)
+    print(f"✅ {len(calibration)} calibration images in {calibration_dir}")
+
+    # Quantize
+    print("\n[2/4] Quantizing (OpenVINO INT8 post-training quantization)...")
+    int8_path, _ = export_model(weights, 'openvino', variant='int8', force=True,
+                                int8=True, data=str(calibration_dir))
+
+    # Evaluate both
+    split = eval_split if (DATA_DIR / eval_split).exists() else 'val'
+    samples = sample_split(DATA_DIR / split, eval_per_class, seed + 1)
+    print(f"\n[3/4] Evaluating FP32 and INT8 on {len(samples)} {split} images...")
+    fp32 = evaluate(YOLO(weights), samples)
+    int8_model, _ = load_model(int8_path, task='classify')
+    int8 = evaluate(int8_model, samples)
+
+    top1_drop = fp32['top1'] - int8['top1']
+    top5_drop = fp32['top5'] - int8['top5']
+    passed = top1_drop <= tolerance and top5_drop <= tolerance
+
+    report = {
+        'weights': weights,
+        'quantized_model': int8_path,
+        'created_at': datetime.now().isoformat(),
+        'calibration_images': len(calibration),
+        'eval_split': split,
+        'eval_images': len(samples),
+        'fp32': fp32,
+        'int8': int8,
+        'top1_drop': round(top1_drop, 4),
+        'top5_drop': round(top5_drop, 4),
+        'speedup': round(fp32['latency_ms'] / int8['latency_ms'], 2),
+        'tolerance': tolerance,
+        'passed': passed
+    }
+    report_path = Path(int8_path).parent / f"{Path(weights).stem}_int8_report.json"
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    # Summary
+    print("\n[4/4] Results:")
+    print(f"   {'':6s} {'Top-1':>8s} {'Top-5':>8s} {'Latency':>10s} {'img/s':>8s}")
+    for name, metrics in (('FP32', fp32), ('INT8', int8)):
+        print(f"   {name:6s} {metrics['top1']:8.2%} {metrics['top5']:8.2%} "
+              f"{metrics['latency_ms']:8.1f}ms {metrics['images_per_second']:8.1f}")
+    print(f"\n   Accuracy drop: top-1 {top1_drop:.2%}, top-5 {top5_drop:.2%} (tolerance {tolerance:.2%})")
+    print(f"   Speedup: {report['speedup']}x")
+    print(f"   Report: {report_path}")
+
+    if passed:
+        print(f"\n✅ INT8 model within tolerance: {int8_path}")
+        print("\n📝 To serve it, register and activate it (running servers switch to it in the background):")
+        print(f"   python model_registry.py register classifier {Path(int8_path).as_posix()} --activate")
+        print("   (or POST /api/models/classifier/versions with the admin token)")
+    else:
+        print("\n❌ Accuracy loss exceeds tolerance - keep serving the FP32 model")
+    print("=" * 80)
+
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='INT8 post-training quantization of the grocery classifier')
+    parser.add_argument('--weights', type=str, default='weights/grocery_classifier_best.pt',
+                        help='FP32 weights from train_classification.py')
+    parser.add_argument('--calib-per-class', type=int, default=10,
+                        help='Calibration images per class (from the val split)')
+    parser.add_argument('--eval-split', type=str, default='test',
+                        help='Split to measure accuracy and latency on')
+    parser.add_argument('--eval-per-class', type=int, default=20,
+                        help='Evaluation images per class')
+    parser.add_argument('--tolerance', type=float, default=0.01,
+                        help='Max top-1/top-5 accuracy drop (0.01 = 1 point)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Sampling seed')
+
+    args = parser.parse_args()
+
+    result = quantize_classifier(
+        weights=args.weights,
+        calibration_per_class=args.calib_per_class,
+        eval_split=args.eval_split,
+        eval_per_class=args.eval_per_class,
+        tolerance=args.tolerance,
+        seed=args.seed
+    )
+    sys.exit(0 if result['passed'] else 1)
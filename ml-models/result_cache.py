@@ -0,0 +1,362 @@
+"""
+AIMS Result Cache
+Content-addressed cache of detection/classification results
+(LRU + TTL in memory, optional on-disk tier written in the background and
+kept within a size/count budget by a background sweeper)
+"""
+
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+import numpy as np
+
+# Temp files of in-progress disk writes younger than this are left to their writer
+TMP_GRACE_SECONDS = 60
+
+
+def weights_identity(model_path: str) -> str:
+    """
+    Identify a weights file by path, size and modification time
+
+    Args:
+        model_path: Path to model weights
+
+    Returns:
+        String that changes whenever the weights file is replaced
+    """
+    try:
+        stat = os.stat(model_path)
+        return f"{os.path.abspath(model_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    except OSError:
+        # e.g. 'yolov8n.pt' before ultralytics has downloaded it
+        return model_path
+
+
+def _to_builtin(value):
+    """json.dumps fallback for numpy scalars/arrays in model output"""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class ResultCache:
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl_seconds=3600, disk_dir: str = None,
+                 disk_max_entries=100000, disk_max_bytes=1024 ** 3, sweep_interval=300,
+                 disk_write_queue=1024, async_disk_writes=True):
+        """
+        Initialize the cache
+
+        Args:
+            max_entries: Maximum number of results kept in memory
+            max_bytes: Memory bound for cached results (serialized size)
+            ttl_seconds: Time after which a result is recomputed
+            disk_dir: Directory for the on-disk tier (None = memory only)
+            disk_max_entries: Maximum number of results kept on disk
+            disk_max_bytes: Size budget of the on-disk tier; oldest results
+                are evicted beyond it
+            sweep_interval: Seconds between passes of the disk sweeper
+            disk_write_queue: Results waiting for the disk writer; beyond it
+                new results are only cached in memory
+            async_disk_writes: Write the disk tier from a background thread;
+                False = before put() returns (for entries another process
+                must find as soon as the response is out)
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self.disk_dir = disk_dir
+        self.disk_max_entries = disk_max_entries
+        self.disk_max_bytes = disk_max_bytes
+        self.sweep_interval = sweep_interval
+        self._sweeper = None
+        self._sweeper_pid = None
+        self.disk_write_queue = disk_write_queue
+        self.async_disk_writes = async_disk_writes
+        self._writes = None
+        self._writer = None
+        self._writer_pid = None
+
+        self._entries = OrderedDict()  # key -> (stored_at, serialized)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_entries = 0
+        self.disk_bytes = 0
+        self.disk_evictions = 0
+        self.disk_writes_dropped = 0
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(image_bytes: bytes, model_id: str, mode: str) -> str:
+        """
+        Build a cache key from the image content and the model that would process it
+
+        Args:
+            image_bytes: Raw uploaded file contents
+            model_id: Identity of the models and settings producing the result
+                (detection_api.model_identity: versions plus weights_identity)
+            mode: Pipeline mode (classification/detection)
+
+        Returns:
+            Hex digest usable as cache key
+        """
+        digest = hashlib.sha256(image_bytes)
+        digest.update(f"|{model_id}|{mode}".encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Look up a result
+
+        Args:
+            key: Cache key from make_key()
+
+        Returns:
+            Cached result (fresh copy) or None on miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, serialized = entry
+                if now - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(serialized)
+                self._remove(key)
+
+        disk_entry = self._disk_get(key, now)
+        with self._lock:
+            if disk_entry is None:
+                self.misses += 1
+                return None
+            stored_at, serialized = disk_entry
+            self.hits += 1
+            self.disk_hits += 1
+            self._insert(key, serialized, stored_at)
+        return json.loads(serialized)
+
+    def put(self, key: str, value: Any):
+        """
+        Store a result
+
+        Args:
+            key: Cache key from make_key()
+            value: JSON-serializable result
+        """
+        try:
+            serialized = json.dumps(value, default=_to_builtin)
+        except (TypeError, ValueError) as e:
+            print(f"⚠️  Result not cacheable: {e}")
+            return
+
+        now = time.time()
+        with self._lock:
+            self._insert(key, serialized, now)
+        self._disk_put(key, serialized)
+
+    def _insert(self, key: str, serialized: str, stored_at: float):
+        size = len(serialized)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (stored_at, serialized)
+        self._bytes += size
+        # Evict least recently used entries until within bounds
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, serialized = self._entries.pop(key)
+        self._bytes -= len(serialized)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[float, str]]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            stored_at = os.path.getmtime(path)
+            if now - stored_at > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                return stored_at, f.read()
+        except OSError:
+            return None
+
+    def _disk_put(self, key: str, serialized: str):
+        # Written by the writer thread, off the request thread
+        if not self.disk_dir:
+            return
+        self._ensure_sweeper()
+        if not self.async_disk_writes:
+            self._disk_write(key, serialized)
+            return
+        self._ensure_writer()
+        try:
+            self._writes.put_nowait((key, serialized))
+        except queue.Full:
+            with self._lock:
+                self.disk_writes_dropped += 1
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Wait until queued disk writes are done
+
+        Returns:
+            False if writes are still pending after timeout
+        """
+        writes = self._writes
+        if writes is None or self._writer_pid != os.getpid():
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with writes.all_tasks_done:
+            while writes.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                writes.all_tasks_done.wait(remaining)
+        return True
+
+    def _ensure_writer(self):
+        """Start the disk writer thread (again after a fork, with a fresh queue)"""
+        if self._writer is not None and self._writer.is_alive() and self._writer_pid == os.getpid():
+            return
+        with self._lock:
+            if self._writer is not None and self._writer.is_alive() and self._writer_pid == os.getpid():
+                return
+            self._writer_pid = os.getpid()
+            self._writes = queue.Queue(maxsize=self.disk_write_queue)
+            self._writer = threading.Thread(target=self._write_loop, args=(self._writes,),
+                                            name='result-cache-writer', daemon=True)
+            self._writer.start()
+
+    def _write_loop(self, writes: queue.Queue):
+        while True:
+            key, serialized = writes.get()
+            try:
+                self._disk_write(key, serialized)
+            finally:
+                writes.task_done()
+
+    def _disk_write(self, key: str, serialized: str):
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(serialized)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️  Could not write result cache entry: {e}")
+
+    def _ensure_sweeper(self):
+        """Start the disk sweeper thread (again after a fork, threads don't survive it)"""
+        if self._sweeper is not None and self._sweeper.is_alive() and self._sweeper_pid == os.getpid():
+            return
+        with self._lock:
+            if self._sweeper is not None and self._sweeper.is_alive() and self._sweeper_pid == os.getpid():
+                return
+            self._sweeper_pid = os.getpid()
+            self._sweeper = threading.Thread(target=self._sweep_loop, name='result-cache-sweeper', daemon=True)
+            self._sweeper.start()
+
+    def _sweep_loop(self):
+        while True:
+            try:
+                self.sweep_disk()
+            except Exception as e:
+                print(f"⚠️  Result cache sweep failed: {e}")
+            time.sleep(self.sweep_interval)
+
+    def sweep_disk(self):
+        """
+        Delete on-disk results older than the TTL, then the oldest results
+        until the tier is within disk_max_entries and disk_max_bytes
+
+        Temp files of writes in progress are skipped; those older than
+        TMP_GRACE_SECONDS are leftovers of a crashed writer and deleted.
+        """
+        if not self.disk_dir:
+            return
+        now = time.time()
+        files = []
+        for dirpath, _, filenames in os.walk(self.disk_dir):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if filename.endswith('.tmp'):
+                    if now - stat.st_mtime > TMP_GRACE_SECONDS:
+                        try:
+                            os.remove(path)
+                        except OSError:
+                            pass
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        files.sort()
+        count, total = len(files), sum(size for _, size, _ in files)
+        evicted = 0
+
+        for mtime, size, path in files:
+            if now - mtime <= self.ttl and count <= self.disk_max_entries and total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            count -= 1
+            total -= size
+            evicted += 1
+
+        with self._lock:
+            self.disk_entries = count
+            self.disk_bytes = total
+            self.disk_evictions += evicted
+        if evicted:
+            print(f"🧹 Evicted {evicted} cached results from disk")
+
+    def stats(self) -> dict:
+        """Get hit/miss counters and current usage"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+                'ttl_seconds': self.ttl,
+                'disk_tier': bool(self.disk_dir),
+                'disk_entries': self.disk_entries,
+                'disk_bytes': self.disk_bytes,
+                'disk_max_bytes': self.disk_max_bytes,
+                'disk_evictions': self.disk_evictions,
+                'disk_writes_dropped': self.disk_writes_dropped
+            }
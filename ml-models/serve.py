@@ -0,0 +1,229 @@
+"""
+AIMS Production Server
+Pre-fork multi-process server for the detection API: models are loaded once
+in the parent before forking, so their weights are shared copy-on-write by
+all workers; each worker gets a fixed share of CPU threads
+
+Workers share server-side state through disk (inventory versions, annotation
+specs, the result cache's disk tier), so any worker can serve any request, and
+merge their metrics, so /metrics reports the whole server. Admission limits
+are split between the workers. On SIGTERM, workers stop accepting connections
+and finish in-flight requests (up to --drain-timeout) before exiting.
+
+Each worker runs werkzeug's HTTP server, which has no request timeouts or
+protection against slow clients: keep it on a private network or behind a
+reverse proxy (e.g. nginx) that buffers requests and enforces timeouts.
+
+Usage: python serve.py --workers 8 --threads-per-worker 4
+(POSIX only; on Windows use `python detection_api.py`)
+"""
+
+import gc
+import math
+import os
+import shutil
+import signal
+import socket
+import sys
+import threading
+import time
+
+
+def pin_threads(threads: int):
+    """
+    Limit intra-op parallelism of this process, so N workers don't
+    oversubscribe the CPU
+
+    Args:
+        threads: Threads for torch/OpenMP/OpenCV in this worker
+    """
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[var] = str(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # Already set (inter-op pool was used before fork)
+    except ImportError:
+        pass
+    try:
+        import cv2
+        cv2.setNumThreads(threads)
+    except ImportError:
+        pass
+
+
+def run_worker(api, listen_socket: socket.socket, threads: int, workers: int, drain_timeout: float):
+    """Serve requests in a forked worker (never returns)"""
+    from werkzeug.serving import make_server
+
+    pin_threads(threads)
+
+    # The job queue's worker pool belongs to the parent
+    api.job_queue.autostart = False
+
+    # Admission limits are server-wide; metrics are merged across workers
+    api.configure_admission(workers)
+    if workers > 1 and api.METRICS_MULTIPROCESS_DIR:
+        api.REGISTRY.enable_multiprocess(api.METRICS_MULTIPROCESS_DIR)
+
+    # Weights are already loaded (shared with the parent); warm up this
+    # process' own inference state in the background, /ready tracks it
+    api.start_preload()
+
+    host, port = listen_socket.getsockname()[:2]
+    server = make_server(host, port, api.app, threaded=True, fd=listen_socket.fileno())
+    # Track request threads, so server_close() waits for them
+    server.daemon_threads = False
+
+    def drain(*_):
+        # Stop accepting (shutdown() must not run on the serving thread), then
+        # give in-flight requests drain_timeout to finish
+        threading.Thread(target=server.shutdown, daemon=True).start()
+        threading.Timer(drain_timeout, lambda: os._exit(0)).start()
+
+    signal.signal(signal.SIGTERM, drain)
+    signal.signal(signal.SIGINT, drain)  # Ctrl+C reaches the whole process group; the parent stops us
+    server.serve_forever()
+    server.server_close()
+    os._exit(0)
+
+
+def serve(host='0.0.0.0', port=5001, workers=None, threads_per_worker=None, drain_timeout=30.0):
+    """
+    Load models, fork workers sharing one listening socket, supervise them
+
+    Args:
+        host: Bind address
+        port: Bind port
+        workers: Number of worker processes (default: CPU count / threads)
+        threads_per_worker: Torch/OpenMP threads per worker (default: 1)
+        drain_timeout: Seconds a stopping worker waits for in-flight requests
+    """
+    if not hasattr(os, 'fork'):
+        print("❌ serve.py needs fork() (Linux/macOS). On Windows run: python detection_api.py")
+        sys.exit(1)
+
+    cpus = os.cpu_count() or 1
+    threads_per_worker = threads_per_worker or 1
+    workers = workers or max(1, cpus // threads_per_worker)
+
+    import detection_api as api
+
+    if workers > 1:
+        # Each worker has its own memory: state requests share must live on disk
+        if api.INVENTORY_DIR is None:
+            print("❌ Workers can't share in-memory inventory versions: set INVENTORY_DIR or use --workers 1")
+            sys.exit(1)
+        if api.ANNOTATION_SPEC_DIR is None or not api.SAVE_UPLOADS:
+            print("⚠️  Annotated images can only be fetched from the worker that served the detection "
+                  "(set ANNOTATION_SPEC_DIR and SAVE_UPLOADS)")
+        if api.RESULT_CACHE_DIR is None:
+            print("⚠️  No RESULT_CACHE_DIR: each worker caches results separately")
+        if api.METRICS_MULTIPROCESS_DIR is None:
+            print("⚠️  No METRICS_MULTIPROCESS_DIR: /metrics reports whichever worker answers")
+        else:
+            # Totals restart with the server
+            shutil.rmtree(api.METRICS_MULTIPROCESS_DIR, ignore_errors=True)
+        per_worker = math.ceil(max(api.MAX_CONCURRENT_INFERENCE, api.MAX_BATCH_SIZE) / workers)
+        if per_worker < api.MAX_BATCH_SIZE:
+            print(f"⚠️  Each worker admits {per_worker} requests at once, fewer than MAX_BATCH_SIZE "
+                  f"({api.MAX_BATCH_SIZE}): raise MAX_CONCURRENT_INFERENCE for full batches")
+
+    # Load weights in the parent only: no inference here, since a torch
+    # thread pool started before fork() is not usable in the children
+    if api.ENGINE_PARITY_IMAGES:
+        # The check runs inference, which must not happen before fork()
+        print("⚠️  Skipping the engine parity check in the server; run inference_engine.py before deploying")
+        api.ENGINE_PARITY_IMAGES = None
+
+    print(f"🔧 Loading models for mode '{api.MODE}' in parent process...")
+    loaders = {'classifier': api.get_classifier, 'detector': api.get_detector}
+    for name in api.required_models():
+        loaders[name](mark_ready=False)  # Ready once warmed up in each worker
+
+    listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listen_socket.bind((host, port))
+    listen_socket.listen(128)
+    listen_socket.set_inheritable(True)
+
+    # Keep the garbage collector from touching (and un-sharing) pages of
+    # objects created so far
+    gc.collect()
+    gc.freeze()
+
+    children = {}
+
+    def spawn(slot):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(api, listen_socket, threads_per_worker, workers, drain_timeout)
+            finally:
+                os._exit(1)
+        children[pid] = slot
+
+    for slot in range(workers):
+        spawn(slot)
+    print(f"🚀 Serving on http://{host}:{port} with {workers} workers x {threads_per_worker} threads")
+
+    # Scan job workers are spawned (not forked) and shared by all HTTP workers
+    api.job_queue.start()
+
+    stopping = False
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+        listen_socket.close()  # Workers keep their copies until they have drained
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # Supervise: restart workers that die (only our HTTP workers are reaped
+    # here; the job queue's processes are managed by multiprocessing)
+    while children:
+        time.sleep(1)
+        for pid, slot in list(children.items()):
+            try:
+                exited, status = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                exited, status = pid, -1
+            if exited == 0:
+                continue
+            del children[pid]
+            if not stopping:
+                print(f"⚠️  Worker {pid} exited ({status}), restarting")
+                spawn(slot)
+
+    api.job_queue.stop()
+    print("👋 Server stopped")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run the AIMS detection API with multiple worker processes')
+    parser.add_argument('--host', type=str, default='0.0.0.0',
+                        help='Bind address')
+    parser.add_argument('--port', type=int, default=5001,
+                        help='Bind port')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes (default: CPU count / threads per worker)')
+    parser.add_argument('--threads-per-worker', type=int, default=1,
+                        help='Torch/OpenMP threads per worker')
+    parser.add_argument('--drain-timeout', type=float, default=30.0,
+                        help='Seconds a stopping worker waits for in-flight requests')
+
+    args = parser.parse_args()
+
+    serve(host=args.host, port=args.port, workers=args.workers,
+          threads_per_worker=args.threads_per_worker, drain_timeout=args.drain_timeout)
@@ -0,0 +1,100 @@
+"""
+Tests for AIMS admission control
+Usage: python -m pytest test_admission.py
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from admission import AdmissionController, Overloaded
+from inference_scheduler import DeadlineExceeded
+
+
+def test_slots_up_to_max_concurrent():
+    admission = AdmissionController(max_concurrent=2, max_queue=0)
+    tokens = [admission.acquire(), admission.acquire()]
+    assert admission.stats()['active'] == 2
+    for token in tokens:
+        admission.release(token)
+    assert admission.stats()['active'] == 0
+    assert admission.stats()['admitted'] == 2
+
+
+def test_full_queue_is_rejected_with_429():
+    admission = AdmissionController(max_concurrent=1, max_queue=0)
+    admission.acquire()
+    with pytest.raises(Overloaded) as error:
+        admission.acquire()
+    assert error.value.status == 429
+    assert error.value.reason == 'queue_full'
+    assert error.value.retry_after >= 1
+    assert admission.stats()['rejected'] == {'queue_full': 1}
+
+
+def test_queue_timeout_is_rejected_with_503():
+    admission = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout_ms=50)
+    admission.acquire()
+    with pytest.raises(Overloaded) as error:
+        admission.acquire()
+    assert error.value.status == 503
+    assert error.value.reason == 'queue_timeout'
+
+
+def test_waiter_gets_the_released_slot():
+    admission = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout_ms=2000)
+    token = admission.acquire()
+    threading.Timer(0.05, admission.release, args=(token,)).start()
+    admission.acquire()
+    assert admission.stats()['admitted'] == 2
+
+
+def test_deadline_passing_in_the_queue():
+    admission = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout_ms=2000)
+    admission.acquire()
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        admission.acquire(deadline=time.monotonic() + 0.05)
+    assert time.monotonic() - start < 1
+    assert admission.stats()['rejected'] == {'deadline': 1}
+
+
+def test_retry_after_grows_with_the_queue():
+    admission = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout_ms=2000)
+    admission._service_seconds = 2.0
+    idle = admission.retry_after()
+    token = admission.acquire()
+    waiters = [threading.Thread(target=lambda: admission.release(admission.acquire())) for _ in range(3)]
+    for waiter in waiters:
+        waiter.start()
+    while admission.stats()['waiting'] < 3:
+        time.sleep(0.01)
+    assert admission.retry_after() > idle
+    assert admission.stats()['retry_after_seconds'] == admission.retry_after()
+    admission.release(token)
+    for waiter in waiters:
+        waiter.join()
+
+
+def test_slot_released_when_running_work_finishes():
+    admission = AdmissionController(max_concurrent=1, max_queue=0)
+    future = Future()
+    admission.release_when_done(admission.acquire(), future)
+    with pytest.raises(Overloaded):
+        admission.acquire()
+    future.set_result(None)
+    admission.acquire()
+
+
+def test_overloaded_response_carries_retry_after(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    import detection_api
+
+    error = Overloaded('Server busy: inference queue is full', 429, 7, 'queue_full')
+    with detection_api.app.test_request_context():
+        response, status = detection_api.overloaded_response(error)
+    assert status == 429
+    assert response.headers['Retry-After'] == '7'
+    assert response.get_json() == {'success': False, 'error': str(error), 'retry_after': 7}
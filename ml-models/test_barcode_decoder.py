@@ -0,0 +1,83 @@
+"""
+Tests for AIMS barcode decoding
+Usage: python -m pytest test_barcode_decoder.py
+"""
+
+import cv2
+import numpy as np
+import pytest
+
+from barcode_decoder import BarcodeDecoder
+from image_io import NormalizedImage, encode_image
+
+# EAN-13 module patterns: left digits use L or G codes (picked by the first digit), right digits R codes
+L_CODES = ['0001101', '0011001', '0010011', '0111101', '0100011',
+           '0110001', '0101111', '0111011', '0110111', '0001011']
+G_CODES = ['0100111', '0110011', '0011011', '0100001', '0011101',
+           '0111001', '0000101', '0010001', '0001001', '0010111']
+R_CODES = ['1110010', '1100110', '1101100', '1000010', '1011100',
+           '1001110', '1010000', '1000100', '1001000', '1110100']
+PARITY = ['LLLLLL', 'LLGLGG', 'LLGGLG', 'LLGGGL', 'LGLLGG',
+          'LGGLLG', 'LGGGLL', 'LGLGLG', 'LGLGGL', 'LGGLGL']
+
+EAN = '5901234123457'
+
+requires_barcode = pytest.mark.skipif(not hasattr(cv2, 'barcode'), reason='OpenCV has no barcode module')
+
+
+def draw_ean13(code: str, module=2, height=80, quiet=50) -> np.ndarray:
+    """BGR image of a black-on-white EAN-13 barcode (with a white margin)"""
+    digits = [int(d) for d in code]
+    modules = '101'
+    for digit, parity in zip(digits[1:7], PARITY[digits[0]]):
+        modules += (L_CODES if parity == 'L' else G_CODES)[digit]
+    modules += '01010'
+    modules += ''.join(R_CODES[digit] for digit in digits[7:])
+    modules += '101'
+    row = np.repeat(np.array([0 if m == '1' else 255 for m in modules], dtype=np.uint8), module)
+    image = np.full((height + 2 * quiet, len(row) + 2 * quiet, 3), 255, dtype=np.uint8)
+    image[quiet:quiet + height, quiet:quiet + len(row)] = row[None, :, None]
+    return image
+
+
+def shelf_image(width=4000, height=3000, at=(2600, 1700)):
+    """Large gray image with one small (slightly blurred, as photographed) barcode; returns (image, barcode box)"""
+    image = np.full((height, width, 3), 180, dtype=np.uint8)
+    barcode = cv2.GaussianBlur(draw_ean13(EAN), (3, 3), 0)
+    x, y = at
+    image[y:y + barcode.shape[0], x:x + barcode.shape[1]] = barcode
+    return image, [x, y, x + barcode.shape[1], y + barcode.shape[0]]
+
+
+@requires_barcode
+def test_decodes_crop():
+    codes = BarcodeDecoder().decode(draw_ean13(EAN))
+    assert [code['data'] for code in codes] == [EAN]
+
+
+@requires_barcode
+def test_image_scope_finds_small_barcode_in_large_image():
+    image, barcode_box = shelf_image()
+    normalized = NormalizedImage(encode_image(image, 'png'), max_side=640)
+    assert max(normalized.shape[:2]) == 640
+    assert BarcodeDecoder().decode(normalized.image) == []  # Bars are ~0.3px wide in the working copy
+
+    # Boxes in working copy coordinates, as YOLO reports them
+    scale = normalized.shape[1] / image.shape[1]
+    product = [int(v * scale) for v in barcode_box]
+    product = [product[0] - 5, product[1] - 5, product[2] + 5, product[3] + 5]
+    boxes = [{'bbox': [10, 10, 100, 100]}, {'bbox': product}]
+
+    found = BarcodeDecoder(scope='image').find_codes(normalized, boxes, [None, None], [0, 1])
+
+    assert list(found) == [1]
+    assert found[1] == {'type': 'EAN_13', 'data': EAN}
+
+
+@requires_barcode
+def test_image_scope_skips_non_candidates():
+    image, barcode_box = shelf_image(width=1200, height=900, at=(500, 400))
+    boxes = [{'bbox': barcode_box}]
+
+    assert BarcodeDecoder(scope='image').find_codes(image, boxes, [None], []) == {}
+    assert 0 in BarcodeDecoder(scope='image').find_codes(image, boxes, [None], [0])
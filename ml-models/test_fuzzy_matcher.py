@@ -0,0 +1,72 @@
+"""
+Tests for AIMS OCR text matching
+Usage: python -m pytest test_fuzzy_matcher.py
+"""
+
+import pytest
+
+from fuzzy_matcher import normalize, substring_distance
+from inventory_index import InventoryIndex, TEXT_MATCH_THRESHOLD
+
+INVENTORY = [
+    {'id': 1, 'sku': 'CC-500', 'barcode': '5901234123457', 'name': 'Coca-Cola Classic 500ml'},
+    {'id': 2, 'sku': 'FM-1000', 'name': 'Fresh Milk 1L'},
+    {'id': 3, 'sku': 'MCB-100', 'name': 'Milk Chocolate Bar'},
+    {'id': 4, 'sku': 'PM-330', 'name': 'Pepsi Max 330ml'},
+    {'id': 5, 'sku': 'BB-750', 'name': 'Basmati Rice Premium 750g'},
+]
+
+
+@pytest.fixture(scope='module')
+def index():
+    return InventoryIndex(INVENTORY)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('C0CA-C0LA', 'Coca-Cola Classic 500ml'),        # OCR digit/letter confusions
+    ('Mi1k', 'Fresh Milk 1L'),
+    ('fresh mi1k 1L', 'Fresh Milk 1L'),
+    ('MILK CHOC0LATE', 'Milk Chocolate Bar'),
+    ('Coca-Cola 500ml', 'Coca-Cola Classic 500ml'),
+    ('COCA-COLA CLASSIC 500ml sugar 12g per 100ml', 'Coca-Cola Classic 500ml'),
+    ('Basmatl Rlce', 'Basmati Rice Premium 750g'),   # One real edit per word
+    ('Pepsl', 'Pepsi Max 330ml'),
+])
+def test_ocr_text_matches(index, text, expected):
+    item, score = index.match_text(text)
+    assert item is not None and item['name'] == expected
+    assert score >= TEXT_MATCH_THRESHOLD
+
+
+@pytest.mark.parametrize('text', ['nutrition facts per serving', 'random text here', '1L', ''])
+def test_unrelated_text_does_not_match(index, text):
+    _, score = index.match_text(text)
+    assert score < TEXT_MATCH_THRESHOLD
+
+
+def test_extra_text_lowers_the_score(index):
+    _, short_score = index.match_text('Milk')
+    _, noisy_score = index.match_text('Milk powder formula stage 2 infant')
+    assert noisy_score < short_score
+
+
+def test_tie_goes_to_the_item_with_more_of_its_name_read(index):
+    item, _ = index.match_text('Milk')
+    assert item['name'] == 'Fresh Milk 1L'
+
+
+def test_codes_win(index):
+    assert index.match_text('5 901234 123457') == (INVENTORY[0], 100.0)
+    assert index.match_text('SKU: PM-330')[0] == INVENTORY[3]
+
+
+def test_substring_distance():
+    assert substring_distance('milk', 'freshmilkll', 1) == 0
+    assert substring_distance('cocacola', 'xxcocaxolaxx', 1) == 1
+    assert substring_distance('basmati', 'basmti', 1) == 1
+    assert substring_distance('chocolate', 'vanilla', 2) is None
+
+
+def test_normalize_folds_ocr_confusions():
+    assert normalize('C0CA-C0LA') == normalize('Coca-Cola')
+    assert normalize('Mi1k') == normalize('Milk')
@@ -0,0 +1,107 @@
+"""
+Tests for AIMS inference micro-batching
+Usage: python -m pytest test_inference_scheduler.py
+"""
+
+import threading
+import time
+
+import pytest
+
+from inference_scheduler import DeadlineExceeded, InferenceScheduler
+
+
+def make_scheduler(batch_fn, **kwargs):
+    calls = []
+
+    def record(items):
+        calls.append(list(items))
+        return batch_fn(items)
+
+    return InferenceScheduler(record, **kwargs), calls
+
+
+def test_concurrent_requests_share_one_batch():
+    scheduler, calls = make_scheduler(lambda items: [x * 2 for x in items], max_batch_size=4, max_wait_ms=200)
+    futures = [scheduler.submit(x) for x in range(4)]
+    assert [f.result(timeout=2) for f in futures] == [0, 2, 4, 6]
+    assert calls == [[0, 1, 2, 3]]
+
+
+def test_partial_batch_dispatched_after_max_wait():
+    scheduler, calls = make_scheduler(lambda items: items, max_batch_size=8, max_wait_ms=20)
+    start = time.monotonic()
+    assert scheduler.run('a', timeout=2) == 'a'
+    assert time.monotonic() - start < 1
+    assert calls == [['a']]
+
+
+def test_failed_batch_is_retried_one_by_one():
+    def batch_fn(items):
+        if 'bad' in items:
+            raise ValueError('unreadable image')
+        return items
+
+    scheduler, _ = make_scheduler(batch_fn, max_batch_size=3, max_wait_ms=200)
+    good, bad, other = (scheduler.submit(x) for x in ('good', 'bad', 'other'))
+    assert good.result(timeout=2) == 'good'
+    assert other.result(timeout=2) == 'other'
+    with pytest.raises(ValueError):
+        bad.result(timeout=2)
+    assert scheduler.stats()['failures'] == 1
+
+
+def test_expired_request_is_dropped_before_the_model_call():
+    scheduler, calls = make_scheduler(lambda items: items, max_batch_size=8, max_wait_ms=50)
+    expired = scheduler.submit('late', deadline=time.monotonic())
+    fresh = scheduler.submit('fresh')
+    with pytest.raises(DeadlineExceeded):
+        expired.result(timeout=2)
+    assert fresh.result(timeout=2) == 'fresh'
+    assert calls == [['fresh']]
+    assert scheduler.stats()['expired'] == 1
+
+
+def test_expired_request_is_not_retried_after_a_failed_batch():
+    def batch_fn(items):
+        if len(items) > 1:
+            time.sleep(0.2)
+            raise ValueError('batch failed')
+        return items
+
+    scheduler, calls = make_scheduler(batch_fn, max_batch_size=2, max_wait_ms=200)
+    short = scheduler.submit('short', deadline=time.monotonic() + 0.1)
+    patient = scheduler.submit('patient')
+    with pytest.raises(DeadlineExceeded):
+        short.result(timeout=2)
+    assert patient.result(timeout=2) == 'patient'
+    assert calls == [['short', 'patient'], ['patient']]
+
+
+def test_run_raises_deadline_exceeded_with_the_running_batch():
+    release = threading.Event()
+
+    def batch_fn(items):
+        release.wait(2)
+        return items
+
+    scheduler, _ = make_scheduler(batch_fn, max_batch_size=1, max_wait_ms=0)
+    with pytest.raises(DeadlineExceeded) as error:
+        scheduler.run('slow', deadline=time.monotonic() + 0.1)
+    release.set()
+    # The batch already started: the caller gets its future to wait on
+    assert error.value.running is not None
+    assert error.value.running.result(timeout=2) == 'slow'
+
+
+@pytest.mark.filterwarnings('ignore::pytest.PytestUnhandledThreadExceptionWarning')
+def test_fatal_error_fails_the_batch_and_restarts_the_dispatcher():
+    def batch_fn(items):
+        if items == ['fatal']:
+            raise SystemExit(1)
+        return items
+
+    scheduler, _ = make_scheduler(batch_fn, max_batch_size=1, max_wait_ms=0)
+    with pytest.raises(RuntimeError):
+        scheduler.submit('fatal').result(timeout=2)
+    assert scheduler.submit('next').result(timeout=2) == 'next'
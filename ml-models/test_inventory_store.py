@@ -0,0 +1,90 @@
+"""
+Tests for AIMS server-side inventory versions
+Usage: python -m pytest test_inventory_store.py
+"""
+
+import pytest
+
+from inventory_index import InventoryStore, VersionConflict
+
+INVENTORY = [
+    {'id': 1, 'sku': 'CC-500', 'name': 'Coca-Cola Classic 500ml'},
+    {'id': 2, 'sku': 'FM-1000', 'name': 'Fresh Milk 1L'},
+]
+
+
+def names(index):
+    return sorted(item['name'] for item in index.items.values())
+
+
+def test_sync_publishes_a_new_current_version():
+    store = InventoryStore()
+    first = store.sync(INVENTORY)
+    second = store.sync(INVENTORY[:1])
+    assert first.version != second.version
+    assert store.current is second
+    assert store.get('latest') is second
+
+
+def test_delta_builds_on_the_current_version():
+    store = InventoryStore()
+    base = store.sync(INVENTORY)
+    index = store.apply_delta(base.version, upserts=[{'id': 2, 'name': 'Fresh Milk 2L'},
+                                                     {'id': 3, 'sku': 'PM-330', 'name': 'Pepsi Max 330ml'}],
+                              deletes=[1])
+    assert store.current is index
+    assert names(index) == ['Fresh Milk 2L', 'Pepsi Max 330ml']
+    assert index.items[2]['sku'] == 'FM-1000'  # Upserts merge into the existing item
+    assert names(base) == ['Coca-Cola Classic 500ml', 'Fresh Milk 1L']  # Older version unchanged
+
+
+def test_delta_against_a_stale_version_conflicts():
+    store = InventoryStore()
+    stale = store.sync(INVENTORY)
+    current = store.apply_delta(stale.version, deletes=[1])
+    with pytest.raises(VersionConflict) as error:
+        store.apply_delta(stale.version, deletes=[2])
+    assert error.value.current_version == current.version
+    assert store.current is current
+
+
+def test_delta_without_a_current_version_conflicts():
+    with pytest.raises(VersionConflict) as error:
+        InventoryStore().apply_delta('0123456789abcdef', deletes=[1])
+    assert error.value.current_version is None
+
+
+def test_delta_items_need_an_id_or_sku():
+    store = InventoryStore()
+    base = store.sync(INVENTORY)
+    with pytest.raises(ValueError):
+        store.apply_delta(base.version, upserts=[{'name': 'No key'}])
+    assert store.current is base
+
+
+def test_only_recent_versions_are_kept():
+    store = InventoryStore(keep_versions=2)
+    versions = [store.sync(INVENTORY).version for _ in range(3)]
+    assert store.get(versions[0]) is None
+    assert all(store.get(version) is not None for version in versions[1:])
+
+
+def test_versions_are_shared_through_disk_dir(tmp_path):
+    publisher = InventoryStore(disk_dir=str(tmp_path))
+    follower = InventoryStore(disk_dir=str(tmp_path))
+    base = publisher.sync(INVENTORY)
+    assert follower.current.version == base.version
+
+    # A delta from another process is based on the version it published
+    index = follower.apply_delta(base.version, deletes=[2])
+    assert publisher.current.version == index.version
+    with pytest.raises(VersionConflict):
+        publisher.apply_delta(base.version, deletes=[1])
+    assert names(publisher.get(base.version)) == ['Coca-Cola Classic 500ml', 'Fresh Milk 1L']
+
+
+def test_disk_dir_keeps_only_recent_versions(tmp_path):
+    store = InventoryStore(keep_versions=2, disk_dir=str(tmp_path))
+    versions = [store.sync(INVENTORY).version for _ in range(3)]
+    assert InventoryStore(disk_dir=str(tmp_path)).get(versions[0]) is None
+    assert sorted(path.name for path in tmp_path.glob('*.json')) == sorted(f"{v}.json" for v in versions[1:])
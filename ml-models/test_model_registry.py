@@ -0,0 +1,101 @@
+"""
+Tests for AIMS model version registration
+Usage: python -m pytest test_model_registry.py
+"""
+
+import importlib
+
+import pytest
+
+from model_registry import ModelRegistry
+
+TOKEN = 'test-token'
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """detection_api with a private registry, weights directory and admin token"""
+    monkeypatch.chdir(tmp_path)
+    api = importlib.import_module('detection_api')
+    monkeypatch.setattr(api, 'PRELOAD_MODELS', False)
+    monkeypatch.setattr(api, 'MODEL_ADMIN_TOKEN', TOKEN)
+    monkeypatch.setattr(api, 'MODEL_WEIGHTS_DIR', str(tmp_path / 'weights'))
+    monkeypatch.setattr(api, 'model_registry', ModelRegistry(str(tmp_path / 'weights' / 'registry.json')))
+    (tmp_path / 'weights').mkdir(exist_ok=True)
+    return api
+
+
+def register(api, path):
+    return api.app.test_client().post('/api/models/classifier/versions', json={'path': str(path)},
+                                      headers={'Authorization': f'Bearer {TOKEN}'})
+
+
+def test_registers_exported_model_directory(api, tmp_path):
+    exported = tmp_path / 'weights' / 'grocery_classifier_best_openvino_model'
+    exported.mkdir()
+    (exported / 'model.xml').write_text('<net/>')
+
+    response = register(api, exported)
+
+    assert response.status_code == 201
+    assert api.model_registry.get('classifier', response.get_json()['version'])['path'] == str(exported)
+
+
+def test_rejects_weights_outside_weights_dir(api, tmp_path):
+    outside = tmp_path / 'model.pt'
+    outside.write_bytes(b'weights')
+    assert register(api, outside).status_code == 400
+    assert register(api, tmp_path / 'weights' / '..' / 'model.pt').status_code == 400
+
+
+def test_requires_admin_token(api, tmp_path):
+    (tmp_path / 'weights' / 'model.pt').write_bytes(b'weights')
+    response = api.app.test_client().post('/api/models/classifier/versions',
+                                          json={'path': str(tmp_path / 'weights' / 'model.pt')})
+    assert response.status_code == 401
+
+
+def test_default_retrained_in_place_gets_a_new_version(tmp_path):
+    weights = tmp_path / 'best.pt'
+    weights.write_bytes(b'v1')
+    registry = ModelRegistry(str(tmp_path / 'registry.json'), defaults={'classifier': str(weights)})
+    first = registry.active('classifier')['version']
+
+    weights.write_bytes(b'v2 retrained')
+    second = registry.active('classifier')['version']
+
+    assert second != first
+    assert ModelRegistry(str(tmp_path / 'registry.json')).active('classifier')['version'] == second
+
+
+def test_missing_default_is_registered_once_it_exists(tmp_path):
+    weights = tmp_path / 'best.pt'
+    registry = ModelRegistry(str(tmp_path / 'registry.json'), defaults={'classifier': str(weights)})
+    placeholder = registry.active('classifier')['version']
+
+    weights.write_bytes(b'trained')
+    assert registry.active('classifier')['version'] != placeholder
+
+
+def test_changed_default_does_not_override_an_activated_version(tmp_path):
+    default, other = tmp_path / 'best.pt', tmp_path / 'v2.pt'
+    default.write_bytes(b'v1')
+    other.write_bytes(b'v2')
+    registry = ModelRegistry(str(tmp_path / 'registry.json'), defaults={'classifier': str(default)})
+    registry.active('classifier')
+    activated = registry.register('classifier', str(other), activate=True)['version']
+
+    default.write_bytes(b'v1 retrained')
+    assert registry.active('classifier')['version'] == activated
+
+
+def test_writers_in_other_processes_are_not_lost(tmp_path):
+    path = str(tmp_path / 'registry.json')
+    first, second = ModelRegistry(path), ModelRegistry(path)
+    first.register('classifier', 'a.pt', version='a')
+    second.register('classifier', 'b.pt', version='b')
+    first.register('detector', 'c.pt', version='c')
+
+    models = ModelRegistry(path).info()
+    assert set(models['classifier']['versions']) == {'a', 'b'}
+    assert set(models['detector']['versions']) == {'c'}
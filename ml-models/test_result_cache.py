@@ -0,0 +1,111 @@
+"""
+Tests for AIMS result caching
+Usage: python -m pytest test_result_cache.py
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+from result_cache import TMP_GRACE_SECONDS, ResultCache
+
+
+def key(n: int) -> str:
+    return ResultCache.make_key(f"image-{n}".encode(), 'classifier@v1', 'classification')
+
+
+def test_key_depends_on_image_model_and_mode():
+    base = ResultCache.make_key(b'image', 'classifier@v1', 'classification')
+    assert base == ResultCache.make_key(b'image', 'classifier@v1', 'classification')
+    assert base != ResultCache.make_key(b'other', 'classifier@v1', 'classification')
+    assert base != ResultCache.make_key(b'image', 'classifier@v2', 'classification')
+    assert base != ResultCache.make_key(b'image', 'classifier@v1', 'detection')
+
+
+def test_get_returns_a_fresh_copy():
+    cache = ResultCache()
+    cache.put(key(1), {'boxes': [1, 2]})
+    cache.get(key(1))['boxes'].append(3)
+    assert cache.get(key(1)) == {'boxes': [1, 2]}
+
+
+def test_numpy_values_are_cached():
+    cache = ResultCache()
+    cache.put(key(1), {'confidence': np.float32(0.5), 'bbox': np.array([1, 2, 3, 4])})
+    assert cache.get(key(1)) == {'confidence': 0.5, 'bbox': [1, 2, 3, 4]}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache(max_entries=2)
+    cache.put(key(1), 1)
+    cache.put(key(2), 2)
+    cache.get(key(1))
+    cache.put(key(3), 3)
+    assert cache.get(key(2)) is None
+    assert cache.get(key(1)) == 1 and cache.get(key(3)) == 3
+    assert cache.stats()['evictions'] == 1
+
+
+def test_byte_budget_evicts_entries():
+    cache = ResultCache(max_bytes=100)
+    cache.put(key(1), 'x' * 60)
+    cache.put(key(2), 'y' * 60)
+    assert cache.get(key(1)) is None
+    assert cache.stats()['bytes'] <= 100
+
+
+def test_expired_entry_is_a_miss():
+    cache = ResultCache(ttl_seconds=0.05)
+    cache.put(key(1), 1)
+    time.sleep(0.1)
+    assert cache.get(key(1)) is None
+    assert cache.stats()['misses'] == 1
+
+
+def test_disk_tier_is_shared_with_other_instances(tmp_path):
+    writer = ResultCache(disk_dir=str(tmp_path))
+    writer.put(key(1), {'label': 'milk'})
+    assert writer.flush(timeout=5)
+
+    reader = ResultCache(disk_dir=str(tmp_path))
+    assert reader.get(key(1)) == {'label': 'milk'}
+    assert reader.stats()['disk_hits'] == 1
+
+
+def write_entry(cache: ResultCache, n: int, age: float):
+    path = cache._disk_path(key(n))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(n, f)
+    stored_at = time.time() - age
+    os.utime(path, (stored_at, stored_at))
+    return path
+
+
+def test_sweep_removes_expired_then_oldest_entries(tmp_path):
+    cache = ResultCache(ttl_seconds=100, disk_dir=str(tmp_path), disk_max_entries=2)
+    expired = write_entry(cache, 1, age=200)
+    oldest = write_entry(cache, 2, age=50)
+    kept = [write_entry(cache, n, age=10 - n) for n in (3, 4)]
+
+    cache.sweep_disk()
+    assert not os.path.exists(expired) and not os.path.exists(oldest)
+    assert all(os.path.exists(path) for path in kept)
+    assert cache.stats()['disk_entries'] == 2
+
+
+def test_sweep_spares_temp_files_of_writes_in_progress(tmp_path):
+    cache = ResultCache(disk_dir=str(tmp_path), disk_max_entries=0)
+    writing = str(tmp_path / 'in-progress.tmp')
+    abandoned = str(tmp_path / 'abandoned.tmp')
+    for path in (writing, abandoned):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('{')
+    old = time.time() - TMP_GRACE_SECONDS - 10
+    os.utime(abandoned, (old, old))
+
+    cache.sweep_disk()
+    assert os.path.exists(writing)
+    assert not os.path.exists(abandoned)
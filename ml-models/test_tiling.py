@@ -0,0 +1,65 @@
+"""
+Tests for AIMS sliced inference (tiles and cross-tile box merging)
+Usage: python -m pytest test_tiling.py
+"""
+
+import pytest
+
+from tiling import cut_by_tile, merge_boxes, tile_grid
+
+
+def merge(boxes, iou_threshold=0.5):
+    """merge_boxes over (bbox, score, class, cut) tuples"""
+    bboxes, scores, classes, cut = zip(*boxes)
+    return merge_boxes(list(bboxes), list(scores), list(classes), list(cut), iou_threshold)
+
+
+@pytest.mark.parametrize('width, height', [(4000, 3000), (1000, 640), (641, 2000)])
+def test_tiles_cover_the_image_with_overlap(width, height):
+    tiles = tile_grid(width, height, 640, overlap=0.2)
+    assert {(x2 - x1, y2 - y1) for x1, y1, x2, y2 in tiles} == {(min(640, width), min(640, height))}
+    assert max(x2 for _, _, x2, _ in tiles) == width and max(y2 for _, _, _, y2 in tiles) == height
+    xs = sorted({x1 for x1, _, _, _ in tiles})
+    assert all(b - a <= 640 * 0.8 for a, b in zip(xs, xs[1:]))
+
+
+def test_small_image_is_one_tile():
+    assert tile_grid(500, 400, 640) == [(0, 0, 500, 400)]
+
+
+def test_cut_only_by_borders_inside_the_image():
+    tile = (0, 0, 640, 640)
+    assert not cut_by_tile([0, 0, 100, 100], tile, 640, 640)   # Image border
+    assert cut_by_tile([500, 100, 640, 200], tile, 1280, 640)   # Right border of an inner tile
+    assert not cut_by_tile([100, 100, 200, 200], tile, 1280, 640)
+
+
+def test_overlapping_duplicates_keep_the_most_confident():
+    kept = merge([([100, 100, 200, 200], 0.6, 0, False),
+                  ([102, 101, 201, 203], 0.9, 0, False),
+                  ([400, 400, 500, 500], 0.5, 0, False)])
+    assert kept == [1, 2]
+
+
+def test_different_classes_are_not_merged():
+    kept = merge([([100, 100, 200, 200], 0.9, 0, False),
+                  ([100, 100, 200, 200], 0.8, 1, False)])
+    assert kept == [0, 1]
+
+
+def test_fragment_of_a_whole_box_is_suppressed():
+    # The product seen whole in one tile, and its left half cut by the neighbouring tile
+    kept = merge([([600, 100, 640, 200], 0.95, 0, True),
+                  ([560, 100, 680, 200], 0.7, 0, False)])
+    assert kept == [1]
+
+
+def test_whole_box_inside_another_is_kept():
+    # Small product in front of a large one: not a fragment, low IoU
+    kept = merge([([100, 100, 400, 400], 0.9, 0, False),
+                  ([150, 150, 250, 250], 0.8, 0, False)])
+    assert kept == [0, 1]
+
+
+def test_no_boxes():
+    assert merge_boxes([], [], [], []) == []
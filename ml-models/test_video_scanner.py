@@ -0,0 +1,140 @@
+"""
+Tests for AIMS video scanning (frame-change skipping and product tracks)
+Usage: python -m pytest test_video_scanner.py
+"""
+
+import numpy as np
+import pytest
+
+from video_scanner import BoxTracker, FrameChangeDetector, VideoScanner, box_iou, shift_box
+
+FRAME_WIDTH, FRAME_HEIGHT = 320, 240
+PRODUCT = [600, 80, 680, 180]  # Box of one product on the shelf panorama
+
+
+@pytest.fixture(scope='module')
+def shelf():
+    """Textured shelf panorama the camera pans along"""
+    rng = np.random.default_rng(0)
+    small = rng.integers(0, 256, size=(30, 150, 3), dtype=np.uint8)
+    return np.kron(small, np.ones((8, 8, 1), dtype=np.uint8))  # 240 x 1200 blocks of texture
+
+
+def frame_at(shelf, x):
+    return shelf[:, x:x + FRAME_WIDTH].copy()
+
+
+def detect_product(offsets):
+    """Fake detector: the product's box in each frame (frames identified by pan offset)"""
+    calls = []
+
+    def detect_batch(frames):
+        calls.append(len(frames))
+        results = []
+        for frame in frames:
+            x = offsets[id(frame)]
+            bbox = [PRODUCT[0] - x, PRODUCT[1], PRODUCT[2] - x, PRODUCT[3]]
+            visible = shift_box(bbox, 0, 0, FRAME_WIDTH, FRAME_HEIGHT)
+            results.append([{'bbox': visible, 'confidence': 0.5 + x / 10000, 'class': 'bottle'}] if visible else [])
+        return results
+
+    return detect_batch, calls
+
+
+def test_box_iou():
+    assert box_iou([0, 0, 10, 10], [0, 0, 10, 10]) == 1.0
+    assert box_iou([0, 0, 10, 10], [5, 0, 15, 10]) == pytest.approx(1 / 3)
+    assert box_iou([0, 0, 10, 10], [20, 20, 30, 30]) == 0.0
+
+
+def test_shift_box_drops_boxes_mostly_out_of_frame():
+    assert shift_box([10, 10, 50, 50], 20, 0, 100, 100) == [30, 10, 70, 50]
+    assert shift_box([10, 10, 50, 50], -35, 0, 100, 100) is None
+
+
+def test_static_frames_are_unchanged(shelf):
+    detector = FrameChangeDetector()
+    reference = detector.thumbnail(frame_at(shelf, 0))
+    dx, dy, diff = detector.compare(reference, detector.thumbnail(frame_at(shelf, 0)))
+    assert not detector.changed(dx, dy, diff, reference.shape)
+
+
+def test_camera_motion_is_measured_and_compensated(shelf):
+    detector = FrameChangeDetector(max_shift_fraction=0.5)
+    reference = detector.thumbnail(frame_at(shelf, 0))
+    thumb = detector.thumbnail(frame_at(shelf, 40))
+    dx, dy, diff = detector.compare(reference, thumb)
+    # Panning right moves the content left by 40 px (8 thumbnail px at 64 / 320)
+    assert dx == pytest.approx(-8, abs=1) and abs(dy) < 1
+    assert diff < detector.diff_threshold
+    assert not detector.changed(dx, dy, diff, thumb.shape)
+
+
+def test_new_content_counts_as_a_change(shelf):
+    detector = FrameChangeDetector()
+    reference = detector.thumbnail(frame_at(shelf, 0))
+    thumb = detector.thumbnail(255 - frame_at(shelf, 0))
+    assert detector.changed(*detector.compare(reference, thumb), thumb.shape)
+
+
+def test_scan_detects_only_changed_frames(shelf):
+    offsets = {}
+    frames = []
+    for index in range(12):
+        frame = frame_at(shelf, 400)
+        offsets[id(frame)] = 400
+        frames.append((index, None, frame))
+    detect_batch, calls = detect_product(offsets)
+
+    result = VideoScanner(detect_batch, max_skip_frames=5).scan(frames)
+    # First frame, then at least every max_skip_frames
+    assert [frame['frame'] for frame in result['frames'] if frame['detected']] == [0, 6]
+    assert result['stats']['skipped_frames'] == 10
+    assert sum(calls) == 2
+    # Skipped frames reuse the boxes of the last detected frame
+    assert all(len(frame['boxes']) == 1 for frame in result['frames'])
+
+
+def test_pan_is_tracked_as_one_product(shelf):
+    offsets = {}
+    frames = []
+    for index, x in enumerate(range(300, 500, 20)):
+        frame = frame_at(shelf, x)
+        offsets[id(frame)] = x
+        frames.append((index, None, frame))
+    detect_batch, _ = detect_product(offsets)
+
+    result = VideoScanner(detect_batch, batch_size=4, max_shift_fraction=0.1).scan(frames)
+    assert 1 < result['stats']['detected_frames'] < len(frames)
+    assert len(result['tracks']) == 1
+    track = result['tracks'][0]
+    assert track['hits'] == sum(1 for frame in result['frames'] if frame['detected'] and frame['boxes'])
+    # Best sighting: the most confident detection (the fake's confidence grows along the pan)
+    last_seen = max(frame['frame'] for frame in result['frames'] if frame['detected'] and frame['boxes'])
+    assert track['confidence'] == 0.5 + (300 + 20 * last_seen) / 10000
+    # Carried boxes follow the camera motion between detections
+    for frame in result['frames']:
+        x = 300 + 20 * frame['frame']
+        for box in frame['boxes']:
+            assert abs(box['bbox'][0] - max(0, PRODUCT[0] - x)) <= 4
+
+
+def test_tracker_links_moved_boxes_and_starts_new_tracks():
+    tracker = BoxTracker(iou_threshold=0.3)
+    first = tracker.update(0, [{'bbox': [100, 100, 150, 200], 'confidence': 0.6}], 0, 0, 640, 480)
+    # The camera moved 30 px: the box moved left by 30 px, a new product appeared
+    second = tracker.update(5, [{'bbox': [70, 100, 120, 200], 'confidence': 0.9},
+                                {'bbox': [400, 100, 450, 200], 'confidence': 0.7}], -30, 0, 640, 480)
+    assert second[0] == first[0]
+    assert second[1] != first[0]
+    track = tracker.tracks[first[0]]
+    assert track['hits'] == 2 and track['first_frame'] == 0 and track['last_frame'] == 5
+    assert track['best']['confidence'] == 0.9
+
+
+def test_tracker_keeps_the_sighting_with_text():
+    tracker = BoxTracker()
+    tracker.update(0, [{'bbox': [0, 0, 50, 50], 'confidence': 0.9}], 0, 0, 100, 100)
+    track_id, = tracker.update(1, [{'bbox': [0, 0, 50, 50], 'confidence': 0.5, 'detected_text': 'MILK'}],
+                               0, 0, 100, 100)
+    assert tracker.tracks[track_id]['best']['detected_text'] == 'MILK'
@@ -0,0 +1,97 @@
+"""
+AIMS Tiling
+Sliced inference for high-resolution images (shelf panoramas): overlapping
+tiles small products stay visible in, and the merge of the boxes found in
+them back into one set in image coordinates
+"""
+
+import math
+from typing import List, Tuple
+
+import numpy as np
+
+# Pixels from a tile border within which a box counts as cut by it
+EDGE_MARGIN = 2
+
+
+def _starts(length: int, tile_size: int, overlap: float) -> List[int]:
+    """Evenly spaced tile offsets along one side (first at 0, last flush with the end)"""
+    if length <= tile_size:
+        return [0]
+    stride = max(1, int(tile_size * (1.0 - overlap)))
+    count = math.ceil((length - tile_size) / stride) + 1
+    return [int(round(i * (length - tile_size) / (count - 1))) for i in range(count)]
+
+
+def tile_grid(width: int, height: int, tile_size: int, overlap: float = 0.2) -> List[Tuple[int, int, int, int]]:
+    """
+    Tiles covering an image, overlapping by at least the given fraction
+
+    All tiles have the same size (tile_size, or the image side if it is
+    smaller), so they batch well.
+
+    Args:
+        width: Image width
+        height: Image height
+        tile_size: Tile side in pixels
+        overlap: Minimum overlap of neighbouring tiles (fraction of tile_size)
+
+    Returns:
+        List of (x1, y1, x2, y2) tiles, row by row
+    """
+    tile_width, tile_height = min(tile_size, width), min(tile_size, height)
+    return [(x, y, x + tile_width, y + tile_height)
+            for y in _starts(height, tile_size, overlap)
+            for x in _starts(width, tile_size, overlap)]
+
+
+def cut_by_tile(bbox: List[int], tile: Tuple[int, int, int, int], width: int, height: int) -> bool:
+    """Whether a box (image coordinates) touches a border of its tile that lies inside the image"""
+    x1, y1, x2, y2 = bbox
+    tile_x1, tile_y1, tile_x2, tile_y2 = tile
+    return ((tile_x1 > 0 and x1 <= tile_x1 + EDGE_MARGIN) or
+            (tile_y1 > 0 and y1 <= tile_y1 + EDGE_MARGIN) or
+            (tile_x2 < width and x2 >= tile_x2 - EDGE_MARGIN) or
+            (tile_y2 < height and y2 >= tile_y2 - EDGE_MARGIN))
+
+
+def merge_boxes(bboxes: np.ndarray, scores: np.ndarray, classes: np.ndarray, cut: np.ndarray,
+                iou_threshold: float = 0.5) -> List[int]:
+    """
+    Cross-tile NMS: the same product seen in several tiles is kept once
+
+    Boxes are kept by confidence, whole boxes before boxes cut by a tile
+    border. A kept box suppresses boxes of its class overlapping it by
+    more than iou_threshold (IoU), and cut boxes mostly inside it
+    (intersection over the cut box's area) - the fragments of a product
+    found whole in a neighbouring tile.
+
+    Args:
+        bboxes: (N, 4) boxes in image coordinates
+        scores: (N,) confidences
+        classes: (N,) class IDs
+        cut: (N,) whether each box was cut by its tile's border
+        iou_threshold: Overlap above which boxes are duplicates
+
+    Returns:
+        Indices of the kept boxes, best first
+    """
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    classes, cut = np.asarray(classes), np.asarray(cut, dtype=bool)
+    areas = np.maximum(0.0, bboxes[:, 2] - bboxes[:, 0]) * np.maximum(0.0, bboxes[:, 3] - bboxes[:, 1])
+    order = np.lexsort((-np.asarray(scores), cut))
+
+    kept = []
+    suppressed = np.zeros(len(bboxes), dtype=bool)
+    for i in order:
+        if suppressed[i]:
+            continue
+        kept.append(int(i))
+        others = np.flatnonzero(~suppressed & (classes == classes[i]))
+        width = np.minimum(bboxes[others, 2], bboxes[i, 2]) - np.maximum(bboxes[others, 0], bboxes[i, 0])
+        height = np.minimum(bboxes[others, 3], bboxes[i, 3]) - np.maximum(bboxes[others, 1], bboxes[i, 1])
+        intersection = np.maximum(0.0, width) * np.maximum(0.0, height)
+        iou = intersection / np.maximum(areas[others] + areas[i] - intersection, 1e-9)
+        inside = intersection / np.maximum(areas[others], 1e-9)
+        suppressed[others[(iou > iou_threshold) | (cut[others] & (inside > iou_threshold))]] = True
+    return kept
@@ -229,6 +229,7 @@ def train_grocery_classification(
     print(f"   1. Update detection_api.py to use classification mode")
     print(f"   2. Model path: weights/grocery_classifier_best.pt")
     print(f"   3. This model classifies entire images (no bounding boxes)")
+    print(f"   4. Optional: python quantize_classifier.py (INT8, faster on CPU)")
     
     return str(final_model)
 
@@ -0,0 +1,225 @@
+"""
+AIMS Upload Store
+Content-addressed, sharded storage for uploaded and annotated images,
+kept within a size/age budget by a background evictor
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Dict, Optional
+
+# <optional prefix><sha256>.<ext>, e.g. annotated_3fa2...c9.jpg
+STORED_NAME = re.compile(r'^(?P<prefix>[a-z]+_)?(?P<digest>[0-9a-f]{64})\.(?P<ext>[a-z0-9]{1,5})$')
+
+
+class UploadStore:
+    def __init__(self, root: str, max_bytes=2 * 1024 ** 3, max_age_seconds=3 * 24 * 3600,
+                 evict_interval=300, writer_workers=2):
+        """
+        Initialize the store
+
+        Args:
+            root: Base directory (e.g. UPLOAD_FOLDER)
+            max_bytes: Total size budget; oldest files are evicted beyond it
+            max_age_seconds: Files not written/read for this long are evicted
+            evict_interval: Seconds between evictor passes
+            writer_workers: Background writer threads
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age_seconds
+        self.evict_interval = evict_interval
+
+        os.makedirs(root, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=writer_workers, thread_name_prefix='upload-writer')
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._evictor = None
+        self._evictor_pid = None
+
+        # Stats
+        self.writes = 0
+        self.deduplicated = 0
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+        self.total_bytes = 0
+        self.total_files = 0
+        self.last_eviction = None
+
+    @staticmethod
+    def name_for(data: bytes, ext: str, prefix: str = '') -> str:
+        """Content-addressed file name: identical bytes always get the same name"""
+        return f"{prefix}{hashlib.sha256(data).hexdigest()}.{ext.lstrip('.').lower()}"
+
+    def path_for(self, name: str) -> Optional[str]:
+        """
+        Resolve a stored name to its sharded path (ab/cd/<name>)
+
+        Returns:
+            Path, or None if name isn't a valid stored name
+        """
+        match = STORED_NAME.match(name)
+        if match is None:
+            return None
+        digest = match.group('digest')
+        return os.path.join(self.root, digest[:2], digest[2:4], name)
+
+    def put_async(self, data: bytes, ext: str, prefix: str = '', name: str = None) -> str:
+        """
+        Store bytes in the background (stored once however often they are uploaded)
+
+        Args:
+            data: File contents
+            ext: File extension
+            prefix: Name prefix (e.g. 'annotated_')
+            name: Store under this name instead of the content hash (for
+                derived files addressed by the hash of their inputs)
+
+        Returns:
+            Stored name, servable immediately via locate()
+        """
+        self._ensure_evictor()
+        if name is None:
+            name = self.name_for(data, ext, prefix)
+        elif self.path_for(name) is None:
+            raise ValueError(f"Not a valid stored name: {name}")
+        with self._lock:
+            if name in self._pending:
+                self.deduplicated += 1
+            else:
+                future = self._executor.submit(self._write, self.path_for(name), data)
+                self._pending[name] = future
+                future.add_done_callback(lambda _: self._forget(name, future))
+        return name
+
+    def wait(self, name: str, timeout: float = 5.0):
+        """Block until a pending write of name (if any) has finished (errors are logged, not raised)"""
+        with self._lock:
+            future = self._pending.get(name)
+        if future is not None:
+            wait([future], timeout=timeout)
+
+    def locate(self, name: str) -> Optional[str]:
+        """
+        Find a stored file, waiting for a pending write of it
+
+        Returns:
+            Path of the file, or None if it doesn't exist (or was evicted)
+        """
+        path = self.path_for(name)
+        if path is None:
+            return None
+        self.wait(name)
+        if not os.path.exists(path):
+            return None
+        try:
+            os.utime(path)  # Recently served files are evicted last
+        except OSError:
+            pass
+        return path
+
+    def _forget(self, name: str, future: Future):
+        with self._lock:
+            if self._pending.get(name) is future:
+                del self._pending[name]
+        if future.exception() is not None:
+            print(f"⚠️  Failed to save {name}: {future.exception()}")
+
+    def _write(self, path: str, data: bytes) -> str:
+        if os.path.exists(path):
+            # Duplicate content: keep the existing copy, just refresh its age
+            os.utime(path)
+            with self._lock:
+                self.deduplicated += 1
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.writes += 1
+            self.total_bytes += len(data)
+            self.total_files += 1
+        return path
+
+    def _ensure_evictor(self):
+        """Start the evictor thread (again after a fork, threads don't survive it)"""
+        if self._evictor is not None and self._evictor.is_alive() and self._evictor_pid == os.getpid():
+            return
+        with self._lock:
+            if self._evictor is not None and self._evictor.is_alive() and self._evictor_pid == os.getpid():
+                return
+            self._evictor_pid = os.getpid()
+            self._evictor = threading.Thread(target=self._evict_loop, name='upload-evictor', daemon=True)
+            self._evictor.start()
+
+    def _evict_loop(self):
+        while True:
+            try:
+                self.evict()
+            except Exception as e:
+                print(f"⚠️  Upload eviction failed: {e}")
+            time.sleep(self.evict_interval)
+
+    def evict(self):
+        """
+        Delete files older than max_age, then the oldest files until the
+        store is within max_bytes
+        """
+        now = time.time()
+        files = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        evicted_files = evicted_bytes = 0
+
+        for mtime, size, path in files:
+            if now - mtime <= self.max_age and total <= self.max_bytes:
+                break
+            with self._lock:
+                if os.path.basename(path) in self._pending:
+                    continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted_files += 1
+            evicted_bytes += size
+
+        with self._lock:
+            self.total_bytes = total
+            self.total_files = len(files) - evicted_files
+            self.evicted_files += evicted_files
+            self.evicted_bytes += evicted_bytes
+            self.last_eviction = now
+        if evicted_files:
+            print(f"🧹 Evicted {evicted_files} uploads ({evicted_bytes / (1024 * 1024):.1f} MB)")
+
+    def stats(self) -> Dict:
+        """Current usage and eviction counters"""
+        with self._lock:
+            return {
+                'files': self.total_files,
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'max_age_seconds': self.max_age,
+                'writes': self.writes,
+                'deduplicated': self.deduplicated,
+                'evicted_files': self.evicted_files,
+                'evicted_bytes': self.evicted_bytes,
+                'pending_writes': len(self._pending)
+            }
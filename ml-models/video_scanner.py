@@ -0,0 +1,343 @@
+"""
+AIMS Video Scanner
+Scans shelf-walk videos (or frame sequences) with the product detector,
+running it only on frames whose content changed meaningfully; detections
+are carried forward across unchanged frames and linked into tracks
+"""
+
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from image_io import decode_image
+
+
+def iter_video_frames(path: str, stride: int = 1) -> Iterator[Tuple[int, Optional[float], np.ndarray]]:
+    """
+    Read frames from a video file
+
+    Args:
+        path: Video file path
+        stride: Only decode every stride-th frame (the others are just grabbed)
+
+    Yields:
+        (frame index, timestamp in ms, BGR frame)
+    """
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError("Could not open video")
+    try:
+        index = 0
+        while capture.grab():
+            if index % stride == 0:
+                ok, frame = capture.retrieve()
+                if not ok:
+                    break
+                yield index, capture.get(cv2.CAP_PROP_POS_MSEC), frame
+            index += 1
+    finally:
+        capture.release()
+
+
+def iter_encoded_frames(frames: Iterable[bytes]) -> Iterator[Tuple[int, Optional[float], np.ndarray]]:
+    """
+    Decode a sequence of encoded images (JPEG/PNG...) one at a time
+
+    Yields:
+        (frame index, None, BGR frame)
+    """
+    for index, data in enumerate(frames):
+        yield index, None, decode_image(data)
+
+
+def box_iou(a: List[int], b: List[int]) -> float:
+    """Intersection over union of two [x1, y1, x2, y2] boxes"""
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    intersection = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    if intersection == 0:
+        return 0.0
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def shift_box(bbox: List[int], dx: float, dy: float, width: int, height: int) -> Optional[List[int]]:
+    """
+    Move a box by (dx, dy) and clip it to the frame
+
+    Returns:
+        Shifted box, or None if less than half of it is still in the frame
+    """
+    x1, y1, x2, y2 = bbox[0] + dx, bbox[1] + dy, bbox[2] + dx, bbox[3] + dy
+    area = (x2 - x1) * (y2 - y1)
+    cx1, cy1, cx2, cy2 = max(0, x1), max(0, y1), min(width, x2), min(height, y2)
+    if cx2 <= cx1 or cy2 <= cy1 or (cx2 - cx1) * (cy2 - cy1) < 0.5 * area:
+        return None
+    return [int(round(cx1)), int(round(cy1)), int(round(cx2)), int(round(cy2))]
+
+
+class FrameChangeDetector:
+    def __init__(self, diff_threshold=8.0, max_shift_fraction=0.2, thumb_width=64):
+        """
+        Decide cheaply whether a frame differs from the last detected frame
+
+        Frames are compared as small grayscale thumbnails. Camera motion
+        (the robot driving along the aisle) is estimated by phase correlation
+        and compensated before differencing, so a pan only counts as a change
+        once enough new shelf has scrolled into view.
+
+        Args:
+            diff_threshold: Mean absolute gray level difference (0-255) of the
+                aligned thumbnails above which the frame is re-detected
+            max_shift_fraction: Re-detect once the camera moved by this
+                fraction of the frame width/height
+            thumb_width: Thumbnail width in pixels
+        """
+        self.diff_threshold = diff_threshold
+        self.max_shift_fraction = max_shift_fraction
+        self.thumb_width = thumb_width
+        self._window = None
+
+    def thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        """Downsampled, blurred grayscale float32 copy of a BGR frame"""
+        height, width = frame.shape[:2]
+        thumb_height = max(8, int(round(height * self.thumb_width / width)))
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        thumb = cv2.resize(gray, (self.thumb_width, thumb_height), interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(thumb, (3, 3), 0).astype(np.float32)
+
+    def compare(self, reference: np.ndarray, thumb: np.ndarray) -> Tuple[float, float, float]:
+        """
+        Compare a thumbnail with the reference (last detected) thumbnail
+
+        Returns:
+            (dx, dy, diff): motion of the content in thumbnail pixels and the
+            mean absolute difference of the overlapping, aligned region
+        """
+        height, width = thumb.shape
+        if self._window is None or self._window.shape != thumb.shape:
+            self._window = cv2.createHanningWindow((width, height), cv2.CV_32F)
+        # Copies: some OpenCV versions apply the window to the inputs in place
+        (dx, dy), response = cv2.phaseCorrelate(reference.copy(), thumb.copy(), self._window)
+        if response < 0.1:
+            dx = dy = 0.0  # No clear peak: treat as static, differencing decides
+
+        sx, sy = int(round(dx)), int(round(dy))
+        if abs(sx) >= width or abs(sy) >= height:
+            return dx, dy, 255.0
+        # thumb[y, x] ~ reference[y - sy, x - sx] on the overlap
+        current = thumb[max(0, sy):height + min(0, sy), max(0, sx):width + min(0, sx)]
+        previous = reference[max(0, -sy):height + min(0, -sy), max(0, -sx):width + min(0, -sx)]
+        return dx, dy, float(np.mean(np.abs(current - previous)))
+
+    def changed(self, dx: float, dy: float, diff: float, thumb_shape: Tuple[int, int]) -> bool:
+        """Whether a comparison result calls for running detection again"""
+        height, width = thumb_shape
+        moved = max(abs(dx) / width, abs(dy) / height)
+        return diff > self.diff_threshold or moved > self.max_shift_fraction
+
+
+class BoxTracker:
+    def __init__(self, iou_threshold=0.3):
+        """
+        Greedy IoU tracker linking detections of consecutive detected frames
+
+        Args:
+            iou_threshold: Min IoU between a (motion-compensated) track box
+                and a detection to continue the track
+        """
+        self.iou_threshold = iou_threshold
+        self.tracks: Dict[int, Dict] = {}
+        self._active: Dict[int, List[int]] = {}  # track id -> last box
+        self._next_id = 1
+
+    def update(self, frame_index: int, detections: List[Dict], dx: float, dy: float,
+               width: int, height: int) -> List[int]:
+        """
+        Assign track IDs to the detections of a detected frame
+
+        Args:
+            frame_index: Index of the frame
+            detections: Detections of the frame
+            dx, dy: Camera motion since the previous detected frame (pixels)
+            width, height: Frame size
+
+        Returns:
+            Track ID per detection
+        """
+        predicted = {}
+        for track_id, bbox in self._active.items():
+            moved = shift_box(bbox, dx, dy, width, height)
+            if moved is not None:
+                predicted[track_id] = moved
+
+        candidates = sorted(
+            ((box_iou(bbox, detection['bbox']), track_id, d)
+             for track_id, bbox in predicted.items()
+             for d, detection in enumerate(detections)),
+            reverse=True)
+        assigned: Dict[int, int] = {}
+        used_tracks = set()
+        for iou, track_id, d in candidates:
+            if iou < self.iou_threshold:
+                break
+            if d in assigned or track_id in used_tracks:
+                continue
+            assigned[d] = track_id
+            used_tracks.add(track_id)
+
+        track_ids = []
+        active = {}
+        for d, detection in enumerate(detections):
+            track_id = assigned.get(d)
+            if track_id is None:
+                track_id = self._next_id
+                self._next_id += 1
+                self.tracks[track_id] = {'track_id': track_id, 'first_frame': frame_index, 'hits': 0, 'best': None}
+            track = self.tracks[track_id]
+            track['last_frame'] = frame_index
+            track['hits'] += 1
+            # Keep the most confident sighting (and any text read on it)
+            best = track['best']
+            if best is None or detection['confidence'] > best['confidence'] or \
+                    (not best.get('detected_text') and detection.get('detected_text')):
+                track['best'] = detection
+            active[track_id] = detection['bbox']
+            track_ids.append(track_id)
+
+        self._active = active
+        return track_ids
+
+
+class VideoScanner:
+    def __init__(self, detect_batch: Callable[[List[np.ndarray]], List[List[Dict]]],
+                 batch_size=8, diff_threshold=8.0, max_shift_fraction=0.2,
+                 max_skip_frames=30, iou_threshold=0.3):
+        """
+        Initialize the scanner
+
+        Args:
+            detect_batch: Batched detection, e.g. ProductDetector.detect_products_batch
+            batch_size: Changed frames per detection call
+            diff_threshold: See FrameChangeDetector
+            max_shift_fraction: See FrameChangeDetector
+            max_skip_frames: Re-detect at least every this many frames
+            iou_threshold: See BoxTracker
+        """
+        self.detect_batch = detect_batch
+        self.batch_size = max(1, batch_size)
+        self.max_skip_frames = max_skip_frames
+        self.change_detector = FrameChangeDetector(diff_threshold=diff_threshold,
+                                                   max_shift_fraction=max_shift_fraction)
+        self.iou_threshold = iou_threshold
+
+    def scan(self, frames: Iterable[Tuple[int, Optional[float], np.ndarray]],
+             detect_batch: Callable[[List[np.ndarray]], List[List[Dict]]] = None) -> Dict:
+        """
+        Scan frames, detecting only on changed ones
+
+        Args:
+            frames: (frame index, timestamp in ms or None, BGR frame) in order,
+                e.g. from iter_video_frames() or iter_encoded_frames()
+            detect_batch: Use this instead of the scanner's detection function
+                (e.g. to pin one model instance for the whole video)
+
+        Returns:
+            Dict with per-frame boxes ('frames'), one entry per tracked
+            product ('tracks', best sighting each) and 'stats'
+        """
+        keyframes: List[Dict] = []   # Detected frames: index, shape, motion since previous keyframe
+        entries: List[Dict] = []     # Every frame: its keyframe and motion since it
+        pending: List[Tuple[int, np.ndarray]] = []
+
+        detect_batch = detect_batch or self.detect_batch
+
+        def flush():
+            results = detect_batch([image for _, image in pending])
+            for (key, _), detections in zip(pending, results):
+                keyframes[key]['detections'] = detections
+            pending.clear()
+
+        reference = None
+        skipped = 0
+        for frame_index, timestamp, frame in frames:
+            height, width = frame.shape[:2]
+            thumb = self.change_detector.thumbnail(frame)
+            scale = width / thumb.shape[1]
+
+            if reference is None or reference.shape != thumb.shape:
+                dx = dy = 0.0
+                detect = True
+            else:
+                dx, dy, diff = self.change_detector.compare(reference, thumb)
+                detect = self.change_detector.changed(dx, dy, diff, thumb.shape) or skipped >= self.max_skip_frames
+
+            if detect:
+                keyframes.append({
+                    'frame': frame_index,
+                    'width': width,
+                    'height': height,
+                    'motion': (dx * scale, dy * scale),
+                    'detections': None
+                })
+                pending.append((len(keyframes) - 1, frame))
+                if len(pending) >= self.batch_size:
+                    flush()
+                reference = thumb
+                skipped = 0
+                entries.append({'frame': frame_index, 'timestamp_ms': timestamp,
+                                'key': len(keyframes) - 1, 'motion': (0.0, 0.0)})
+            else:
+                skipped += 1
+                entries.append({'frame': frame_index, 'timestamp_ms': timestamp,
+                                'key': len(keyframes) - 1, 'motion': (dx * scale, dy * scale)})
+        if pending:
+            flush()
+
+        # Link detections of consecutive keyframes into tracks
+        tracker = BoxTracker(iou_threshold=self.iou_threshold)
+        for keyframe in keyframes:
+            dx, dy = keyframe['motion']
+            keyframe['track_ids'] = tracker.update(keyframe['frame'], keyframe['detections'], dx, dy,
+                                                   keyframe['width'], keyframe['height'])
+
+        # Per-frame boxes: detected on keyframes, carried (motion-compensated) elsewhere
+        frame_results = []
+        for entry in entries:
+            keyframe = keyframes[entry['key']]
+            dx, dy = entry['motion']
+            boxes = []
+            for track_id, detection in zip(keyframe['track_ids'], keyframe['detections']):
+                bbox = shift_box(detection['bbox'], dx, dy, keyframe['width'], keyframe['height'])
+                if bbox is not None:
+                    boxes.append({'track_id': track_id, 'bbox': bbox, 'confidence': detection['confidence']})
+            frame_results.append({
+                'frame': entry['frame'],
+                'timestamp_ms': entry['timestamp_ms'],
+                'detected': entry['frame'] == keyframe['frame'],
+                'boxes': boxes
+            })
+
+        tracks = []
+        for track in tracker.tracks.values():
+            tracks.append({
+                **track['best'],
+                'id': track['track_id'],
+                'track_id': track['track_id'],
+                'first_frame': track['first_frame'],
+                'last_frame': track['last_frame'],
+                'hits': track['hits']
+            })
+
+        return {
+            'frames': frame_results,
+            'tracks': tracks,
+            'stats': {
+                'frames': len(entries),
+                'detected_frames': len(keyframes),
+                'skipped_frames': len(entries) - len(keyframes),
+                'detection_ratio': round(len(keyframes) / len(entries), 4) if entries else 0.0,
+                'tracks': len(tracks)
+            }
+        }